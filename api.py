@@ -1,37 +1,353 @@
 # api.py
-from flask import Flask, request, jsonify
+import argparse
+import cProfile
+import logging
+import time
+from flask import Blueprint, Flask, Response, g, has_request_context, request, jsonify
 from flask_cors import CORS
+import numpy as np
 import pandas as pd
 import os
 from src.model.predictor import (
-    cargar_modelo, cargar_dataset,
-    preparar_grid, predecir_riesgo,
-    filtrar_por_zona, diagnosticar_prediccion
+    cargar_modelo, cargar_dataset, cargar_recursos_diagnostico,
+    construir_indice_grid, construir_indice_celdas, vincular_historial, predecir_nacional_lote,
+    prediccion_zona, prediccion_limites, normalizar_riesgo,
+    construir_indice_diagnostico, diagnosticar_prediccion, diagnosticar_lote
 )
+from src.model.inferencia import MotorInferencia
 from src.model.zonas import ZONAS
-
-app = Flask(__name__)
-CORS(app) 
+from src.servicio.cache_predicciones import CachePredicciones
+from src.servicio.teselas_riesgo import ZOOM_LIMITE, PiramideTeselas, puntos_json, tesela_valida
+from src.servicio.precalculo import AlmacenPronosticos, PlanificadorPronosticos
+from src.servicio.formato_binario import TIPO_BINARIO, codificar_heatmap, comprimir
+from src.datos.grid import decodificar_celda
+from src.datos.manifiesto import huella_archivo
+from src.datos.historial import ARCHIVO_META, cargar_historial, existe_historial
+from src.servicio.metricas import Metricas
+from src.servicio.recarga import Recargador
+from src.datos.registro import activar_version, ruta_registro, rutas_version, version_activa, versiones
 
 # rutas de archivos
 ruta_dataset = os.path.join("data","processed","dataset_entrenamiento_final.csv")
 ruta_modelo = os.path.join("model","modelo_riesgo_delictivo.pkl")
 ruta_dbscan = os.path.join("model", "modelo_dbscan_detenciones.joblib")
 ruta_perfiles = os.path.join("model", "perfiles_clusters_detenciones.joblib")
+ruta_diagnostico = os.path.join("model", "diagnostico_detenciones")
+ruta_teselas = os.path.join("data", "teselas")
+ruta_historial = os.path.join("data", "processed", "historial")
+ruta_pronosticos = os.path.join("data", "pronosticos")
+
+# configuración de la cache de predicciones
+capacidad_cache = int(os.environ.get("CACHE_PREDICCIONES_CAPACIDAD", 64))
+dias_calentamiento = int(os.environ.get("CACHE_PREDICCIONES_CALENTAR", 0))
+
+# precálculo en segundo plano de los próximos días (0 = desactivado)
+dias_precalculo = int(os.environ.get("PRECALCULO_DIAS", 7))
+intervalo_precalculo = float(os.environ.get("PRECALCULO_INTERVALO", 3600))
+
+# segundos entre revisiones del registro de modelos (recarga en caliente)
+intervalo_registro = float(os.environ.get("REGISTRO_INTERVALO", 30))
+# token del endpoint de administración (sin token, el endpoint queda deshabilitado)
+token_admin = os.environ.get("API_ADMIN_TOKEN")
+
+# hilos de XGBoost por inferencia (0 = valor por defecto de XGBoost)
+hilos_inferencia = int(os.environ.get("INFERENCIA_HILOS", 0))
+
+# máximo de días por petición en /api/predecir/lote
+MAX_DIAS_LOTE = 31
+# máximo de puntos por petición en /api/diagnosticar/lote
+MAX_PUNTOS_LOTE = 1000
+
+# perfilado con cProfile de peticiones con la cabecera X-Perfilar (solo si se habilita)
+perfilado_habilitado = os.environ.get("API_PERFILAR", "0") == "1"
+ruta_perfiles_cprofile = os.environ.get("API_PERFILES_DIR", "perfiles")
+
+api = Blueprint("api", __name__)
+logger = logging.getLogger("api")
+metricas = Metricas()
+
+# Recursos de solo lectura compartidos por todas las peticiones (ver cargar_paquete).
+# Se reemplazan de una sola vez al recargar: cada petición usa el paquete que tomó al empezar
+recursos = None
+recargador = None
+hilos_iniciados = False
+
+
+class Recursos:
+    """Paquete de recursos de una versión: modelo, grid, caches y diagnóstico."""
+
+    def __init__(self, version):
+        self.version = version
+        self.modelo = None
+        self.indice_grid = None
+        self.cache_predicciones = None
+        self.teselas_riesgo = None
+        self.planificador = None
+        self.perfiles_clusters = None
+        self.indice_diagnostico = None
+
+    def inferir(self, funcion, fechas):
+        # Solo los fallos de la cache llegan al modelo: se miden como etapa aparte
+        with etapa("inferencia"):
+            return funcion(self.modelo, self.indice_grid, fechas)
+
+    def calcular_prediccion(self, fecha_dt):
+        return self.calcular_predicciones_lote([fecha_dt])[0]
+
+    def calcular_predicciones_lote(self, fechas):
+        """Vectores nacionales de las fechas: del almacén si están precalculados, si no se infieren."""
+        vectores = [self.planificador.obtener(fecha_dt) for fecha_dt in fechas]
+        faltantes = [i for i, vector in enumerate(vectores) if vector is None]
+        if faltantes:
+            matriz = self.inferir(predecir_nacional_lote, [fechas[i] for i in faltantes])
+            for i, fila in zip(faltantes, matriz):
+                vectores[i] = fila
+        return np.stack(vectores)
+
+
+def rutas_paquete(version):
+    """
+    Rutas de los artefactos de una versión del registro; con version=None,
+    los archivos sueltos de model/ y el dataset (instalaciones sin registro).
+    """
+    if version is not None:
+        return rutas_version(ruta_registro, version)
+    return {
+        "modelo": ruta_modelo, "dataset": ruta_dataset, "diagnostico": ruta_diagnostico,
+        "dbscan": ruta_dbscan, "perfiles": ruta_perfiles,
+    }
+
+
+def cargar_paquete(version=None):
+    """
+    Carga el modelo, el índice del grid y los recursos de diagnóstico de una versión.
+
+    No toca el paquete activo: la recarga en caliente lo arma completo (con las
+    caches calientes) y luego lo publica con activar_paquete. En el modo `serve`
+    el paquete inicial se carga antes de crear los workers, que lo heredan por
+    copy-on-write en lugar de cargar cada uno su copia.
+    """
+    rutas = rutas_paquete(version)
+    r = Recursos(version or "local")
+
+    # Cargar modelo y grid
+    logger.info("Cargando modelo (versión %s)...", r.version)
+    # El Booster se usa directamente (inplace_predict) en lugar del envoltorio de sklearn
+    r.modelo = MotorInferencia(cargar_modelo(rutas["modelo"]), nthread=hilos_inferencia)
+
+    logger.info("Construyendo índice del grid...")
+    if "celdas" in rutas:
+        # Las versiones del registro traen las celdas del grid: no hace falta leer el dataset
+        r.indice_grid = construir_indice_celdas(np.load(rutas["celdas"], allow_pickle=False), ZONAS)
+    else:
+        # El dataset solo se usa para obtener las celdas del grid: se indexa una vez
+        # y se libera, en lugar de recorrerlo completo en cada petición
+        r.indice_grid = construir_indice_grid(
+            cargar_dataset(rutas["dataset"], columnas=["lat_grid", "lon_grid"]), ZONAS
+        )
+    logger.info("Celdas únicas en el grid: %d", len(r.indice_grid['lat']))
+
+    # Versión de los recursos derivados (teselas, pronósticos en disco) del modelo actual
+    version_recursos = huella_archivo(rutas["modelo"])["sha256"][:12]
+    # Historial celda × día (mapeado en memoria) para las features de rezago del modelo
+    if existe_historial(ruta_historial):
+        vincular_historial(r.indice_grid, cargar_historial(ruta_historial))
+        # Las predicciones cambian con el historial: lo guardado de otra versión no sirve
+        version_recursos += "-" + huella_archivo(os.path.join(ruta_historial, ARCHIVO_META))["sha256"][:8]
+        logger.info("Historial cargado: %d días", r.indice_grid["historial"]["dias"])
+
+    # Pronósticos de los próximos días, precalculados en segundo plano y guardados en disco
+    r.planificador = PlanificadorPronosticos(
+        lambda fechas: r.inferir(predecir_nacional_lote, fechas),
+        AlmacenPronosticos(ruta_pronosticos, version_recursos),
+        dias=dias_precalculo, intervalo=intervalo_precalculo
+    )
+
+    # Predicciones nacionales por fecha, reutilizadas entre peticiones
+    r.cache_predicciones = CachePredicciones(
+        r.calcular_prediccion,
+        capacidad=capacidad_cache,
+        calcular_lote=r.calcular_predicciones_lote
+    )
+
+    # Teselas del heatmap nacional; el hash del modelo separa las de cada versión
+    r.teselas_riesgo = PiramideTeselas(
+        ruta_teselas, r.indice_grid, r.cache_predicciones.obtener,
+        version=version_recursos, ventana=r.planificador.ventana
+    )
+
+    # Cargar junto con el modelo de riesgo
+    logger.info("Cargando recursos de diagnóstico...")
+    diagnostico = cargar_recursos_diagnostico(
+        rutas["diagnostico"], rutas.get("dbscan"), rutas.get("perfiles")
+    )
+    r.perfiles_clusters = diagnostico["perfiles"]
+
+    # BallTree sobre los puntos core: cada diagnóstico consulta solo el radio eps
+    r.indice_diagnostico = construir_indice_diagnostico(diagnostico)
+    return r
 
-# Cargar modelo y dataset al iniciar
-print("🔄 Cargando modelo y dataset...")
-modelo = cargar_modelo(ruta_modelo)
-df = cargar_dataset(ruta_dataset)
 
-# Cargar junto con el modelo de riesgo
-print("🔄 Cargando recursos de diagnóstico...")
-modelo_dbscan = cargar_modelo(ruta_dbscan)
-perfiles_clusters = cargar_modelo(ruta_perfiles)
+def calentar_paquete(r):
+    """Deja en cache las fechas más pedidas antes de que el paquete atienda peticiones."""
+    if dias_calentamiento > 0:
+        logger.info("Precalculando predicciones de los próximos %d días...", dias_calentamiento)
+        r.cache_predicciones.calentar(pd.Timestamp.today(), dias_calentamiento)
 
-print(" Sistema listo")
 
-@app.route('/api/predecir', methods=['POST'])
+def activar_paquete(r):
+    """Publica un paquete ya cargado; el anterior sigue vivo mientras lo usen peticiones en curso."""
+    global recursos
+    anterior = recursos
+    recursos = r
+    if anterior is not None:
+        # Libera el bloqueo del almacén anterior; el planificador del paquete nuevo
+        # lo arranca el primer worker que tome el bloqueo de la versión nueva
+        anterior.planificador.detener()
+    if hilos_iniciados:
+        iniciar_planificador()
+
+
+def cargar_recursos():
+    """Carga el paquete inicial (la versión activa del registro, o model/) una sola vez."""
+    global recargador
+    if recursos is not None:
+        return
+
+    r = cargar_paquete(version_activa(ruta_registro))
+    calentar_paquete(r)
+    activar_paquete(r)
+
+    def cargar_y_calentar(version):
+        nuevo = cargar_paquete(version)
+        calentar_paquete(nuevo)
+        return nuevo
+
+    recargador = Recargador(
+        cargar_y_calentar, activar_paquete,
+        version_deseada=lambda: version_activa(ruta_registro),
+        version_actual=lambda: recursos.version,
+        intervalo=intervalo_registro
+    )
+    logger.info("Sistema listo")
+
+def iniciar_planificador():
+    # En modo serve se llama en cada worker tras el fork (los hilos no sobreviven al fork)
+    if recursos.planificador.iniciar():
+        logger.info("Planificador de pronósticos activo en el proceso %d", os.getpid())
+
+def iniciar_hilos():
+    # Hilos de fondo del proceso: precálculo de pronósticos y vigilancia del registro
+    global hilos_iniciados
+    hilos_iniciados = True
+    iniciar_planificador()
+    recargador.vigilar()
+
+def etapa(nombre):
+    """Mide una etapa en las métricas globales y, si hay petición en curso, en su registro."""
+    registro = g.get("etapas") if has_request_context() else None
+    return metricas.etapa(nombre, registro)
+
+@api.before_request
+def iniciar_peticion():
+    g.inicio = time.perf_counter()
+    g.etapas = {}
+    # Toda la petición usa el mismo paquete aunque se active otro mientras tanto
+    g.recursos = recursos
+    g.perfil = None
+    if perfilado_habilitado and request.headers.get("X-Perfilar") == "1":
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+            g.perfil = perfil
+        except ValueError:
+            # Python 3.12+: solo un perfilador activo a la vez en el proceso
+            logger.warning("Perfilado omitido: ya hay otra petición perfilándose")
+
+@api.after_request
+def finalizar_peticion(respuesta):
+    duracion = time.perf_counter() - g.inicio
+    ruta = request.url_rule.rule if request.url_rule else request.path
+    metricas.registrar_peticion(ruta, respuesta.status_code, duracion)
+
+    if g.perfil is not None:
+        g.perfil.disable()
+        os.makedirs(ruta_perfiles_cprofile, exist_ok=True)
+        nombre = f"{time.strftime('%Y%m%d-%H%M%S')}_{ruta.strip('/').replace('/', '_')}_{os.getpid()}.prof"
+        g.perfil.dump_stats(os.path.join(ruta_perfiles_cprofile, nombre))
+
+    # Tiempos por etapa también en la cabecera estándar Server-Timing
+    etapas = " ".join(f"{k}={v * 1000:.1f}ms" for k, v in g.etapas.items())
+    if g.etapas:
+        respuesta.headers['Server-Timing'] = ", ".join(
+            f"{k};dur={v * 1000:.1f}" for k, v in g.etapas.items()
+        )
+    logger.info(
+        "peticion metodo=%s ruta=%s estado=%d ms=%.1f %s",
+        request.method, ruta, respuesta.status_code, duracion * 1000, etapas
+    )
+    return respuesta
+
+def crear_app(planificar=True):
+    """
+    Fábrica de la aplicación: carga los recursos (si faltan) y registra las rutas.
+
+    :param planificar: arranca aquí los hilos de fondo (planificador de pronósticos
+                       y vigilancia del registro); el modo serve los arranca en
+                       los workers después del fork
+    """
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    cargar_recursos()
+    if planificar:
+        iniciar_hilos()
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+    return app
+
+def estadisticas_heatmap(df_zona, riesgo_min, riesgo_max):
+    return {
+        'riesgo_min': float(riesgo_min),
+        'riesgo_max': float(riesgo_max),
+        'riesgo_promedio': float(df_zona["prediccion_riesgo"].mean())
+    }
+
+def datos_heatmap(df_zona):
+    # Normalizar valores de riesgo a rango 0-1
+    riesgo_norm, riesgo_min, riesgo_max = normalizar_riesgo(df_zona["prediccion_riesgo"])
+
+    # Formatear datos para el heatmap
+    # Formato: [[lat, lon, intensidad], [lat, lon, intensidad], ...]
+    # Las coordenadas salen del id de celda (float64 exacto a 3 decimales), no del float32 del índice
+    lat, lon = decodificar_celda(df_zona["celda"].to_numpy())
+    heat_data = np.column_stack([lat, lon, riesgo_norm]).tolist()
+
+    return {
+        'datos': heat_data,
+        'puntos': len(df_zona),
+        'estadisticas': estadisticas_heatmap(df_zona, riesgo_min, riesgo_max)
+    }
+
+def responder_heatmap(df_zona):
+    """JSON por defecto; binario comprimido si el cliente lo pide en Accept."""
+    if request.accept_mimetypes.best_match(['application/json', TIPO_BINARIO]) != TIPO_BINARIO:
+        return jsonify(datos_heatmap(df_zona))
+
+    riesgo_norm, riesgo_min, riesgo_max = normalizar_riesgo(df_zona["prediccion_riesgo"])
+    cuerpo = codificar_heatmap(
+        df_zona["lat_grid"].to_numpy(), df_zona["lon_grid"].to_numpy(), riesgo_norm,
+        estadisticas_heatmap(df_zona, riesgo_min, riesgo_max)
+    )
+    cuerpo, codificacion = comprimir(cuerpo, request.headers.get('Accept-Encoding'))
+
+    respuesta = Response(cuerpo, mimetype=TIPO_BINARIO)
+    respuesta.headers['Vary'] = 'Accept, Accept-Encoding'
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    return respuesta
+
+@api.route('/api/predecir', methods=['POST'])
 def predecir():
     try:
         # Recibir datos del frontend
@@ -49,74 +365,132 @@ def predecir():
         # Convertir fecha
         fecha_dt = pd.to_datetime(fecha_str)
 
-        # Preparar grid y predecir
-        df_grid = preparar_grid(df, fecha_dt)
-        df_pred = predecir_riesgo(modelo, df_grid)
-
-        # Filtrar por zona
-        limites = ZONAS[zona]
-        df_zona = filtrar_por_zona(df_pred, limites)
+        # Predicción nacional de la fecha (desde la cache) recortada a la zona
+        with etapa("prediccion_nacional"):
+            predicciones = g.recursos.cache_predicciones.obtener(fecha_dt)
+        with etapa("zona"):
+            df_zona = prediccion_zona(g.recursos.indice_grid, predicciones, zona)
 
         if df_zona.empty:
             return jsonify({'error': 'No hay datos para esta zona'}), 404
 
-        # Normalizar valores de riesgo a rango 0-1
-        riesgo_min = df_zona["prediccion_riesgo"].min()
-        riesgo_max = df_zona["prediccion_riesgo"].max()
-
-        if riesgo_max - riesgo_min < 0.1:
-            riesgo_min = df_zona["prediccion_riesgo"].quantile(0.1)
-            riesgo_max = df_zona["prediccion_riesgo"].quantile(0.9)
-
-        denominador = riesgo_max - riesgo_min
-        if denominador == 0:
-            df_zona_norm = df_zona.copy()
-            df_zona_norm["riesgo_norm"] = 0.5  # Valor neutro si no hay variación
-        else:
-            df_zona_norm = df_zona.copy()
-            df_zona_norm["riesgo_norm"] = (
-                (df_zona["prediccion_riesgo"] - riesgo_min) / denominador
-            ).clip(0, 1)
-
-        df_zona_norm["riesgo_norm"] = df_zona_norm["riesgo_norm"].fillna(0)
-
-        # api.py - Alrededor de la línea 65
-        riesgo_min = df_zona["prediccion_riesgo"].min()
-        riesgo_max = df_zona["prediccion_riesgo"].max()
-
-        # Si los valores están muy juntos, forzamos una escala para que haya contraste
-        if (riesgo_max - riesgo_min) < 1e-7:
-            df_zona_norm = df_zona.copy()
-            df_zona_norm["riesgo_norm"] = 0.1 # Fondo azul si no hay riesgo real
-        else:
-            df_zona_norm = df_zona.copy()
-            # Normalización Min-Max: Estira los valores para usar todo el espectro (0 a 1)
-            df_zona_norm["riesgo_norm"] = (
-                (df_zona["prediccion_riesgo"] - riesgo_min) / (riesgo_max - riesgo_min)
-            ).clip(0, 1)
-
-        # Limpieza de valores nulos
-        df_zona_norm["riesgo_norm"] = df_zona_norm["riesgo_norm"].fillna(0)
-
-        # Formatear datos para el heatmap
-        # Formato: [[lat, lon, intensidad], [lat, lon, intensidad], ...]
-        heat_data = df_zona_norm[["lat_grid", "lon_grid", "riesgo_norm"]].values.tolist()
-
-        return jsonify({
-            'datos': heat_data,
-            'puntos': len(df_zona),
-            'estadisticas': {
-                'riesgo_min': float(riesgo_min),
-                'riesgo_max': float(riesgo_max),
-                'riesgo_promedio': float(df_zona["prediccion_riesgo"].mean())
-            }
-        })
+        with etapa("heatmap"):
+            return responder_heatmap(df_zona)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return jsonify({'error': str(e)}), 500
+
+CAMPOS_VISTA = ['lat_min', 'lat_max', 'lon_min', 'lon_max']
+
+def limites_vista(data):
+    # Límites numéricos (no booleanos) y finitos con mínimo <= máximo; None si alguno no lo es
+    limites = {c: data.get(c) for c in CAMPOS_VISTA}
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and np.isfinite(v) for v in limites.values()):
+        return None
+    if limites['lat_min'] > limites['lat_max'] or limites['lon_min'] > limites['lon_max']:
+        return None
+    return {c: float(v) for c, v in limites.items()}
+
+@api.route('/api/predecir/vista', methods=['POST'])
+def predecir_vista():
+    """Predicción de un día solo para el rectángulo visible del mapa."""
+    try:
+        data = request.get_json(silent=True) or {}
+        fecha_str = data.get('fecha')
+
+        # Validaciones
+        if not fecha_str or any(data.get(c) is None for c in CAMPOS_VISTA):
+            return jsonify({'error': 'fecha, lat_min, lat_max, lon_min y lon_max son requeridos'}), 400
+
+        limites = limites_vista(data)
+        if limites is None:
+            return jsonify({'error': 'Límites de la vista no válidos: números finitos con mínimo <= máximo'}), 400
+
+        # Predicción nacional de la fecha (desde la cache) recortada con el índice de teselas
+        with etapa("prediccion_nacional"):
+            predicciones = g.recursos.cache_predicciones.obtener(pd.to_datetime(fecha_str))
+        with etapa("zona"):
+            df_vista = prediccion_limites(g.recursos.indice_grid, predicciones, limites)
+
+        if df_vista.empty:
+            return jsonify({'error': 'No hay datos en esta vista'}), 404
+
+        with etapa("heatmap"):
+            return responder_heatmap(df_vista)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/predecir/lote', methods=['POST'])
+def predecir_lote():
+    """Predicción de varios días y zonas en una sola llamada al modelo."""
+    try:
+        data = request.json
+        fecha_inicio = data.get('fecha_inicio')
+        fecha_fin = data.get('fecha_fin', fecha_inicio)
+        zonas = data.get('zonas')
+
+        # Validaciones
+        if not fecha_inicio or not zonas:
+            return jsonify({'error': 'fecha_inicio y zonas son requeridas'}), 400
+
+        if isinstance(zonas, str):
+            zonas = [zonas]
+
+        zonas_invalidas = [z for z in zonas if z not in ZONAS]
+        if zonas_invalidas:
+            return jsonify({'error': f'Zonas no válidas: {zonas_invalidas}'}), 400
+
+        fechas = pd.date_range(pd.to_datetime(fecha_inicio), pd.to_datetime(fecha_fin), freq="D")
+        if len(fechas) == 0:
+            return jsonify({'error': 'fecha_fin debe ser posterior o igual a fecha_inicio'}), 400
+
+        if len(fechas) > MAX_DIAS_LOTE:
+            return jsonify({'error': f'El rango máximo es de {MAX_DIAS_LOTE} días'}), 400
+
+        # Las fechas que no están en cache se predicen juntas en una sola inferencia
+        with etapa("prediccion_nacional"):
+            vectores = g.recursos.cache_predicciones.obtener_lote(fechas)
+
+        with etapa("heatmap"):
+            resultados = []
+            for fecha_dt, predicciones in zip(fechas, vectores):
+                capas = {}
+                for zona in zonas:
+                    df_zona = prediccion_zona(g.recursos.indice_grid, predicciones, zona)
+                    capas[zona] = datos_heatmap(df_zona) if not df_zona.empty else None
+                resultados.append({'fecha': fecha_dt.strftime('%Y-%m-%d'), 'zonas': capas})
+
+            return jsonify({'dias': resultados})
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/tiles/<fecha>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def tesela_riesgo(fecha, z, x, y):
+    """Puntos del heatmap agregados para una tesela (z, x, y) del mapa nacional."""
+    if not tesela_valida(z, x, y):
+        return jsonify({'error': f'Tesela no válida: z debe estar entre 0 y {ZOOM_LIMITE} y x, y en [0, 2^z)'}), 400
+    try:
+        fecha_dt = pd.to_datetime(fecha, format='%Y-%m-%d')
+    except (ValueError, OverflowError):
+        return jsonify({'error': 'Fecha no válida (formato AAAA-MM-DD)'}), 400
+    try:
+        with etapa("teselas"):
+            puntos = g.recursos.teselas_riesgo.tesela(fecha_dt, z, x, y)
+        respuesta = jsonify({'datos': puntos_json(puntos), 'puntos': len(puntos)})
+        # El contenido de una tesela no cambia mientras no cambie el modelo
+        respuesta.headers['Cache-Control'] = 'public, max-age=3600'
+        return respuesta
 
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception("Error en %s", request.path)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/zonas', methods=['GET'])
+@api.route('/api/zonas', methods=['GET'])
 def obtener_zonas():
     """Obtiene la lista de zonas y sus límites para evitar duplicar configuración en el frontend."""
     zonas_ordenadas = sorted(ZONAS.items(), key=lambda z: z[0])
@@ -125,28 +499,141 @@ def obtener_zonas():
         'detalles': {nombre: limites for nombre, limites in zonas_ordenadas}
     })
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/metrics', methods=['GET'])
+def exportar_metricas():
+    """Métricas del proceso en formato de texto de Prometheus."""
+    return Response(
+        metricas.exportar(g.recursos.cache_predicciones.estadisticas()),
+        mimetype='text/plain; version=0.0.4'
+    )
+
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """Verificar que el servidor está funcionando"""
-    return jsonify({'status': 'OK', 'message': 'API funcionando correctamente'})
+    return jsonify({
+        'status': 'OK',
+        'message': 'API funcionando correctamente',
+        'version': g.recursos.version,
+        'cache': g.recursos.cache_predicciones.estadisticas(),
+        'precalculo': g.recursos.planificador.estado(),
+        'recarga': recargador.estado()
+    })
+
+
+@api.route('/api/admin/recargar', methods=['POST'])
+def recargar_modelo():
+    """
+    Activa una versión del registro (o vuelve a cargar la activa) sin reiniciar.
+
+    Requiere la cabecera X-Admin-Token igual a API_ADMIN_TOKEN. El worker que
+    recibe la petición recarga enseguida; el resto detecta el cambio del
+    archivo ACTIVA en su siguiente revisión del registro.
+    """
+    if not token_admin or request.headers.get('X-Admin-Token') != token_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+    try:
+        data = request.get_json(silent=True) or {}
+        version = data.get('version') or version_activa(ruta_registro)
+        if version is None:
+            return jsonify({'error': 'El registro de modelos está vacío'}), 404
+        if version not in versiones(ruta_registro):
+            return jsonify({'error': f'Versión inexistente: {version}'}), 404
+
+        # ACTIVA solo se escribe si la recarga se acepta: con otra en curso no cambia nada
+        if not recargador.solicitar(version, al_aceptar=lambda: activar_version(ruta_registro, version)):
+            return jsonify({'error': 'Ya hay una recarga en curso', 'recarga': recargador.estado()}), 409
+        return jsonify({'version': version, 'anterior': g.recursos.version}), 202
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return jsonify({'error': str(e)}), 500
+
 
+def punto_valido(punto):
+    # [lat, lon] numéricos (no booleanos) dentro de los rangos geográficos
+    if not isinstance(punto, (list, tuple)) or len(punto) != 2:
+        return False
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in punto):
+        return False
+    return -90 <= punto[0] <= 90 and -180 <= punto[1] <= 180
 
-@app.route('/api/diagnosticar', methods=['POST'])
+@api.route('/api/diagnosticar', methods=['POST'])
 def diagnosticar():
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         lat, lon = data.get('lat'), data.get('lon')
+        if not punto_valido([lat, lon]):
+            return jsonify({'error': 'lat y lon deben ser números dentro de los rangos geográficos'}), 400
         # Llamada a la función del predictor.py
-        perfil = diagnosticar_prediccion(modelo_dbscan, perfiles_clusters, lat, lon) 
+        with etapa("diagnostico"):
+            perfil = diagnosticar_prediccion(g.recursos.indice_diagnostico, g.recursos.perfiles_clusters, lat, lon) 
         
         if not perfil:
             return jsonify({'encontrado': False, 'mensaje': 'Sin antecedentes cercanos.'})
             
         return jsonify({'encontrado': True, 'perfil': perfil})
     except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/diagnosticar/lote', methods=['POST'])
+def diagnosticar_varios():
+    """Diagnóstico de varios puntos [[lat, lon], ...] en una sola consulta al BallTree."""
+    try:
+        data = request.get_json(silent=True) or {}
+        puntos = data.get('puntos')
+
+        if not puntos:
+            return jsonify({'error': 'puntos es requerido'}), 400
+
+        if not isinstance(puntos, list):
+            return jsonify({'error': 'puntos debe ser una lista [[lat, lon], ...]'}), 400
+
+        if len(puntos) > MAX_PUNTOS_LOTE:
+            return jsonify({'error': f'El máximo es de {MAX_PUNTOS_LOTE} puntos'}), 400
+
+        if not all(punto_valido(p) for p in puntos):
+            return jsonify({'error': 'Cada punto debe ser [lat, lon] con lat en [-90, 90] y lon en [-180, 180]'}), 400
+
+        lats = [p[0] for p in puntos]
+        lons = [p[1] for p in puntos]
+        with etapa("diagnostico"):
+            perfiles = diagnosticar_lote(g.recursos.indice_diagnostico, g.recursos.perfiles_clusters, lats, lons)
+
+        return jsonify({'resultados': [
+            {'encontrado': True, 'perfil': perfil} if perfil else {'encontrado': False}
+            for perfil in perfiles
+        ]})
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
         return jsonify({'error': str(e)}), 500
 
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API de predicción de riesgo delictivo")
+    subcomandos = parser.add_subparsers(dest="comando")
+    serve = subcomandos.add_parser("serve", help="servidor de producción (gunicorn, sin modo debug)")
+    serve.add_argument("--host", default=os.environ.get("API_HOST", "0.0.0.0"))
+    serve.add_argument("--port", type=int, default=int(os.environ.get("API_PUERTO", 5000)))
+    serve.add_argument(
+        "--workers", type=int, default=int(os.environ.get("API_WORKERS", 2)),
+        help="procesos que atienden peticiones; comparten la memoria precargada"
+    )
+    serve.add_argument(
+        "--threads", type=int, default=int(os.environ.get("API_HILOS", 4)),
+        help="hilos por worker"
+    )
+    args = parser.parse_args(argv)
+
+    if args.comando == "serve":
+        from src.servicio.servidor import servir
+        servir(crear_app(planificar=False), args.host, args.port, args.workers, args.threads,
+               al_iniciar_worker=iniciar_hilos)
+    else:
+        # Servidor de desarrollo de Flask
+        crear_app().run(debug=True, host='0.0.0.0', port=5000)
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    main()
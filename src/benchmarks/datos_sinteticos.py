@@ -0,0 +1,128 @@
+# generador de datos sintéticos con los mismos esquemas que las fuentes reales
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.model.zonas import ZONAS
+
+MESES = [
+    "enero", "febrero", "marzo", "abril", "mayo", "junio",
+    "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
+]
+
+SERVICIOS = [
+    "Seguridad Ciudadana", "Tránsito y Movilidad", "Gestión Sanitaria",
+    "Gestión de Siniestros", "Servicios Municipales"
+]
+# La mayoría de las llamadas del ECU911 son de seguridad ciudadana
+PESOS_SERVICIOS = [0.55, 0.2, 0.15, 0.05, 0.05]
+
+INFRACCIONES = [
+    "ROBO", "HURTO", "TRÁFICO ILÍCITO DE SUSTANCIAS CATALOGADAS SUJETAS A FISCALIZACIÓN",
+    "VIOLENCIA PSICOLÓGICA CONTRA LA MUJER O MIEMBROS DEL NÚCLEO FAMILIAR",
+    "TENENCIA Y PORTE DE ARMAS", "ASESINATO", "BOLETA DE CAPTURA"
+]
+
+
+def generar_catalogo(ruta, parroquias, rng):
+    """
+    Catálogo de parroquias (cod_parroquia, lat, lon) repartidas en las zonas.
+
+    :return: DataFrame del catálogo con la zona de cada parroquia
+    """
+    nombres = list(ZONAS)
+    zona = rng.choice(nombres, size=parroquias)
+    limites = pd.DataFrame([ZONAS[z] for z in zona])
+
+    catalogo = pd.DataFrame({
+        "cod_parroquia": [f"{i:06d}" for i in range(10101, 10101 + parroquias)],
+        "nombre_parroquia": [f"PARROQUIA {i}" for i in range(parroquias)],
+        "lat": rng.uniform(limites["lat_min"], limites["lat_max"]),
+        "lon": rng.uniform(limites["lon_min"], limites["lon_max"]),
+    })
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    catalogo.to_csv(ruta, index=False)
+    catalogo["zona"] = zona
+    return catalogo
+
+
+def generar_ecu911(ruta_dir, catalogo, meses, llamadas_por_mes, anio, rng):
+    """
+    Un CSV mensual por mes (separador ';', encabezados con BOM) como los del ECU911.
+
+    :return: lista de rutas generadas
+    """
+    os.makedirs(ruta_dir, exist_ok=True)
+    # Unas pocas parroquias concentran la mayoría de las llamadas
+    pesos = rng.pareto(1.5, size=len(catalogo)) + 1
+    pesos /= pesos.sum()
+
+    rutas = []
+    for mes in range(1, meses + 1):
+        dias = pd.Period(f"{anio}-{mes:02d}").days_in_month
+        parroquia = rng.choice(len(catalogo), size=llamadas_por_mes, p=pesos)
+        dia = rng.integers(1, dias + 1, size=llamadas_por_mes)
+
+        df_mes = pd.DataFrame({
+            "Fecha": [f"{d:02d}/{mes:02d}/{anio}" for d in dia],
+            "Provincia": catalogo["zona"].to_numpy()[parroquia],
+            "Canton": [f"CANTON {p // 10}" for p in parroquia],
+            "Cod_Parroquia": catalogo["cod_parroquia"].to_numpy()[parroquia],
+            "Parroquia": catalogo["nombre_parroquia"].to_numpy()[parroquia],
+            "Servicio": rng.choice(SERVICIOS, size=llamadas_por_mes, p=PESOS_SERVICIOS),
+            "Subtipo": rng.choice(["Robo", "Riña", "Alarma", "Escándalo"], size=llamadas_por_mes),
+        })
+        ruta = os.path.join(ruta_dir, f"incidentes_{MESES[mes - 1]}_{anio}.csv")
+        df_mes.to_csv(ruta, sep=";", index=False, encoding="utf-8-sig")
+        rutas.append(ruta)
+    return rutas
+
+
+def generar_detenidos(ruta, catalogo, registros, meses, anio, rng, focos=40):
+    """
+    CSV de detenidos con el esquema de salida de cleaning_aprehendidos_detenidos_raw.
+
+    Las detenciones se agrupan alrededor de unos pocos focos (~200 m) para que
+    el DBSCAN encuentre clusters.
+    """
+    focos = catalogo.sample(n=min(focos, len(catalogo)), random_state=int(rng.integers(1 << 31)))
+    foco = rng.integers(0, len(focos), size=registros)
+
+    inicio = pd.Timestamp(f"{anio}-01-01")
+    fin = inicio + pd.DateOffset(months=meses)
+    segundos = rng.integers(0, int((fin - inicio).total_seconds()), size=registros)
+
+    df = pd.DataFrame({
+        "fecha_dt": (inicio + pd.to_timedelta(segundos, unit="s")).strftime("%Y-%m-%d %H:%M:%S"),
+        "latitud": focos["lat"].to_numpy()[foco] + rng.normal(0, 0.002, size=registros),
+        "longitud": focos["lon"].to_numpy()[foco] + rng.normal(0, 0.002, size=registros),
+        "nombre_provincia": pd.Series(focos["zona"].to_numpy()[foco]).str.upper(),
+        "nombre_canton": [f"CANTON {f}" for f in foco],
+        "nombre_parroquia": focos["nombre_parroquia"].to_numpy()[foco],
+        "presunta_infraccion": rng.choice(INFRACCIONES, size=registros),
+    })
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    df.to_csv(ruta, index=False, encoding="utf-8")
+    return df
+
+
+def generar(ruta_base, meses=3, llamadas_por_mes=50_000, detenidos=20_000, parroquias=1_000,
+            anio=2025, semilla=42):
+    """
+    Genera bajo `ruta_base` el árbol data/ que esperan los scripts del pipeline.
+
+    :return: dict con las rutas generadas
+    """
+    rng = np.random.default_rng(semilla)
+    ruta_catalogo = os.path.join(ruta_base, "data", "processed", "catalogo_parroquias_ecuador.csv")
+    ruta_ecu911 = os.path.join(ruta_base, "data", "raw", "ecu911", "dataset")
+    ruta_detenidos = os.path.join(
+        ruta_base, "data", "raw", "detenidosaprehendidos", "aprehendidos_detenidos_raw.csv"
+    )
+
+    catalogo = generar_catalogo(ruta_catalogo, parroquias, rng)
+    archivos = generar_ecu911(ruta_ecu911, catalogo, meses, llamadas_por_mes, anio, rng)
+    generar_detenidos(ruta_detenidos, catalogo, detenidos, meses, anio, rng)
+
+    return {"catalogo": ruta_catalogo, "ecu911": archivos, "detenidos": ruta_detenidos}
@@ -0,0 +1,312 @@
+# benchmarks del pipeline (ingesta, entrenamiento, inferencia y API) sobre datos sintéticos
+import argparse
+import gc
+import json
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: no hay getrusage
+    resource = None
+
+# Los scripts del pipeline usan rutas relativas: el benchmark se ejecuta dentro de
+# un directorio temporal, así que la raíz del repositorio se agrega al path
+RAIZ_REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if RAIZ_REPO not in sys.path:
+    sys.path.insert(0, RAIZ_REPO)
+
+from src.benchmarks.datos_sinteticos import generar
+
+ETAPAS = ["ecu911", "preprocesamiento", "entrenamiento", "clustering", "inferencia", "api"]
+
+
+def medir(resultados, nombre, funcion, memoria=True):
+    """Ejecuta `funcion` y guarda su duración y (con tracemalloc) su pico de memoria."""
+    gc.collect()
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    valor = funcion()
+    duracion = time.perf_counter() - inicio
+
+    resultados[nombre] = {"segundos": round(duracion, 4)}
+    if memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados[nombre]["memoria_pico_mb"] = round(pico / 2**20, 2)
+    print(f"   {nombre}: {duracion:.3f} s")
+    return valor
+
+
+def percentiles(latencias):
+    ms = np.asarray(latencias) * 1000
+    return {
+        "peticiones": len(ms),
+        "media_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def carga(app, cuerpos, ruta, concurrencia):
+    """Envía los `cuerpos` a `ruta` con el cliente de pruebas de Flask desde varios hilos."""
+    def enviar(lote):
+        cliente = app.test_client()
+        latencias = []
+        for cuerpo in lote:
+            inicio = time.perf_counter()
+            respuesta = cliente.post(ruta, json=cuerpo)
+            latencias.append(time.perf_counter() - inicio)
+            if respuesta.status_code >= 500:
+                raise RuntimeError(f"{ruta} respondió {respuesta.status_code}: {respuesta.get_data(as_text=True)}")
+        return latencias
+
+    lotes = [cuerpos[i::concurrencia] for i in range(concurrencia)]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        latencias = [t for parcial in pool.map(enviar, lotes) for t in parcial]
+    total = time.perf_counter() - inicio
+
+    resultado = percentiles(latencias)
+    resultado["peticiones_por_segundo"] = round(len(latencias) / total, 2)
+    return resultado
+
+
+# ETAPAS
+
+def etapa_ecu911(resultados, args, memoria):
+    from src.cleaning import cleaning_ecu911_raw as ecu911
+
+    archivos = sorted(ecu911.archivos_csv)
+    medir(resultados, "ecu911_completo", lambda: ecu911.procesar_completo(archivos), memoria)
+    for workers in sorted({1, args.workers}):
+        df_agregado = medir(
+            resultados, f"ecu911_streaming_w{workers}",
+            lambda: ecu911.procesar_streaming(archivos, workers=workers), memoria
+        )
+    # El preprocesamiento usa el ECU911 más reciente: aquí el agregado
+    df_agregado.to_csv(ecu911.nombre_datos_agregados, index=False)
+
+
+def etapa_preprocesamiento(resultados, args, memoria):
+    from src.cleaning import preprocesamiento_datos_entrenamiento as prep
+
+    df_apre, df_911 = medir(resultados, "preprocesamiento_carga", prep.cargar_fuentes, memoria)
+    # Igual que el modo completo del preprocesamiento: conteos, historial celda × día y
+    # dataset con features de rezago (así la inferencia y la API miden la búsqueda de rezagos)
+    df_union = medir(resultados, "preprocesamiento_union", lambda: prep.conteos_celda_dia(df_apre, df_911), memoria)
+    historial = medir(resultados, "preprocesamiento_historial", lambda: prep.historial_desde_conteos(df_union), memoria)
+    medir(
+        resultados, "preprocesamiento_historial_guardado",
+        lambda: prep.guardar_historial(historial, prep.ruta_historial), memoria
+    )
+    df_final = medir(
+        resultados, "preprocesamiento_features_lag", lambda: prep.dataset_desde_conteos(df_union, historial), memoria
+    )
+    medir(resultados, "preprocesamiento_guardado", lambda: prep.guardar_dataset(df_final), memoria)
+
+
+def etapa_entrenamiento(resultados, args, memoria):
+    from src.model import entrenamiento
+
+    medir(resultados, "entrenamiento", lambda: entrenamiento.main([]), memoria)
+    medir(
+        resultados, "entrenamiento_externo",
+        lambda: entrenamiento.main(["--externo", "--cache", os.path.join("model", "xgb_cache")]),
+        memoria
+    )
+
+
+def etapa_clustering(resultados, args, memoria):
+    # Los gráficos se generan sin ventana
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    medir(
+        resultados, "clustering_detenidos",
+        lambda: runpy.run_module("src.clustering.clustering_aprehendidos_detenidos_raw", run_name="__main__"),
+        memoria
+    )
+
+
+def etapa_inferencia(resultados, args, memoria):
+    from src.model.inferencia import MotorInferencia
+    from src.datos.historial import cargar_historial, existe_historial
+    from src.model.predictor import (
+        cargar_modelo, cargar_dataset, construir_indice_grid, preparar_grid, predecir_riesgo,
+        vincular_historial
+    )
+    from src.model.zonas import ZONAS
+
+    modelo = cargar_modelo(os.path.join("model", "modelo_riesgo_delictivo.pkl"))
+    indice = medir(
+        resultados, "indice_grid",
+        lambda: construir_indice_grid(
+            cargar_dataset(os.path.join("data", "processed", "dataset_entrenamiento_final.csv"),
+                           columnas=["lat_grid", "lon_grid"]),
+            ZONAS
+        ),
+        memoria
+    )
+    ruta_historial = os.path.join("data", "processed", "historial")
+    if existe_historial(ruta_historial):
+        vincular_historial(indice, cargar_historial(ruta_historial))
+    fechas = pd.date_range("2025-06-01", periods=args.repeticiones, freq="D")
+
+    medir(resultados, "preparar_grid", lambda: [preparar_grid(indice, f) for f in fechas], memoria)
+    df_grid = preparar_grid(indice, fechas[0])
+    for nombre, motor in [("xgbregressor", modelo), ("booster", MotorInferencia(modelo))]:
+        medir(
+            resultados, f"predecir_riesgo_{nombre}",
+            lambda: [predecir_riesgo(motor, df_grid) for _ in fechas], memoria
+        )
+    resultados["inferencia_celdas"] = int(len(indice["lat"]))
+
+
+def etapa_api(resultados, args, memoria):
+    import api
+
+    # Sin el planificador de fondo: la prueba de carga mide la inferencia bajo demanda
+    app = medir(resultados, "api_arranque", lambda: api.crear_app(planificar=False), memoria)
+    rng = np.random.default_rng(0)
+
+    zonas = list(api.ZONAS)
+    fechas = pd.date_range("2025-06-01", periods=30, freq="D").strftime("%Y-%m-%d")
+    cuerpos_predecir = [
+        {"fecha": fechas[i % len(fechas)], "zona": zonas[rng.integers(len(zonas))]}
+        for i in range(args.peticiones)
+    ]
+
+    detenidos = pd.read_csv(
+        os.path.join("data", "raw", "detenidosaprehendidos", "aprehendidos_detenidos_raw.csv"),
+        usecols=["latitud", "longitud"]
+    ).sample(n=args.peticiones, replace=True, random_state=0)
+    cuerpos_diagnosticar = [
+        {"lat": float(lat), "lon": float(lon)}
+        for lat, lon in detenidos[["latitud", "longitud"]].itertuples(index=False)
+    ]
+
+    resultados["api_predecir"] = carga(app, cuerpos_predecir, "/api/predecir", args.concurrencia)
+    resultados["api_predecir"]["cache"] = api.recursos.cache_predicciones.estadisticas()
+    resultados["api_diagnosticar"] = carga(app, cuerpos_diagnosticar, "/api/diagnosticar", args.concurrencia)
+    for ruta in ("api_predecir", "api_diagnosticar"):
+        print(f"   {ruta}: p50 {resultados[ruta]['p50_ms']} ms | p99 {resultados[ruta]['p99_ms']} ms")
+
+
+FUNCIONES_ETAPA = {
+    "ecu911": etapa_ecu911,
+    "preprocesamiento": etapa_preprocesamiento,
+    "entrenamiento": etapa_entrenamiento,
+    "clustering": etapa_clustering,
+    "inferencia": etapa_inferencia,
+    "api": etapa_api,
+}
+
+
+# COMPARACIÓN ENTRE EJECUCIONES
+
+def comparar(actual, anterior):
+    """Imprime la variación de cada medida respecto a una ejecución anterior."""
+    print(f"Comparación con {anterior.get('commit', '?')}:")
+    for nombre, medidas in actual["resultados"].items():
+        previas = anterior.get("resultados", {}).get(nombre)
+        if not isinstance(medidas, dict) or not isinstance(previas, dict):
+            continue
+        for clave in ("segundos", "p50_ms", "p99_ms", "memoria_pico_mb"):
+            if clave in medidas and previas.get(clave):
+                cambio = (medidas[clave] - previas[clave]) / previas[clave] * 100
+                print(f"   {nombre}.{clave}: {previas[clave]} -> {medidas[clave]} ({cambio:+.1f}%)")
+
+
+def rss_max_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en bytes en macOS y en KB en Linux
+    return round(rss / 2**20 if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def commit_actual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ_REPO,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline sobre datos sintéticos")
+    parser.add_argument("--etapas", nargs="+", choices=ETAPAS, default=ETAPAS,
+                        help="etapas a medir (cada una usa la salida de las anteriores)")
+    parser.add_argument("--meses", type=int, default=3, choices=range(1, 13), metavar="1-12")
+    parser.add_argument("--llamadas-por-mes", type=int, default=50_000)
+    parser.add_argument("--detenidos", type=int, default=20_000)
+    parser.add_argument("--parroquias", type=int, default=1_000)
+    parser.add_argument("--workers", type=int, default=2, help="workers del ECU911 en modo streaming")
+    parser.add_argument("--repeticiones", type=int, default=10, help="fechas en la etapa de inferencia")
+    parser.add_argument("--peticiones", type=int, default=300, help="peticiones por endpoint")
+    parser.add_argument("--concurrencia", type=int, default=4, help="hilos que envían peticiones")
+    parser.add_argument("--sin-memoria", action="store_true",
+                        help="no usa tracemalloc (tiempos más exactos, sin picos de memoria)")
+    parser.add_argument("--directorio", help="directorio de trabajo (por defecto uno temporal)")
+    parser.add_argument("--salida", help="JSON de resultados (por defecto benchmarks/<commit>.json)")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    args = parser.parse_args(argv)
+
+    commit = commit_actual()
+    salida = os.path.abspath(args.salida or os.path.join("benchmarks", f"{commit}.json"))
+    directorio = args.directorio or tempfile.mkdtemp(prefix="benchmark_")
+    directorio_original = os.getcwd()
+
+    print(f"🔄 Generando datos sintéticos en {directorio}...")
+    parametros = {k: v for k, v in vars(args).items() if k not in ("salida", "comparar", "directorio")}
+    resultados = {}
+    medir(resultados, "generacion_datos", lambda: generar(
+        directorio, args.meses, args.llamadas_por_mes, args.detenidos, args.parroquias
+    ), memoria=False)
+
+    # Modelos, teselas y gráficos del benchmark quedan dentro del directorio de trabajo
+    os.makedirs(os.path.join(directorio, "model"), exist_ok=True)
+    os.chdir(directorio)
+    try:
+        for etapa in ETAPAS:
+            if etapa in args.etapas:
+                print(f"🔄 Etapa: {etapa}")
+                FUNCIONES_ETAPA[etapa](resultados, args, not args.sin_memoria)
+    finally:
+        os.chdir(directorio_original)
+        if not args.directorio:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        "commit": commit,
+        "fecha": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "parametros": parametros,
+        "rss_max_mb": rss_max_mb(),
+        "resultados": resultados,
+    }
+    os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en: {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(informe, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+import argparse
 import pandas as pd
+import numpy as np
 import glob
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.datos.grid import codificar_celda, decodificar_celda
+from src.datos.manifiesto import cargar_manifiesto, guardar_manifiesto, huella_archivo, misma_huella
 
 #carga de dataset ecu911
 ruta_padre = "data"
@@ -9,79 +15,381 @@ archivos_csv = glob.glob(os.path.join(ruta_datos_originales, "*.csv"))
 catalogo_parroquias = os.path.join(ruta_padre, "processed","catalogo_parroquias_ecuador.csv")
 
 nombre_datos_procesados = os.path.join(ruta_padre,"raw","ecu911","ecu911_unificado.csv")
+nombre_datos_agregados = os.path.join(ruta_padre,"raw","ecu911","ecu911_agregado.csv")
 
-lista_dfs = []
+# parciales mensuales del modo incremental
+ruta_parciales = os.path.join(ruta_padre,"raw","ecu911","parciales")
+ruta_manifiesto = os.path.join(ruta_parciales, "manifiesto.json")
+
+# Filas leídas por bloque en el modo streaming
+TAMANO_BLOQUE = 250_000
+
+COLUMNAS_AGREGADO = [
+    "lat_grid", "lon_grid", "fecha_dt",
+    "mes", "dia", "dia_semana",
+    "conteo_llamadas_riesgo"
+]
+
+
+def normalizar_nombre_columna(nombre):
+    return str(nombre).replace("ï»¿", "").replace("﻿", "").strip().lower()
+
+
+def normalizar_cod_parroquia(serie):
+    # Códigos parroquia normalizados
+    return (
+        serie
+        .astype(str)
+        .str.replace(".0", "", regex=False)
+        .str.zfill(6)
+    )
+
+
+def leer_csv_911(archivo, **kwargs):
+    return pd.read_csv(
+        archivo,
+        sep=";",
+        encoding="UTF-8",
+        dtype={"Cod_Parroquia": str},
+        on_bad_lines="skip",
+        **kwargs
+    )
+
+# MODO COMPLETO (registro por registro)
+
+def procesar_completo(archivos):
+    lista_dfs = []
+
+    for archivo in archivos:
+        try:
+            df_temp = leer_csv_911(archivo)
+
+            # Normalizacion de columnas
+            df_temp.columns = [normalizar_nombre_columna(c) for c in df_temp.columns]
+
+            # Filtrar seguridad ciudadana
+            if "servicio" in df_temp.columns:
+                df_temp = df_temp[df_temp["servicio"] == "Seguridad Ciudadana"]
+
+            lista_dfs.append(df_temp)
+
+        except Exception as e:
+            print(f"Error procesando {archivo}: {e}")
+
+    df_911 = pd.concat(lista_dfs, ignore_index=True)
+
+    # Fechas
+    df_911["fecha_dt"] = pd.to_datetime(df_911["fecha"], errors="coerce", dayfirst=True)
+    df_911 = df_911.dropna(subset=["fecha_dt"])
+
+    df_911["cod_parroquia"] = normalizar_cod_parroquia(df_911["cod_parroquia"])
+    #cargar catalogo de parroquias
+    catalogo = pd.read_csv(catalogo_parroquias, dtype={"cod_parroquia": str})
+    # Unir con catálogo para obtener lat/lon
+    df_911 = df_911.merge(catalogo, on="cod_parroquia", how="left")
+
+    # Eliminar registros sin coordenadas
+    df_911 = df_911.dropna(subset=["lat", "lon"])
+    #grid espacial: id entero de la celda y sus coordenadas (3 decimales)
+    df_911["celda"] = codificar_celda(df_911["lat"], df_911["lon"])
+    df_911["lat_grid"], df_911["lon_grid"] = decodificar_celda(df_911["celda"])
+    #featrures temporales
+    df_911["mes"] = df_911["fecha_dt"].dt.month
+    df_911["dia"] = df_911["fecha_dt"].dt.day
+    df_911["dia_semana"] = df_911["fecha_dt"].dt.dayofweek
+
+    #targe ecu911 - conteo de llamadas por dia y zona
+    df_group = (
+        df_911.groupby(["celda", "fecha_dt"])
+        .size()
+        .reset_index(name="conteo_llamadas_riesgo")
+    )
+
+    df_911 = df_911.merge(
+        df_group,
+        on=["celda", "fecha_dt"],
+        how="left"
+    )
+    return df_911.drop(columns=["celda"])
+
+# MODO STREAMING (conteos agregados por celda y día)
+
+def cargar_coordenadas_parroquias(ruta):
+    """
+    Carga el catálogo como una tabla de búsqueda código -> celda del grid.
+
+    :return: (pd.Index de códigos, array int64 con la celda de cada código)
+    """
+    catalogo = pd.read_csv(ruta, dtype={"cod_parroquia": str})
+    catalogo = catalogo.dropna(subset=["lat", "lon"])
+    # El merge original tomaba la primera coincidencia del catálogo por código
+    catalogo = catalogo.drop_duplicates(subset="cod_parroquia", keep="first")
+    return pd.Index(catalogo["cod_parroquia"]), codificar_celda(catalogo["lat"], catalogo["lon"])
+
+
+def parsear_fechas(serie):
+    # Solo se parsean los valores distintos (unos pocos por mes) y luego se expanden
+    codigos, unicos = pd.factorize(serie)
+    fechas = pd.to_datetime(pd.Series(unicos), errors="coerce", dayfirst=True).dt.normalize()
+
+    resultado = np.full(len(codigos), np.datetime64("NaT"), dtype="datetime64[ns]")
+    conocidos = codigos >= 0
+    resultado[conocidos] = fechas.to_numpy()[codigos[conocidos]]
+    return pd.DatetimeIndex(resultado)
+
+
+def agregar_archivo(archivo, coordenadas, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Lee un CSV mensual por bloques y acumula los conteos por (parroquia, día).
+
+    :param coordenadas: salida de cargar_coordenadas_parroquias
+    :return: DataFrame con lat_grid, lon_grid, fecha_dt y conteo_llamadas_riesgo
+    """
+    codigos_catalogo, celdas_catalogo = coordenadas
+    columnas_necesarias = {"fecha", "cod_parroquia", "servicio"}
+    parciales = []
+
+    bloques = leer_csv_911(
+        archivo,
+        usecols=lambda c: normalizar_nombre_columna(c) in columnas_necesarias,
+        chunksize=tamano_bloque
+    )
+    for bloque in bloques:
+        bloque.columns = [normalizar_nombre_columna(c) for c in bloque.columns]
 
-for archivo in archivos_csv:
-    try:
-        df_temp = pd.read_csv(
-            archivo,
-            sep=";",
-            encoding="UTF-8",
-            dtype={"Cod_Parroquia": str},
-            on_bad_lines="skip"
-        )
-        
-        # Normalizacion de columnas
-        df_temp.columns = (
-            df_temp.columns.astype(str)
-            .str.replace("ï»¿", "")
-            .str.strip()
-            .str.lower()
-        )
-        
         # Filtrar seguridad ciudadana
-        if "servicio" in df_temp.columns:
-            df_temp = df_temp[df_temp["servicio"] == "Seguridad Ciudadana"]
-        
-        lista_dfs.append(df_temp)
-
-    except Exception as e:
-        print(f"Error procesando {archivo}: {e}")
-
-df_911 = pd.concat(lista_dfs, ignore_index=True)
-
-# Fechas
-df_911["fecha_dt"] = pd.to_datetime(df_911["fecha"], errors="coerce", dayfirst=True)
-df_911 = df_911.dropna(subset=["fecha_dt"])
-
-# Códigos parroquia normalizados
-df_911["cod_parroquia"] = (
-    df_911["cod_parroquia"]
-    .astype(str)
-    .str.replace(".0", "", regex=False)
-    .str.zfill(6)
-)
-#cargar catalogo de parroquias
-catalogo = pd.read_csv(catalogo_parroquias, dtype={"cod_parroquia": str})
-# Unir con catálogo para obtener lat/lon
-df_911 = df_911.merge(catalogo, on="cod_parroquia", how="left")
-
-# Eliminar registros sin coordenadas
-df_911 = df_911.dropna(subset=["lat", "lon"])
-#grid espacial
-df_911["lat_grid"] = df_911["lat"].round(3)
-df_911["lon_grid"] = df_911["lon"].round(3)
-#featrures temporales
-df_911["mes"] = df_911["fecha_dt"].dt.month
-df_911["dia"] = df_911["fecha_dt"].dt.day
-df_911["dia_semana"] = df_911["fecha_dt"].dt.dayofweek
-
-#targe ecu911 - conteo de llamadas por dia y zona
-df_group = (
-    df_911.groupby(["lat_grid", "lon_grid", "fecha_dt"])
-    .size()
-    .reset_index(name="conteo_llamadas_riesgo")
-)
-
-df_911 = df_911.merge(
-    df_group, 
-    on=["lat_grid", "lon_grid", "fecha_dt"], 
-    how="left"
-)
-
-# Guardar dataset limpio
-df_911.to_csv(nombre_datos_procesados, index=False)
-
-print("ECU911 procesado correctamente")
-print(f"Registros finales: {len(df_911)}")
+        if "servicio" in bloque.columns:
+            bloque = bloque[bloque["servicio"] == "Seguridad Ciudadana"]
+        if bloque.empty:
+            continue
+
+        # Búsqueda vectorizada del código en el catálogo (-1 si no existe)
+        posicion = codigos_catalogo.get_indexer(normalizar_cod_parroquia(bloque["cod_parroquia"]))
+        fechas = parsear_fechas(bloque["fecha"])
+
+        validos = (posicion >= 0) & ~fechas.isna()
+        if not validos.any():
+            continue
+
+        parciales.append(
+            pd.DataFrame({"parroquia": posicion[validos], "fecha_dt": fechas[validos]})
+            .groupby(["parroquia", "fecha_dt"])
+            .size()
+        )
+
+    if not parciales:
+        return pd.DataFrame({
+            "lat_grid": pd.Series(dtype="float64"),
+            "lon_grid": pd.Series(dtype="float64"),
+            "fecha_dt": pd.Series(dtype="datetime64[ns]"),
+            "conteo_llamadas_riesgo": pd.Series(dtype="int64")
+        })
+
+    conteos = pd.concat(parciales).groupby(level=["parroquia", "fecha_dt"]).sum()
+    parroquias = conteos.index.get_level_values("parroquia")
+
+    # Varias parroquias pueden caer en la misma celda del grid
+    return sumar_por_celda(
+        celdas_catalogo[parroquias],
+        conteos.index.get_level_values("fecha_dt"),
+        conteos.to_numpy()
+    )
+
+
+def sumar_por_celda(celdas, fechas, conteos):
+    # Agrupa por el id entero de la celda (no por lat/lon en float) y luego lo decodifica
+    df = (
+        pd.DataFrame({"celda": celdas, "fecha_dt": fechas, "conteo_llamadas_riesgo": conteos})
+        .groupby(["celda", "fecha_dt"], as_index=False)["conteo_llamadas_riesgo"]
+        .sum()
+    )
+    lat_grid, lon_grid = decodificar_celda(df["celda"].to_numpy())
+    return pd.DataFrame({
+        "lat_grid": lat_grid,
+        "lon_grid": lon_grid,
+        "fecha_dt": df["fecha_dt"],
+        "conteo_llamadas_riesgo": df["conteo_llamadas_riesgo"]
+    })
+
+
+def combinar_agregados(parciales):
+    if not parciales:
+        raise RuntimeError("No hay meses agregados que combinar (¿no hay CSV mensuales?)")
+    df_concat = pd.concat(parciales, ignore_index=True)
+    df_agregado = sumar_por_celda(
+        codificar_celda(df_concat["lat_grid"], df_concat["lon_grid"]),
+        df_concat["fecha_dt"],
+        df_concat["conteo_llamadas_riesgo"].to_numpy()
+    )
+    #featrures temporales
+    df_agregado["mes"] = df_agregado["fecha_dt"].dt.month
+    df_agregado["dia"] = df_agregado["fecha_dt"].dt.day
+    df_agregado["dia_semana"] = df_agregado["fecha_dt"].dt.dayofweek
+    return df_agregado[COLUMNAS_AGREGADO]
+
+
+def agregar_archivos(archivos, coordenadas, tamano_bloque=TAMANO_BLOQUE, workers=1):
+    """
+    Agrega cada CSV mensual, en serie o repartidos en un pool de procesos.
+
+    Los errores se reportan por archivo y no detienen al resto.
+
+    :return: generador de (archivo, DataFrame agregado) de los archivos procesados
+    """
+    if workers <= 1 or len(archivos) <= 1:
+        for archivo in archivos:
+            try:
+                yield archivo, agregar_archivo(archivo, coordenadas, tamano_bloque)
+            except Exception as e:
+                print(f"Error procesando {archivo}: {e}")
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(archivos))) as pool:
+        futuros = {
+            pool.submit(agregar_archivo, archivo, coordenadas, tamano_bloque): archivo
+            for archivo in archivos
+        }
+        for futuro in as_completed(futuros):
+            archivo = futuros[futuro]
+            try:
+                yield archivo, futuro.result()
+            except Exception as e:
+                print(f"Error procesando {archivo}: {e}")
+
+
+def procesar_streaming(archivos, tamano_bloque=TAMANO_BLOQUE, workers=1):
+    coordenadas = cargar_coordenadas_parroquias(catalogo_parroquias)
+    procesados = dict(agregar_archivos(archivos, coordenadas, tamano_bloque, workers))
+
+    # Como en el modo incremental, un mes que falla detiene el proceso en lugar de faltar en silencio
+    fallidos = [os.path.basename(archivo) for archivo in archivos if archivo not in procesados]
+    if fallidos:
+        raise RuntimeError(f"No se pudieron procesar los meses: {', '.join(sorted(fallidos))}")
+    return combinar_agregados(list(procesados.values()))
+
+
+# MODO INCREMENTAL (solo meses nuevos o modificados)
+
+def ruta_parcial(archivo):
+    nombre = os.path.splitext(os.path.basename(archivo))[0]
+    return os.path.join(ruta_parciales, f"{nombre}.csv")
+
+
+def procesar_incremental(archivos, tamano_bloque=TAMANO_BLOQUE, workers=1):
+    """
+    Agrega solo los CSV mensuales nuevos o modificados según el manifiesto y
+    reutiliza los parciales guardados del resto de meses.
+
+    Si un mes modificado falla se conserva su parcial anterior (y su entrada,
+    para reintentarlo en la próxima ejecución). Si falla un mes que no tenía
+    parcial, se lanza un error en lugar de omitirlo del resultado.
+    """
+    manifiesto = cargar_manifiesto(ruta_manifiesto)
+    entradas = manifiesto["entradas"]
+    os.makedirs(ruta_parciales, exist_ok=True)
+
+    # Si cambia el catálogo de parroquias cambian las coordenadas de todos los meses
+    huella_catalogo = huella_archivo(catalogo_parroquias, manifiesto.get("catalogo"))
+    catalogo_vigente = misma_huella(huella_catalogo, manifiesto.get("catalogo"))
+
+    vigentes = {}
+    pendientes = {}
+    for archivo in archivos:
+        nombre = os.path.basename(archivo)
+        anterior = entradas.get(nombre)
+        huella = huella_archivo(archivo, anterior)
+        huella["parcial"] = ruta_parcial(archivo)
+
+        if catalogo_vigente and misma_huella(huella, anterior) and os.path.exists(huella["parcial"]):
+            vigentes[nombre] = huella
+        else:
+            pendientes[archivo] = huella
+    reutilizados = len(vigentes)
+
+    if pendientes:
+        coordenadas = cargar_coordenadas_parroquias(catalogo_parroquias)
+        for archivo, df_mes in agregar_archivos(list(pendientes), coordenadas, tamano_bloque, workers):
+            huella = pendientes[archivo]
+            df_mes.to_csv(huella["parcial"], index=False)
+            vigentes[os.path.basename(archivo)] = huella
+            print(f"Mes procesado: {os.path.basename(archivo)}")
+
+    # Meses que fallaron: se mantiene el parcial anterior si existe
+    sin_datos, con_parcial_anterior = [], []
+    for archivo in pendientes:
+        nombre = os.path.basename(archivo)
+        if nombre in vigentes:
+            continue
+        anterior = entradas.get(nombre)
+        if anterior is not None and os.path.exists(anterior["parcial"]):
+            vigentes[nombre] = anterior
+            con_parcial_anterior.append(nombre)
+            print(f"AVISO: {nombre} falló; se usa su parcial anterior")
+        else:
+            sin_datos.append(nombre)
+
+    # Parciales de archivos que ya no existen
+    existentes = {os.path.basename(archivo) for archivo in archivos}
+    for nombre, entrada in entradas.items():
+        if nombre not in existentes and os.path.exists(entrada["parcial"]):
+            os.remove(entrada["parcial"])
+
+    # Con meses pendientes el catálogo no se da por aplicado: se reintentan con él
+    if not sin_datos and not con_parcial_anterior:
+        manifiesto["catalogo"] = huella_catalogo
+    manifiesto["entradas"] = vigentes
+    guardar_manifiesto(manifiesto, ruta_manifiesto)
+
+    if sin_datos:
+        raise RuntimeError(f"No se pudieron procesar los meses: {', '.join(sorted(sin_datos))}")
+
+    parciales = [
+        pd.read_csv(entrada["parcial"], parse_dates=["fecha_dt"])
+        for entrada in vigentes.values()
+    ]
+    print(f"Meses reutilizados: {reutilizados} de {len(vigentes)}")
+    return combinar_agregados(parciales)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Limpieza y unificación de los CSV mensuales del ECU911")
+    parser.add_argument(
+        "--streaming", action="store_true",
+        help="lee cada mes por bloques y guarda solo los conteos por celda y día"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="como --streaming, pero solo procesa los meses nuevos o modificados"
+    )
+    parser.add_argument("--tamano-bloque", type=int, default=TAMANO_BLOQUE)
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="procesos que agregan los CSV mensuales en paralelo (solo modos --streaming e --incremental)"
+    )
+    args = parser.parse_args(argv)
+    if args.workers is not None and not (args.streaming or args.incremental):
+        parser.error("--workers solo se usa con --streaming o --incremental")
+    args.workers = args.workers or 1
+
+    if args.streaming or args.incremental:
+        if args.incremental:
+            df_agregado = procesar_incremental(archivos_csv, args.tamano_bloque, args.workers)
+        else:
+            df_agregado = procesar_streaming(archivos_csv, args.tamano_bloque, args.workers)
+        df_agregado.to_csv(nombre_datos_agregados, index=False)
+        print("ECU911 agregado correctamente")
+        print(f"Celdas-día finales: {len(df_agregado)}")
+        print(f"Llamadas contabilizadas: {int(df_agregado['conteo_llamadas_riesgo'].sum())}")
+        return
+
+    df_911 = procesar_completo(archivos_csv)
+
+    # Guardar dataset limpio
+    df_911.to_csv(nombre_datos_procesados, index=False)
+
+    print("ECU911 procesado correctamente")
+    print(f"Registros finales: {len(df_911)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,301 @@
+import argparse
+import hashlib
 import pandas as pd
 import numpy as np
 import os
 
+from src.datos.columnar import ESQUEMA_ENTRENAMIENTO, guardar_columnar, ruta_columnar
+from src.datos.grid import CELDA_INVALIDA, buscar_celdas, codificar_celda, decodificar_celda
+from src.datos.historial import (
+    SENALES, actualizar_historial, cargar_historial, columnas_lag, construir_historial,
+    existe_historial, features_lag, guardar_historial
+)
+from src.datos.manifiesto import cargar_manifiesto, guardar_manifiesto
+
 #carga datasets
 ruta_padre = "data"
 ruta_procesados = os.path.join(ruta_padre, "processed")
 datos_aprehendidos = os.path.join(ruta_padre,"raw","detenidosaprehendidos", "aprehendidos_detenidos_raw.csv")
 datos_911 = os.path.join(ruta_padre,"raw", "ecu911" ,"ecu911_unificado.csv")
+datos_911_agregados = os.path.join(ruta_padre,"raw", "ecu911" ,"ecu911_agregado.csv")
 nombre_datos_procesados = os.path.join(ruta_procesados, "dataset_entrenamiento_final.csv")
+# historial celda × día del que salen las features de rezago (también lo usa la API)
+ruta_historial = os.path.join(ruta_procesados, "historial")
 
-df_apre = pd.read_csv(datos_aprehendidos)
-df_911 = pd.read_csv(datos_911)
-
-# Normalizacion de fechas
-df_911["fecha"] = pd.to_datetime(df_911["fecha_dt"], errors="coerce").dt.date
-df_apre["fecha"] = pd.to_datetime(df_apre["fecha_dt"], errors="coerce").dt.date
-
-df_apre = df_apre.rename(columns= {
-    "latitud": "lat_grid",
-    "longitud": "lon_grid"
-})
-
-#union de datasets por celdas 
-df_union = df_apre.merge(
-    df_911,
-    on=["lat_grid", "lon_grid", "fecha"],
-    how="outer",
-    suffixes=("_apre", "_911")
-)
-
-#Imputación de valores faltantes (NaN) en variables de conteo (Targets)
-for col in ["conteo_delitos", "conteo_delitos_graves", "conteo_llamadas_riesgo"]:
-    if col in df_union.columns:
-        df_union[col].fillna(0, inplace=True) #Imputación con cero
-    else:
-        df_union[col] = 0  # si no existe, la creamos
-
-#Ingeniería de Características Temporales
-
-if "mes" not in df_union.columns:
-    df_union["mes"] = pd.to_datetime(df_union["fecha"]).dt.month  #Extracción del mes
+# parciales mensuales del modo incremental
+ruta_parciales = os.path.join(ruta_procesados, "parciales")
+ruta_manifiesto = os.path.join(ruta_parciales, "manifiesto.json")
 
-if "dia" not in df_union.columns:
-    df_union["dia"] = pd.to_datetime(df_union["fecha"]).dt.day  #Extracción del dia del mes
 
-if "dia_semana" not in df_union.columns:
-    df_union["dia_semana"] = pd.to_datetime(df_union["fecha"]).dt.dayofweek   #Extracción del día de la semana
-    
+# Bits reservados para el día (días desde 1970) dentro de la clave (celda, día)
+BITS_DIA = 16
 
-# Eliminar franja_horaria porque no contiene datos importantes
-if "franja_horaria" in df_union.columns:
-    df_union.drop(columns=["franja_horaria"], inplace=True)
+# Palabras de presunta_infraccion que cuentan como delito grave
+INFRACCIONES_GRAVES = [
+    "ASESINATO", "HOMICIDIO", "FEMICIDIO", "SICARIATO", "SECUESTRO", "EXTORSIÓN", "ROBO", "ARMAS"
+]
 
-# features
-features = [
+COLUMNAS_DATASET = [
     "lat_grid", "lon_grid",
     "mes", "dia", "dia_semana",
-    "franja_horaria",
+    "dia_ordinal",
     "conteo_delitos",
     "conteo_delitos_graves",
     "conteo_llamadas_riesgo"
 ]
 
-# asegurarse de que las columnas existan
-features = [c for c in features if c in df_union.columns]
 
-df_final = df_union[features].copy()
+def ruta_fuente_911(fuente="auto"):
+    """
+    Archivo del ECU911 a usar: el agregado (modos streaming/incremental) o el unificado.
+
+    :param fuente: "agregado", "unificado" o "auto" (el más reciente de los que existan,
+                   para no entrenar con un agregado viejo tras una corrida completa)
+    """
+    if fuente == "agregado":
+        return datos_911_agregados
+    if fuente == "unificado":
+        return datos_911
+    existentes = [ruta for ruta in (datos_911_agregados, datos_911) if os.path.exists(ruta)]
+    if not existentes:
+        return datos_911
+    return max(existentes, key=os.path.getmtime)
+
+
+def cargar_fuentes(fuente="auto"):
+    df_apre = pd.read_csv(
+        datos_aprehendidos,
+        usecols=["fecha_dt", "latitud", "longitud", "presunta_infraccion"]
+    )
+    ruta_911 = ruta_fuente_911(fuente)
+    print(f"ECU911 de entrada ({fuente}):", ruta_911)
+    df_911 = pd.read_csv(ruta_911, usecols=["lat_grid", "lon_grid", "fecha_dt", "conteo_llamadas_riesgo"])
+
+    # Normalizacion de fechas (día, sin hora)
+    df_911["fecha"] = pd.to_datetime(df_911["fecha_dt"], errors="coerce").dt.normalize()
+    df_apre["fecha"] = pd.to_datetime(df_apre["fecha_dt"], errors="coerce").dt.normalize()
+
+    df_apre = df_apre.rename(columns= {
+        "latitud": "lat_grid",
+        "longitud": "lon_grid"
+    })
+    return df_apre, df_911
+
+
+def claves_celda_dia(df):
+    """
+    Lleva cada fila a una clave entera (celda, día).
+
+    La celda es el id entero del grid (src/datos/grid.py), así las coordenadas
+    sin redondear de detenidos caen en las mismas celdas que el ECU911.
+
+    :return: (array int64 de claves, máscara de filas válidas)
+    """
+    celda = codificar_celda(df["lat_grid"], df["lon_grid"])
+    fechas = df["fecha"].to_numpy("datetime64[D]")
+    validos = (celda != CELDA_INVALIDA) & ~np.isnat(fechas)
+
+    ordinal = fechas[validos].astype(np.int64)
+    return (celda[validos] << BITS_DIA) | ordinal, validos
+
+
+def es_grave(infracciones):
+    # Se evalúan solo los valores distintos (unas decenas) y luego se expanden
+    codigos, unicos = pd.factorize(infracciones)
+    patron = "|".join(INFRACCIONES_GRAVES)
+    graves = pd.Series(unicos, dtype=object).astype(str).str.upper().str.contains(patron, regex=True)
+    # El código -1 (infracción vacía) apunta al False agregado al final
+    return np.append(graves.to_numpy(bool), False)[codigos]
+
+
+def conteos_celda_dia(df_apre, df_911):
+    """
+    Conteos de detenidos y de llamadas del ECU911 por clave entera (celda, día).
+
+    Cada fuente se agrega primero a sus claves y las dos tablas compactas se
+    unen con un merge ordenado sobre esas claves.
+
+    :return: DataFrame indexado por la clave, ordenado
+    """
+    # Detenidos: cada fila es una detención
+    claves_apre, validos_apre = claves_celda_dia(df_apre)
+    conteos_apre = pd.DataFrame({
+        "clave": claves_apre,
+        "conteo_delitos": 1,
+        "conteo_delitos_graves": es_grave(df_apre["presunta_infraccion"].to_numpy()[validos_apre]),
+    }).groupby("clave").sum()
+
+    # ECU911: el agregado ya trae una fila por celda y día; el unificado repite el
+    # conteo de la celda en cada llamada, por eso se toma el máximo y no la suma
+    claves_911, validos_911 = claves_celda_dia(df_911)
+    conteos_911 = pd.DataFrame({
+        "clave": claves_911,
+        "conteo_llamadas_riesgo": df_911["conteo_llamadas_riesgo"].to_numpy()[validos_911],
+    }).groupby("clave").max()
+
+    # groupby deja ambos índices ordenados: la unión es un merge ordenado de enteros
+    return conteos_apre.join(conteos_911, how="outer").fillna(0)
+
+
+def separar_claves(claves):
+    # clave (celda, día) -> (ids de celda, días desde 1970)
+    claves = np.asarray(claves, dtype=np.int64)
+    return claves >> BITS_DIA, claves & ((1 << BITS_DIA) - 1)
+
+
+def historial_desde_conteos(df_union):
+    celdas, ordinales = separar_claves(df_union.index)
+    return construir_historial(
+        celdas, ordinales, {senal: df_union[col].to_numpy() for senal, col in SENALES.items()}
+    )
+
+
+def dataset_desde_conteos(df_union, historial=None):
+    """
+    Una fila por (celda, día) con los conteos y, si hay historial, las features de rezago.
+    """
+    celdas, ordinales = separar_claves(df_union.index)
+    lat_grid, lon_grid = decodificar_celda(celdas)
+    fechas = pd.DatetimeIndex(ordinales.astype("datetime64[D]"))
+
+    df_final = pd.DataFrame({
+        "lat_grid": lat_grid,
+        "lon_grid": lon_grid,
+        "mes": fechas.month,
+        "dia": fechas.day,
+        "dia_semana": fechas.dayofweek,
+        "dia_ordinal": ordinales,
+        "conteo_delitos": df_union["conteo_delitos"].to_numpy(np.int64),
+        "conteo_delitos_graves": df_union["conteo_delitos_graves"].to_numpy(np.int64),
+        "conteo_llamadas_riesgo": df_union["conteo_llamadas_riesgo"].to_numpy(np.int64),
+    })
+    if historial is None:
+        return df_final[COLUMNAS_DATASET]
+
+    # Solo cuentan los días previos a cada fila: el conteo del propio día no se filtra
+    lags = features_lag(historial, ordinales, buscar_celdas(historial["celdas"], celdas))
+    for col, valores in lags.items():
+        df_final[col] = valores
+    return df_final[COLUMNAS_DATASET + columnas_lag()]
+
+
+def construir_dataset(df_apre, df_911, historial=None):
+    return dataset_desde_conteos(conteos_celda_dia(df_apre, df_911), historial)
+
+# MODO INCREMENTAL
+
+def periodos(df):
+    # Mes calendario (AAAA-MM) de cada fila; la unión nunca cruza meses
+    return pd.to_datetime(df["fecha"]).dt.strftime("%Y-%m")
+
+
+def huella_periodo(df_apre_mes, df_911_mes):
+    sha = hashlib.sha256()
+    for df in (df_apre_mes, df_911_mes):
+        sha.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+def construir_incremental(df_apre, df_911):
+    """
+    Construye el dataset por meses reutilizando los parciales de los meses
+    cuyas filas de entrada no cambiaron desde la última ejecución.
+
+    El historial se actualiza solo con los días de los meses reconstruidos.
+    Como las features de rezago miran hasta 28 días atrás, el mes siguiente
+    a uno reconstruido también se reconstruye.
+    """
+    manifiesto = cargar_manifiesto(ruta_manifiesto)
+    entradas = manifiesto["entradas"]
+    os.makedirs(ruta_parciales, exist_ok=True)
+
+    historial = cargar_historial(ruta_historial, mmap=False) if existe_historial(ruta_historial) else None
+    # Sin historial, o si cambiaron las columnas, no sirve ningún parcial anterior
+    reconstruir = historial is None or manifiesto.get("columnas") != COLUMNAS_DATASET + columnas_lag()
+
+    grupos_apre = dict(tuple(df_apre.groupby(periodos(df_apre))))
+    grupos_911 = dict(tuple(df_911.groupby(periodos(df_911))))
+
+    vigentes = {}
+    parciales = []
+    for periodo in sorted(set(grupos_apre) | set(grupos_911)):
+        df_apre_mes = grupos_apre.get(periodo, df_apre.iloc[:0])
+        df_911_mes = grupos_911.get(periodo, df_911.iloc[:0])
+        huella = huella_periodo(df_apre_mes, df_911_mes)
+        ruta_parcial = os.path.join(ruta_parciales, f"{periodo}.csv")
+
+        entrada = entradas.get(periodo)
+        reutilizable = (
+            not reconstruir and entrada is not None and entrada["sha256"] == huella
+            and os.path.exists(ruta_parcial)
+        )
+        if reutilizable:
+            df_mes = pd.read_csv(ruta_parcial)
+        else:
+            df_union = conteos_celda_dia(df_apre_mes, df_911_mes)
+            mes = pd.Period(periodo, freq="M")
+            historial = actualizar_historial(
+                historial, historial_desde_conteos(df_union),
+                int(mes.start_time.to_datetime64().astype("datetime64[D]").astype(np.int64)),
+                int(mes.end_time.to_datetime64().astype("datetime64[D]").astype(np.int64))
+            )
+            df_mes = dataset_desde_conteos(df_union, historial)
+            df_mes.to_csv(ruta_parcial, index=False)
+            print(f"Mes reconstruido: {periodo} ({len(df_mes)} registros)")
+        # El mes siguiente mira los días de este en sus features de rezago
+        reconstruir = not reutilizable
+
+        vigentes[periodo] = {"sha256": huella, "parcial": ruta_parcial, "registros": len(df_mes)}
+        parciales.append(df_mes)
+
+    # Parciales de meses que ya no aparecen en las fuentes
+    for periodo, entrada in entradas.items():
+        if periodo not in vigentes and os.path.exists(entrada["parcial"]):
+            os.remove(entrada["parcial"])
+
+    if historial is not None:
+        guardar_historial(historial, ruta_historial)
+    manifiesto["entradas"] = vigentes
+    manifiesto["columnas"] = COLUMNAS_DATASET + columnas_lag()
+    guardar_manifiesto(manifiesto, ruta_manifiesto)
+    return pd.concat(parciales, ignore_index=True)
+
+
+def guardar_dataset(df_final):
+    # guardar dataset final
+    df_final.to_csv(nombre_datos_procesados, index=False)
+    print("dataset de entramiento guardado: dataset_entranamiento_final.csv")
+
+    # version columnar con tipos angostos, mapeable en memoria por la API y el entrenamiento
+    guardar_columnar(df_final, ruta_columnar(nombre_datos_procesados), ESQUEMA_ENTRENAMIENTO)
+    print("dataset columnar guardado en:", ruta_columnar(nombre_datos_procesados))
+    print("Registros totales:", len(df_final))
+    print("Columnas:", df_final.columns.tolist())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Construcción del dataset de entrenamiento")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="reconstruye solo los meses cuyas entradas cambiaron desde la última ejecución"
+    )
+    parser.add_argument(
+        "--fuente", choices=["auto", "agregado", "unificado"], default="auto",
+        help="ECU911 de entrada: ecu911_agregado.csv, ecu911_unificado.csv o el más reciente (auto)"
+    )
+    args = parser.parse_args(argv)
+
+    df_apre, df_911 = cargar_fuentes(args.fuente)
+    if args.incremental:
+        df_final = construir_incremental(df_apre, df_911)
+    else:
+        df_union = conteos_celda_dia(df_apre, df_911)
+        historial = historial_desde_conteos(df_union)
+        guardar_historial(historial, ruta_historial)
+        df_final = dataset_desde_conteos(df_union, historial)
+    print("historial guardado en:", ruta_historial)
+    guardar_dataset(df_final)
+
 
-# guardar dataset final
-df_final.to_csv(nombre_datos_procesados, index=False)
-print("dataset de entramiento guardado: dataset_entranamiento_final.csv")
-print("Registros totales:", len(df_final))
-print("Columnas:", df_final.columns.tolist())
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import os
 import numpy as np
 import pandas as pd
@@ -6,6 +7,129 @@ import seaborn as sns
 from sklearn.cluster import DBSCAN
 import joblib
 
+from src.clustering.dbscan_escalable import (
+    KMS_POR_RADIAN, agrupar_celdas, dbscan_particionado, dbscan_ponderado
+)
+from src.datos.diagnostico import guardar_diagnostico
+
+# Bloques horarios: [0, 6), [6, 12), [12, 18) y [18, 24)
+BLOQUES_HORARIOS = ['1. Madrugada', '2. Mañana', '3. Tarde', '4. Noche']
+LIMITES_BLOQUES = [6, 12, 18]
+
+# Delitos más comunes que se guardan en cada perfil
+TOP_DELITOS = 5
+
+
+def histograma_por_cluster(grupos, valores, n_grupos, n_valores):
+    """
+    Conteos (cluster, valor) con un solo bincount.
+
+    :param grupos: posición del cluster de cada registro (0..n_grupos-1)
+    :param valores: código entero de cada registro (0..n_valores-1); negativos se ignoran
+    :return: array (n_grupos, n_valores)
+    """
+    validos = valores >= 0
+    claves = grupos[validos].astype(np.int64) * n_valores + valores[validos]
+    return np.bincount(claves, minlength=n_grupos * n_valores).reshape(n_grupos, n_valores)
+
+
+def top_por_cluster(grupos, serie, n_grupos, k):
+    """
+    Las k categorías más frecuentes de `serie` en cada cluster.
+
+    Los empates se resuelven en orden alfabético, igual que `mode()[0]`.
+
+    :return: lista por cluster de [(categoría, conteo), ...] de mayor a menor
+    """
+    codigos, categorias = pd.factorize(serie, sort=True)
+    validos = codigos >= 0
+    n_categorias = max(len(categorias), 1)
+    claves, conteos = np.unique(
+        grupos[validos].astype(np.int64) * n_categorias + codigos[validos], return_counts=True
+    )
+    grupo, categoria = np.divmod(claves, n_categorias)
+
+    # Ordenado por cluster y, dentro de cada uno, por conteo descendente
+    orden = np.lexsort((categoria, -conteos, grupo))
+    grupo, categoria, conteos = grupo[orden], categoria[orden], conteos[orden]
+    rango = np.arange(len(grupo)) - np.searchsorted(grupo, grupo, side='left')
+    seleccion = rango < k
+
+    top = [[] for _ in range(n_grupos)]
+    for g, c, n in zip(grupo[seleccion], categoria[seleccion], conteos[seleccion]):
+        top[g].append((categorias[c], int(n)))
+    return top
+
+
+def perfilar_clusters(df_clusters, k=TOP_DELITOS):
+    """
+    Perfiles de todos los clusters en una sola pasada sobre los registros.
+
+    :param df_clusters: registros asignados a un cluster (sin ruido)
+    :return: dict cluster_id -> perfil, con el resumen que usa la API
+             (delito_top, ubicacion_top, hora, latitud, longitud,
+             total_detenciones) más los histogramas por hora, día de la
+             semana y bloque horario y los k delitos más comunes
+    """
+    ids, grupos = np.unique(df_clusters['cluster'].to_numpy(), return_inverse=True)
+    n = len(ids)
+
+    total = np.bincount(grupos, minlength=n)
+    latitud = np.bincount(grupos, weights=df_clusters['latitud'].to_numpy(float), minlength=n) / total
+    longitud = np.bincount(grupos, weights=df_clusters['longitud'].to_numpy(float), minlength=n) / total
+
+    horas = df_clusters['hora'].to_numpy(float)
+    con_hora = ~np.isnan(horas)
+    codigos_hora = np.where(con_hora, np.nan_to_num(horas), -1).astype(np.int64)
+    codigos_bloque = np.where(con_hora, np.digitize(np.nan_to_num(horas), LIMITES_BLOQUES), -1)
+    dias = df_clusters['dia_semana'].to_numpy(float)
+    codigos_dia = np.where(np.isnan(dias), -1, np.nan_to_num(dias)).astype(np.int64)
+
+    histograma_horas = histograma_por_cluster(grupos, codigos_hora, n, 24)
+    histograma_dias = histograma_por_cluster(grupos, codigos_dia, n, 7)
+    bloques = histograma_por_cluster(grupos, codigos_bloque, n, len(BLOQUES_HORARIOS))
+    # Hora promedio a partir del histograma (registros con hora conocida)
+    con_registros = np.maximum(histograma_horas.sum(axis=1), 1)
+    hora_media = histograma_horas @ np.arange(24) / con_registros
+
+    top_delitos = top_por_cluster(grupos, df_clusters['presunta_infraccion'], n, k)
+    top_cantones = top_por_cluster(grupos, df_clusters['nombre_canton'], n, 1)
+
+    perfiles = {}
+    for i, cid in enumerate(ids.tolist()):
+        perfiles[cid] = {
+            'delito_top': top_delitos[i][0][0] if top_delitos[i] else None,   # Delito más común
+            'ubicacion_top': top_cantones[i][0][0] if top_cantones[i] else None,  # Cantón principal
+            'hora': float(hora_media[i]),                                     # Hora promedio
+            'latitud': float(latitud[i]),                                     # Centro Y
+            'longitud': float(longitud[i]),                                   # Centro X
+            'total_detenciones': int(total[i]),
+            'hora_pico': int(histograma_horas[i].argmax()),
+            'histograma_horas': histograma_horas[i].tolist(),
+            'histograma_dias': histograma_dias[i].tolist(),
+            'bloques_horarios': dict(zip(BLOQUES_HORARIOS, bloques[i].tolist())),
+            'top_delitos': [[delito, conteo] for delito, conteo in top_delitos[i]],
+        }
+    return perfiles
+
+# --- Opciones ---
+# parse_known_args: el script también se ejecuta con runpy desde los benchmarks
+parser = argparse.ArgumentParser(description="Clustering DBSCAN de detenciones", allow_abbrev=False)
+parser.add_argument(
+    "--modo", choices=["celdas", "puntos"], default="celdas",
+    help="celdas: junta coordenadas repetidas en celdas con peso (por defecto); puntos: DBSCAN sobre cada registro"
+)
+parser.add_argument(
+    "--decimales-celda", type=int, default=5,
+    help="decimales de lat/lon de las celdas (5 ~ 1 m)"
+)
+parser.add_argument(
+    "--particionar", action="store_true",
+    help="ajusta cada provincia en paralelo (con halo de eps) y une los clusters"
+)
+parser.add_argument("--hilos-dbscan", type=int, default=-1, help="procesos/hilos del DBSCAN (-1 = todos)")
+args, _ = parser.parse_known_args()
+
 # --- Carga de Archivo ---
 ruta_entrada = os.path.join(
     "data",
@@ -14,7 +138,9 @@ ruta_entrada = os.path.join(
     "aprehendidos_detenidos_raw.csv"
 )
 
-df = pd.read_csv(ruta_entrada)
+df = pd.read_csv(ruta_entrada, usecols=[
+    'fecha_dt', 'latitud', 'longitud', 'nombre_provincia', 'nombre_canton', 'presunta_infraccion'
+])
 
 # Conversion de tipo de dato
 df['fecha_dt'] = pd.to_datetime(df['fecha_dt'])
@@ -44,31 +170,37 @@ print(f"Registros limpios: {len(df_clean)}")
 
 
 # --- Clustering ---
-coords = df_clean[['latitud', 'longitud']]
-coords_rad = np.radians(coords)
-
-kms_per_radian = 6371.0088
-epsilon = 0.5 / kms_per_radian  # Radio de 500 metros (0.5 km)
-
-db = DBSCAN(eps=epsilon, min_samples=10, algorithm='ball_tree', metric='haversine')
-
-df_clean['cluster'] = db.fit_predict(coords_rad)
+epsilon = 0.5 / KMS_POR_RADIAN  # Radio de 500 metros (0.5 km)
+min_samples = 10
+
+if args.modo == "puntos":
+    coords_rad = np.radians(df_clean[['latitud', 'longitud']])
+    db = DBSCAN(eps=epsilon, min_samples=min_samples, algorithm='ball_tree', metric='haversine',
+                n_jobs=args.hilos_dbscan)
+    df_clean['cluster'] = db.fit_predict(coords_rad)
+else:
+    # Las coordenadas repetidas se agrupan en celdas: el peso de cada celda
+    # cuenta como sus registros, así que eps y min_samples no cambian
+    coords_rad, pesos, celda = agrupar_celdas(
+        df_clean['latitud'].to_numpy(), df_clean['longitud'].to_numpy(), args.decimales_celda
+    )
+    print(f"Celdas únicas: {len(coords_rad)}")
+    if args.particionar:
+        # Provincia de cada celda: la de su primer registro
+        provincia = np.empty(len(coords_rad), dtype=object)
+        provincia[celda[::-1]] = df_clean['nombre_provincia'].to_numpy()[::-1]
+        db = dbscan_particionado(coords_rad, pesos, provincia, epsilon, min_samples, n_jobs=args.hilos_dbscan)
+    else:
+        db = dbscan_ponderado(coords_rad, pesos, epsilon, min_samples, n_jobs=args.hilos_dbscan)
+    df_clean['cluster'] = db.labels_[celda]
 
 # Verificar cuántos clusters salieron (excluyendo el -1 que es ruido)
 n_clusters = len(set(df_clean['cluster'])) - (1 if -1 in df_clean['cluster'] else 0)
 print(f"Número de clusters encontrados: {n_clusters}")
 
-# Resumen del cluster
-resumen_estrategico = df_clean[df_clean['cluster'] != -1].groupby('cluster').agg({
-    'presunta_infraccion': lambda x: x.mode()[0], # Delito más común
-    'nombre_canton': lambda x: x.mode()[0],       # Cantón principal
-    'hora': 'mean',                               # Hora promedio
-    'latitud': 'mean',                            # Centro Y
-    'longitud': 'mean'                            # Centro X
-}).rename(columns={'presunta_infraccion': 'delito_top', 'nombre_canton': 'ubicacion_top'})
-
-# Conteo de registros
-resumen_estrategico['total_detenciones'] = df_clean['cluster'].value_counts()
+# Resumen del cluster: perfiles de todos los clusters en una sola pasada
+perfiles_clusters = perfilar_clusters(df_clean[df_clean['cluster'] != -1])
+resumen_estrategico = pd.DataFrame.from_dict(perfiles_clusters, orient='index')
 
 
 
@@ -76,12 +208,12 @@ resumen_estrategico['total_detenciones'] = df_clean['cluster'].value_counts()
 # --- Visualizacion ---
 
 # Obtención de los ID de los 10 cluster más grandes
-top_10_clusters_ids = df_clean[df_clean['cluster'] != -1]['cluster'].value_counts().nlargest(10).index
+top_10_clusters_ids = resumen_estrategico['total_detenciones'].nlargest(10).index
 
 # Gráfico de Dispersión - Todos los clusters
 
-# Calculo de los centroides para los 10 cluster
-centros_top = df_clean[df_clean['cluster'].isin(top_10_clusters_ids)].groupby('cluster')[['latitud', 'longitud']].mean()
+# Centroides de los 10 cluster (ya calculados en los perfiles)
+centros_top = resumen_estrategico.loc[top_10_clusters_ids, ['latitud', 'longitud']]
 
 plt.figure(figsize=(14, 10))
 
@@ -130,35 +262,14 @@ print("Gráfico de Zonas Prioritarias guardado!")
 
 # Mapa de Calor - 10 Clusters más grandes por Bloque Horario
 
-# Categorias de tiempo
-def categorizar_hora(h):
-    if 0 <= h < 6: return '1. Madrugada'
-    elif 6 <= h < 12: return '2. Mañana'
-    elif 12 <= h < 18: return '3. Tarde'
-    else: return '4. Noche'
-
-df_clean['bloque_horario'] = df_clean['hora'].apply(categorizar_hora)
-
-# Mapeo de ID del cluster con el nombre del cantón mediante la moda
-mapeo_nombres = {}
-for cid in top_10_clusters_ids:
-    nombre = df_clean[df_clean['cluster'] == cid]['nombre_canton'].mode()[0]
-    mapeo_nombres[cid] = f"{nombre} (C-{cid})"
-
-# Preparacion de los datos
-df_top = df_clean[df_clean['cluster'].isin(top_10_clusters_ids)].copy()
-df_top['canton_ordenado'] = df_top['cluster'].map(mapeo_nombres)
-
-# Generación de la tabla cruzada
-resumen_temporal = pd.crosstab(
-    df_top['canton_ordenado'], 
-    df_top['bloque_horario'], 
-    normalize='index'
-) * 100
-
-# Reordenamiento según el tamaño del cluster
-orden_final = [mapeo_nombres[cid] for cid in top_10_clusters_ids]
-resumen_temporal = resumen_temporal.reindex(orden_final)
+# Porcentaje por bloque horario de cada cluster, desde los conteos de los perfiles
+# (filas ordenadas según el tamaño del cluster)
+bloques_top = pd.DataFrame(
+    [perfiles_clusters[cid]['bloques_horarios'] for cid in top_10_clusters_ids],
+    index=[f"{perfiles_clusters[cid]['ubicacion_top']} (C-{cid})" for cid in top_10_clusters_ids],
+    columns=BLOQUES_HORARIOS
+)
+resumen_temporal = bloques_top.div(bloques_top.sum(axis=1).clip(lower=1), axis=0) * 100
 
 plt.figure(figsize=(12, 9))
 sns.heatmap(resumen_temporal, annot=True, fmt=".1f", cmap="YlOrRd", 
@@ -186,6 +297,7 @@ print("Gráfico de Perfil Temporal guardado!")
 # --- Artefactos ---
 ruta_modelo = os.path.join("model", "modelo_dbscan_detenciones.joblib")
 ruta_perfiles = os.path.join("model", "perfiles_clusters_detenciones.joblib")
+ruta_diagnostico = os.path.join("model", "diagnostico_detenciones")
 
 os.makedirs(os.path.dirname(ruta_modelo), exist_ok=True)
 
@@ -194,6 +306,15 @@ joblib.dump(db, ruta_modelo)
 print("Modelo DBSCAN guardado exitosamente.")
 
 # Guardado del resument estrategico
-perfiles_clusters = resumen_estrategico.to_dict(orient='index')
 joblib.dump(perfiles_clusters, ruta_perfiles)
-print("Perfiles de los Clusters guardado exitosamente.")
\ No newline at end of file
+print("Perfiles de los Clusters guardado exitosamente.")
+
+# Artefacto compacto para la API: solo puntos core, sus etiquetas, eps y perfiles
+guardar_diagnostico(
+    ruta_diagnostico,
+    db.components_,
+    db.labels_[db.core_sample_indices_],
+    db.eps,
+    perfiles_clusters
+)
+print("Artefacto de diagnóstico guardado exitosamente.")
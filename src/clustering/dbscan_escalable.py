@@ -0,0 +1,190 @@
+# DBSCAN (haversine) sobre celdas ponderadas, opcionalmente por particiones con halo
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import DBSCAN
+
+KMS_POR_RADIAN = 6371.0088
+
+
+class ModeloDBSCAN:
+    """
+    Resultado de un DBSCAN con los mismos atributos que usa el resto del
+    proyecto de sklearn.cluster.DBSCAN (eps, min_samples, components_,
+    core_sample_indices_ y labels_), a nivel de celda.
+    """
+
+    def __init__(self, eps, min_samples, coordenadas, pesos, etiquetas, es_core):
+        self.eps = eps
+        self.min_samples = min_samples
+        self.pesos_ = pesos
+        self.labels_ = etiquetas
+        self.core_sample_indices_ = np.flatnonzero(es_core)
+        self.components_ = coordenadas[self.core_sample_indices_]
+
+
+def agrupar_celdas(lat, lon, decimales=5):
+    """
+    Junta las coordenadas repetidas (o casi, a `decimales` decimales) en celdas con peso.
+
+    Con 5 decimales (~1 m) el resultado del DBSCAN es el mismo que con los
+    puntos originales salvo vecinos a menos de un metro del borde de eps.
+
+    :return: (coordenadas (celdas, 2) en radianes, pesos, celda de cada punto original)
+    """
+    escala = 10.0 ** decimales
+    filas = np.rint(np.asarray(lat, dtype=np.float64) * escala).astype(np.int64)
+    columnas = np.rint(np.asarray(lon, dtype=np.float64) * escala).astype(np.int64)
+    columnas -= columnas.min(initial=0)
+    claves = filas * (columnas.max(initial=0) + 1) + columnas
+
+    _, primero, inversa, pesos = np.unique(claves, return_index=True, return_inverse=True, return_counts=True)
+    coordenadas = np.radians(np.column_stack([
+        np.rint(np.asarray(lat, dtype=np.float64)[primero] * escala) / escala,
+        np.rint(np.asarray(lon, dtype=np.float64)[primero] * escala) / escala,
+    ]))
+    return coordenadas, pesos, inversa.reshape(-1)
+
+
+def _ajustar(coordenadas, pesos, eps, min_samples, n_jobs=None):
+    db = DBSCAN(eps=eps, min_samples=min_samples, algorithm='ball_tree', metric='haversine', n_jobs=n_jobs)
+    db.fit(coordenadas, sample_weight=pesos)
+    es_core = np.zeros(len(coordenadas), dtype=bool)
+    es_core[db.core_sample_indices_] = True
+    return db.labels_, es_core
+
+
+def dbscan_ponderado(coordenadas, pesos, eps, min_samples, n_jobs=-1):
+    """DBSCAN sobre todas las celdas a la vez; `pesos` cuenta como puntos repetidos."""
+    etiquetas, es_core = _ajustar(coordenadas, pesos, eps, min_samples, n_jobs)
+    return ModeloDBSCAN(eps, min_samples, coordenadas, pesos, etiquetas, es_core)
+
+
+def particiones_con_halo(coordenadas, particiones, eps):
+    """
+    Índices de celdas de cada partición: primero las propias y luego el halo.
+
+    El halo son las celdas de otras particiones en los bloques vecinos de
+    las propias; los bloques miden al menos eps, así que incluye todo punto
+    a menos de eps de una celda propia.
+
+    :return: lista de (índices, cantidad de propias)
+    """
+    cos_min = np.cos(min(np.abs(coordenadas[:, 0]).max(initial=0) + eps, np.pi / 2 - eps))
+    lado = np.array([eps, eps / cos_min]) * 1.01
+    bloques = np.floor(coordenadas / lado).astype(np.int64)
+    bloques -= bloques.min(axis=0) - 1
+    ancho = bloques[:, 1].max(initial=0) + 2
+    claves = bloques[:, 0] * ancho + bloques[:, 1]
+    desplazamientos = np.array([dy * ancho + dx for dy in (-1, 0, 1) for dx in (-1, 0, 1)])
+
+    # Las celdas sin partición (NaN) forman una partición más
+    codigos, _ = pd.factorize(particiones, use_na_sentinel=False)
+    tareas = []
+    for p in range(codigos.max(initial=-1) + 1):
+        propias = np.flatnonzero(codigos == p)
+        alcance = np.unique(claves[propias][:, None] + desplazamientos[None, :])
+        halo = np.flatnonzero(np.isin(claves, alcance) & (codigos != p))
+        tareas.append((np.concatenate([propias, halo]), len(propias)))
+    return tareas
+
+
+def dbscan_particionado(coordenadas, pesos, particiones, eps, min_samples, n_jobs=-1):
+    """
+    DBSCAN por partición (p. ej. provincia) en paralelo, unido en un solo resultado.
+
+    Cada partición se ajusta con sus celdas más el halo. Una celda es core
+    según su propia partición (ahí ve todos sus vecinos), y dos clusters de
+    particiones distintas se unen cuando comparten una celda core. Las
+    celdas borde toman el cluster de cualquier partición que las alcance.
+    El resultado coincide con dbscan_ponderado salvo la numeración de los
+    clusters y, como en DBSCAN, el cluster de bordes alcanzables desde dos.
+
+    :param particiones: etiqueta de partición de cada celda
+    """
+    n = len(coordenadas)
+    tareas = particiones_con_halo(coordenadas, particiones, eps)
+    resultados = Parallel(n_jobs=n_jobs)(
+        delayed(_ajustar)(coordenadas[indices], pesos[indices], eps, min_samples)
+        for indices, _ in tareas
+    )
+
+    # Cada (partición, cluster local) es un nodo: base[p] + etiqueta
+    base = np.cumsum([0] + [etiquetas.max(initial=-1) + 1 for etiquetas, _ in resultados])
+    es_core = np.zeros(n, dtype=bool)
+    nodo = np.full(n, -1, dtype=np.int64)
+    for p, ((indices, n_propias), (etiquetas, core)) in enumerate(zip(tareas, resultados)):
+        propias = indices[:n_propias]
+        es_core[propias] = core[:n_propias]
+        nodo[propias] = np.where(etiquetas[:n_propias] >= 0, etiquetas[:n_propias] + base[p], -1)
+
+    # Celdas del halo alcanzadas en otra partición: uniones (si son core) o bordes
+    origen, destino = [], []
+    bordes, nodos_borde = [], []
+    for p, ((indices, n_propias), (etiquetas, _)) in enumerate(zip(tareas, resultados)):
+        halo, etiquetas_halo = indices[n_propias:], etiquetas[n_propias:]
+        alcanzadas = etiquetas_halo >= 0
+        core_halo = alcanzadas & es_core[halo]
+        origen.append(etiquetas_halo[core_halo] + base[p])
+        destino.append(nodo[halo[core_halo]])
+        borde = alcanzadas & ~es_core[halo]
+        bordes.append(halo[borde])
+        nodos_borde.append(etiquetas_halo[borde] + base[p])
+
+    origen, destino = np.concatenate(origen), np.concatenate(destino)
+    grafo = coo_matrix((np.ones(len(origen)), (origen, destino)), shape=(base[-1], base[-1]))
+    _, componente = connected_components(grafo, directed=False)
+
+    sin_cluster = nodo < 0
+    bordes, nodos_borde = np.concatenate(bordes), np.concatenate(nodos_borde)
+    libres = sin_cluster[bordes]
+    nodo[bordes[libres]] = nodos_borde[libres]
+
+    etiquetas = np.full(n, -1, dtype=np.int64)
+    asignadas = nodo >= 0
+    etiquetas[asignadas] = componente[nodo[asignadas]]
+    return ModeloDBSCAN(eps, min_samples, coordenadas, pesos, numerar(etiquetas), es_core)
+
+
+def numerar(etiquetas):
+    # Renumera los clusters 0..k-1 por orden de aparición (-1 sigue siendo ruido)
+    etiquetas = etiquetas.copy()
+    validas = etiquetas >= 0
+    unicas, primera = np.unique(etiquetas[validas], return_index=True)
+    rango = np.empty(len(unicas), dtype=np.int64)
+    rango[np.argsort(primera)] = np.arange(len(unicas))
+    etiquetas[validas] = rango[np.searchsorted(unicas, etiquetas[validas])]
+    return etiquetas
+
+
+if __name__ == "__main__":
+    # Verificación: celdas ponderadas y particiones dan los mismos clusters que el DBSCAN original
+    rng = np.random.default_rng(0)
+    focos = rng.uniform([-3.0, -80.5], [0.5, -78.0], size=(40, 2))
+    foco = rng.integers(0, len(focos), size=6000)
+    lat = np.round(focos[foco, 0] + rng.normal(0, 0.004, size=len(foco)), 4)
+    lon = np.round(focos[foco, 1] + rng.normal(0, 0.004, size=len(foco)), 4)
+    eps = 0.5 / KMS_POR_RADIAN
+
+    original = DBSCAN(eps=eps, min_samples=10, algorithm='ball_tree', metric='haversine')
+    original.fit(np.radians(np.column_stack([lat, lon])))
+
+    coordenadas, pesos, inversa = agrupar_celdas(lat, lon)
+    ponderado = dbscan_ponderado(coordenadas, pesos, eps, 10)
+    # Particiones artificiales por franja de longitud (cortan clusters a propósito)
+    particionado = dbscan_particionado(coordenadas, pesos, np.floor(np.degrees(coordenadas[:, 1]) * 4), eps, 10)
+
+    def mismas_particiones(a, b, core):
+        # Igualdad salvo renumeración, comparando solo puntos core (los bordes pueden variar)
+        pares = np.unique(np.column_stack([a[core], b[core]]), axis=0)
+        return len(pares) == len(np.unique(pares[:, 0])) == len(np.unique(pares[:, 1]))
+
+    core = np.zeros(len(lat), dtype=bool)
+    core[original.core_sample_indices_] = True
+    print("Puntos:", len(lat), "celdas:", len(coordenadas))
+    print("Core iguales:", np.array_equal(core, np.isin(inversa, ponderado.core_sample_indices_)))
+    print("Ponderado == original:", mismas_particiones(original.labels_, ponderado.labels_[inversa], core))
+    print("Particionado == original:", mismas_particiones(original.labels_, particionado.labels_[inversa], core))
+    print("Ruido igual:", np.array_equal(original.labels_ == -1, particionado.labels_[inversa] == -1))
@@ -0,0 +1,118 @@
+# almacenamiento columnar (un .npy por columna) para los datasets procesados
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from src.datos.historial import columnas_lag
+
+# Tipos angostos del dataset de entrenamiento
+ESQUEMA_ENTRENAMIENTO = {
+    "lat_grid": "float32",
+    "lon_grid": "float32",
+    "mes": "int8",
+    "dia": "int8",
+    "dia_semana": "int8",
+    # Días desde 1970: ordena las filas en el tiempo (no es feature del modelo)
+    "dia_ordinal": "int32",
+    "conteo_delitos": "uint16",
+    "conteo_delitos_graves": "uint16",
+    "conteo_llamadas_riesgo": "uint16",
+}
+# Features de rezago del historial (sumas por ventana), también conteos
+ESQUEMA_ENTRENAMIENTO.update({col: "uint16" for col in columnas_lag()})
+
+ARCHIVO_ESQUEMA = "esquema.json"
+
+
+def ruta_columnar(ruta_csv):
+    # data/processed/dataset.csv -> data/processed/dataset/
+    return os.path.splitext(ruta_csv)[0]
+
+
+def existe_columnar(ruta_dir):
+    return os.path.isfile(os.path.join(ruta_dir, ARCHIVO_ESQUEMA))
+
+
+def _convertir(serie, tipo):
+    tipo = np.dtype(tipo)
+    valores = serie.to_numpy()
+
+    if tipo.kind in "iu":
+        if pd.isna(valores).any():
+            raise ValueError(f"La columna '{serie.name}' tiene valores nulos y no puede guardarse como {tipo}")
+        # Los conteos se saturan en el máximo del tipo en lugar de desbordarse
+        info = np.iinfo(tipo)
+        valores = np.clip(valores, info.min, info.max)
+
+    return np.ascontiguousarray(valores, dtype=tipo)
+
+
+def guardar_columnar(df, ruta_dir, esquema=None):
+    """
+    Guarda un DataFrame como un directorio con un .npy por columna y un esquema.json.
+
+    :param df: DataFrame a guardar
+    :param ruta_dir: directorio destino (se reemplaza completo)
+    :param esquema: dict columna -> dtype; las columnas que no aparezcan conservan su tipo
+    """
+    esquema = esquema or {}
+    ruta_tmp = ruta_dir + ".tmp"
+    shutil.rmtree(ruta_tmp, ignore_errors=True)
+    os.makedirs(ruta_tmp)
+
+    columnas = {}
+    for col in df.columns:
+        valores = _convertir(df[col], esquema.get(col, df[col].dtype))
+        np.save(os.path.join(ruta_tmp, f"{col}.npy"), valores, allow_pickle=False)
+        columnas[col] = valores.dtype.str
+
+    with open(os.path.join(ruta_tmp, ARCHIVO_ESQUEMA), "w", encoding="utf-8") as f:
+        json.dump({"filas": len(df), "columnas": columnas}, f, indent=2)
+
+    # Se publica el directorio completo de una vez para no dejar artefactos a medias
+    shutil.rmtree(ruta_dir, ignore_errors=True)
+    os.replace(ruta_tmp, ruta_dir)
+
+
+def leer_esquema(ruta_dir):
+    with open(os.path.join(ruta_dir, ARCHIVO_ESQUEMA), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cargar_columnar(ruta_dir, columnas=None, mmap=True):
+    """
+    Carga las columnas pedidas de un directorio columnar.
+
+    :param columnas: lista de columnas a leer (por defecto todas)
+    :param mmap: si es True los arrays se mapean en memoria en modo solo lectura
+    :return: dict columna -> np.ndarray
+    """
+    esquema = leer_esquema(ruta_dir)
+    columnas = columnas or list(esquema["columnas"])
+
+    faltantes = [c for c in columnas if c not in esquema["columnas"]]
+    if faltantes:
+        raise KeyError(f"Columnas inexistentes en {ruta_dir}: {faltantes}")
+
+    modo = "r" if mmap else None
+    return {
+        col: np.load(os.path.join(ruta_dir, f"{col}.npy"), mmap_mode=modo, allow_pickle=False)
+        for col in columnas
+    }
+
+
+def cargar_tabla(ruta_csv, columnas=None):
+    """
+    Carga un dataset procesado, prefiriendo su versión columnar si existe.
+
+    :param ruta_csv: ruta del CSV; la versión columnar se busca junto a él
+    :param columnas: columnas a leer (por defecto todas)
+    :return: DataFrame
+    """
+    ruta_dir = ruta_columnar(ruta_csv)
+    if existe_columnar(ruta_dir):
+        return pd.DataFrame(cargar_columnar(ruta_dir, columnas), copy=False)
+    return pd.read_csv(ruta_csv, usecols=columnas)
@@ -0,0 +1,88 @@
+# artefacto compacto de diagnóstico (puntos core del DBSCAN + perfiles) sin pickle
+import json
+import os
+import shutil
+
+import numpy as np
+
+# 2: puntos core en float64 (el BallTree los usa tal cual, sin copia privada)
+VERSION_DIAGNOSTICO = 2
+VERSIONES_SOPORTADAS = {1, VERSION_DIAGNOSTICO}
+
+ARCHIVO_META = "diagnostico.json"
+
+
+def existe_diagnostico(ruta_dir):
+    return os.path.isfile(os.path.join(ruta_dir, ARCHIVO_META))
+
+
+def _valores_nativos(perfil):
+    # Los perfiles salen de pandas: los escalares numpy se pasan a tipos de Python
+    return {k: v.item() if hasattr(v, "item") else v for k, v in perfil.items()}
+
+
+def guardar_diagnostico(ruta_dir, puntos_core, etiquetas_core, eps, perfiles):
+    """
+    Guarda lo que la API necesita del DBSCAN como un directorio de .npy + json.
+
+    :param puntos_core: array (n, 2) con (lat, lon) de los puntos core en radianes (se guarda en float64)
+    :param etiquetas_core: cluster de cada punto core
+    :param eps: radio del DBSCAN en radianes
+    :param perfiles: dict cluster_id -> perfil (escalares de Python o numpy)
+    """
+    ruta_tmp = ruta_dir + ".tmp"
+    shutil.rmtree(ruta_tmp, ignore_errors=True)
+    os.makedirs(ruta_tmp)
+
+    puntos = np.ascontiguousarray(puntos_core, dtype=np.float64).reshape(-1, 2)
+    etiquetas = np.ascontiguousarray(etiquetas_core, dtype=np.int32)
+    np.save(os.path.join(ruta_tmp, "puntos_core.npy"), puntos, allow_pickle=False)
+    np.save(os.path.join(ruta_tmp, "etiquetas_core.npy"), etiquetas, allow_pickle=False)
+
+    meta = {
+        "version": VERSION_DIAGNOSTICO,
+        "eps": float(eps),
+        "puntos": len(puntos),
+        # JSON solo admite claves de texto: se restauran a int al cargar
+        "perfiles": {str(int(k)): _valores_nativos(v) for k, v in perfiles.items()},
+    }
+    with open(os.path.join(ruta_tmp, ARCHIVO_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    # Se publica el directorio completo de una vez para no dejar artefactos a medias
+    shutil.rmtree(ruta_dir, ignore_errors=True)
+    os.replace(ruta_tmp, ruta_dir)
+
+
+def cargar_diagnostico(ruta_dir, mmap=True):
+    """
+    Carga el artefacto de diagnóstico; los arrays se mapean en memoria (solo lectura).
+
+    :return: dict con puntos (float64, radianes; float32 en artefactos de la versión 1),
+             etiquetas (int32), eps y perfiles
+    """
+    with open(os.path.join(ruta_dir, ARCHIVO_META), encoding="utf-8") as f:
+        meta = json.load(f)
+
+    if meta.get("version") not in VERSIONES_SOPORTADAS:
+        raise ValueError(
+            f"Versión de diagnóstico no soportada en {ruta_dir}: {meta.get('version')}"
+        )
+
+    modo = "r" if mmap else None
+    return {
+        "puntos": np.load(os.path.join(ruta_dir, "puntos_core.npy"), mmap_mode=modo, allow_pickle=False),
+        "etiquetas": np.load(os.path.join(ruta_dir, "etiquetas_core.npy"), mmap_mode=modo, allow_pickle=False),
+        "eps": float(meta["eps"]),
+        "perfiles": {int(k): v for k, v in meta["perfiles"].items()},
+    }
+
+
+def diagnostico_desde_dbscan(model, perfiles):
+    # Mismo formato que cargar_diagnostico, a partir de un DBSCAN ya ajustado
+    return {
+        "puntos": np.asarray(model.components_, dtype=np.float64),
+        "etiquetas": np.asarray(model.labels_[model.core_sample_indices_], dtype=np.int32),
+        "eps": float(model.eps),
+        "perfiles": perfiles,
+    }
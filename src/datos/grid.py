@@ -0,0 +1,119 @@
+# identificador entero de las celdas del grid espacial (3 decimales de lat/lon)
+import numpy as np
+
+# Resolución del grid: 1/ESCALA grados (~110 m)
+ESCALA = 1000
+# Filas y columnas se cuentan desde -90 / -180 para que sean siempre positivas
+DESPLAZAMIENTO_LAT = 90 * ESCALA
+DESPLAZAMIENTO_LON = 180 * ESCALA
+ANCHO_LON = 360 * ESCALA + 1
+
+# Celda de las coordenadas faltantes (NaN)
+CELDA_INVALIDA = -1
+
+
+def fila_columna(lat, lon):
+    """
+    Fila y columna enteras del grid para cada coordenada (redondeo al más cercano).
+
+    :return: (filas int64, columnas int64, máscara de coordenadas válidas)
+    """
+    lat = np.rint(np.asarray(lat, dtype=np.float64) * ESCALA)
+    lon = np.rint(np.asarray(lon, dtype=np.float64) * ESCALA)
+    validos = ~(np.isnan(lat) | np.isnan(lon))
+    fila = np.where(validos, lat, 0).astype(np.int64) + DESPLAZAMIENTO_LAT
+    columna = np.where(validos, lon, 0).astype(np.int64) + DESPLAZAMIENTO_LON
+    return fila, columna, validos
+
+
+def codificar_celda(lat, lon):
+    """
+    Id int64 de la celda de cada coordenada (CELDA_INVALIDA si falta alguna).
+
+    El id crece con la latitud y luego con la longitud, así que ordenar por id
+    equivale a ordenar por (lat, lon).
+    """
+    fila, columna, validos = fila_columna(lat, lon)
+    return np.where(validos, fila * ANCHO_LON + columna, CELDA_INVALIDA)
+
+
+def decodificar_celda(celda, dtype=np.float64):
+    """
+    Coordenadas (centro) de cada celda; las mismas que daba round(3).
+
+    :return: (lat, lon) del tipo pedido
+    """
+    celda = np.asarray(celda, dtype=np.int64)
+    lat = (celda // ANCHO_LON - DESPLAZAMIENTO_LAT) / ESCALA
+    lon = (celda % ANCHO_LON - DESPLAZAMIENTO_LON) / ESCALA
+    return lat.astype(dtype), lon.astype(dtype)
+
+
+def limites_enteros(limites):
+    """
+    Rango de filas y columnas cuyas celdas caen dentro de un rectángulo.
+
+    :param limites: dict con lat_min, lat_max, lon_min y lon_max
+    :return: (fila_min, fila_max, columna_min, columna_max), inclusivos
+    """
+    # Se redondea antes de ceil/floor para que -3.6 * 1000 = -3600.0000000000005 no cambie de celda
+    def escalar(valor):
+        return round(float(valor) * ESCALA, 6)
+
+    return (
+        int(np.ceil(escalar(limites["lat_min"]))) + DESPLAZAMIENTO_LAT,
+        int(np.floor(escalar(limites["lat_max"]))) + DESPLAZAMIENTO_LAT,
+        int(np.ceil(escalar(limites["lon_min"]))) + DESPLAZAMIENTO_LON,
+        int(np.floor(escalar(limites["lon_max"]))) + DESPLAZAMIENTO_LON,
+    )
+
+
+def en_limites(celda, limites):
+    # Máscara de las celdas dentro del rectángulo, comparando enteros
+    celda = np.asarray(celda, dtype=np.int64)
+    fila_min, fila_max, columna_min, columna_max = limites_enteros(limites)
+    fila, columna = celda // ANCHO_LON, celda % ANCHO_LON
+    return (
+        (celda != CELDA_INVALIDA) &
+        (fila >= fila_min) & (fila <= fila_max) &
+        (columna >= columna_min) & (columna <= columna_max)
+    )
+
+
+def buscar_celdas(celdas_ordenadas, celdas):
+    # Posición de cada id dentro de un array ordenado de ids (-1 si no está)
+    celdas = np.asarray(celdas, dtype=np.int64)
+    if len(celdas_ordenadas) == 0:
+        return np.full(celdas.shape, -1, dtype=np.int64)
+    posiciones = np.minimum(np.searchsorted(celdas_ordenadas, celdas), len(celdas_ordenadas) - 1)
+    return np.where(celdas_ordenadas[posiciones] == celdas, posiciones, -1)
+
+
+def vecinos(celda, radio=1):
+    """
+    Celdas de la ventana (2·radio+1)² alrededor de cada celda, incluida ella misma.
+
+    :return: array int64 de forma (n, (2·radio+1)²); la columna central es la celda
+    """
+    celda = np.asarray(celda, dtype=np.int64).reshape(-1, 1)
+    pasos = np.arange(-radio, radio + 1, dtype=np.int64)
+    desplazamientos = (pasos[:, None] * ANCHO_LON + pasos[None, :]).ravel()
+    return celda + desplazamientos
+
+
+# CODIGO DE PRUEBA
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    lat = np.round(rng.uniform(-5.0, 1.5, 100_000), 3)
+    lon = np.round(rng.uniform(-81.0, -75.0, 100_000), 3)
+
+    celdas = codificar_celda(lat, lon)
+    lat_d, lon_d = decodificar_celda(celdas)
+    assert np.array_equal(lat_d, lat) and np.array_equal(lon_d, lon), "ida y vuelta distinta"
+    assert np.array_equal(np.argsort(celdas, kind="stable"), np.lexsort((lon, lat))), "orden distinto a (lat, lon)"
+
+    limites = {"lat_min": -3.6, "lat_max": -2.3, "lon_min": -79.6, "lon_max": -78.3}
+    mascara_float = (lat >= -3.6) & (lat <= -2.3) & (lon >= -79.6) & (lon <= -78.3)
+    assert np.array_equal(en_limites(celdas, limites), mascara_float), "filtro de zona distinto"
+
+    print("Codificación del grid OK:", len(np.unique(celdas)), "celdas distintas")
@@ -0,0 +1,205 @@
+# historial denso celda × día de llamadas del ECU911 y detenciones, con las features de rezago
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from src.datos.grid import buscar_celdas, vecinos
+
+VERSION_HISTORIAL = 1
+ARCHIVO_META = "historial.json"
+
+# Señales del historial y columna del dataset (celda, día) de la que sale cada una
+SENALES = {
+    "llamadas": "conteo_llamadas_riesgo",
+    "delitos": "conteo_delitos",
+}
+# Ventanas (días previos a la fecha) de las sumas por celda
+VENTANAS = (7, 14, 28)
+# Ventana de la suma de las 8 celdas vecinas
+VENTANA_VECINOS = 7
+
+
+def columnas_lag():
+    # Nombres de las features de rezago, en el orden en que se agregan al dataset y al grid
+    columnas = [f"{senal}_{ventana}d" for senal in SENALES for ventana in VENTANAS]
+    columnas += [f"{senal}_vecinos_{VENTANA_VECINOS}d" for senal in SENALES]
+    return columnas
+
+
+def existe_historial(ruta_dir):
+    return os.path.isfile(os.path.join(ruta_dir, ARCHIVO_META))
+
+
+def construir_historial(celdas_eventos, ordinales, conteos, celdas=None):
+    """
+    Arma el historial a partir de conteos por (celda, día).
+
+    Por cada señal se guarda la suma acumulada a lo largo de los días,
+    `acumulados[senal][d, c]` = eventos de la celda c antes del día dia0 + d,
+    así cualquier ventana es la resta de dos filas.
+
+    :param celdas_eventos: id de celda de cada conteo (ver src/datos/grid.py)
+    :param ordinales: día de cada conteo (días desde 1970)
+    :param conteos: dict señal -> array con el conteo de cada fila
+    :param celdas: ids de las celdas del historial (por defecto, las de los eventos)
+    :return: dict con celdas (ordenadas), dia0, dias y acumulados
+    """
+    celdas_eventos = np.asarray(celdas_eventos, dtype=np.int64)
+    ordinales = np.asarray(ordinales, dtype=np.int64)
+    if celdas is None:
+        celdas = np.unique(celdas_eventos)
+    celdas = np.asarray(celdas, dtype=np.int64)
+
+    dia0 = int(ordinales.min()) if len(ordinales) else 0
+    dias = int(ordinales.max()) - dia0 + 1 if len(ordinales) else 0
+
+    posiciones = buscar_celdas(celdas, celdas_eventos)
+    validas = posiciones >= 0
+    plano = (ordinales[validas] - dia0) * len(celdas) + posiciones[validas]
+
+    acumulados = {}
+    for senal in SENALES:
+        cubo = np.bincount(
+            plano, weights=np.asarray(conteos[senal], dtype=np.float64)[validas],
+            minlength=dias * len(celdas)
+        ).astype(np.int32).reshape(dias, len(celdas))
+        acumulados[senal] = acumular(cubo)
+    return {"celdas": celdas, "dia0": dia0, "dias": dias, "acumulados": acumulados}
+
+
+def acumular(cubo):
+    # Fila 0 en ceros: la fila d es la suma de los días anteriores a d
+    acumulado = np.zeros((cubo.shape[0] + 1, cubo.shape[1]), dtype=np.int32)
+    np.cumsum(cubo, axis=0, dtype=np.int32, out=acumulado[1:])
+    return acumulado
+
+
+def actualizar_historial(historial, nuevo, dia_inicio, dia_fin):
+    """
+    Reemplaza los días [dia_inicio, dia_fin] del historial por los de `nuevo`.
+
+    El resultado cubre la unión de celdas y días de ambos; el resto de días
+    conserva sus conteos.
+    """
+    if historial is None:
+        return nuevo
+
+    # Un historial sin días (p. ej. un mes sin eventos) no aporta rango
+    fuentes = [fuente for fuente in (historial, nuevo) if fuente["dias"] > 0]
+    celdas = np.union1d(historial["celdas"], nuevo["celdas"])
+    dia0 = int(min([fuente["dia0"] for fuente in fuentes] + [dia_inicio]))
+    dias = int(max([fuente["dia0"] + fuente["dias"] for fuente in fuentes] + [dia_fin + 1])) - dia0
+
+    def sumar(cubo, fuente, senal):
+        columnas = np.searchsorted(celdas, fuente["celdas"])
+        filas = slice(fuente["dia0"] - dia0, fuente["dia0"] - dia0 + fuente["dias"])
+        cubo[filas, columnas] += np.diff(np.asarray(fuente["acumulados"][senal]), axis=0)
+
+    acumulados = {}
+    for senal in SENALES:
+        cubo = np.zeros((dias, len(celdas)), dtype=np.int32)
+        if historial["dias"] > 0:
+            sumar(cubo, historial, senal)
+        # Los días del periodo se toman solo de la versión nueva
+        cubo[dia_inicio - dia0:dia_fin + 1 - dia0] = 0
+        if nuevo["dias"] > 0:
+            sumar(cubo, nuevo, senal)
+        acumulados[senal] = acumular(cubo)
+    return {"celdas": celdas, "dia0": dia0, "dias": dias, "acumulados": acumulados}
+
+
+def guardar_historial(historial, ruta_dir):
+    # Igual que el dataset columnar: se escribe en un temporal y se publica de una vez
+    ruta_tmp = ruta_dir + ".tmp"
+    shutil.rmtree(ruta_tmp, ignore_errors=True)
+    os.makedirs(ruta_tmp)
+
+    np.save(os.path.join(ruta_tmp, "celdas.npy"), historial["celdas"], allow_pickle=False)
+    for senal, acumulado in historial["acumulados"].items():
+        np.save(os.path.join(ruta_tmp, f"acumulado_{senal}.npy"), np.asarray(acumulado), allow_pickle=False)
+
+    meta = {
+        "version": VERSION_HISTORIAL,
+        "dia0": int(historial["dia0"]),
+        "dias": int(historial["dias"]),
+        "celdas": int(len(historial["celdas"])),
+        "senales": list(historial["acumulados"]),
+        "actualizado": time.time(),
+    }
+    with open(os.path.join(ruta_tmp, ARCHIVO_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(ruta_dir, ignore_errors=True)
+    os.replace(ruta_tmp, ruta_dir)
+
+
+def cargar_historial(ruta_dir, mmap=True):
+    with open(os.path.join(ruta_dir, ARCHIVO_META), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["version"] != VERSION_HISTORIAL:
+        raise ValueError(f"Versión de historial no soportada: {meta['version']}")
+
+    modo = "r" if mmap else None
+    return {
+        "celdas": np.load(os.path.join(ruta_dir, "celdas.npy"), allow_pickle=False),
+        "dia0": meta["dia0"],
+        "dias": meta["dias"],
+        "acumulados": {
+            senal: np.load(os.path.join(ruta_dir, f"acumulado_{senal}.npy"), mmap_mode=modo, allow_pickle=False)
+            for senal in meta["senales"]
+        },
+    }
+
+
+def vecinos_historial(historial):
+    # Posiciones de las 8 celdas vecinas de cada celda del historial (-1 si no existe); se calcula una vez
+    if "vecinos" not in historial:
+        ventana = vecinos(historial["celdas"], radio=1)
+        sin_centro = np.delete(ventana, ventana.shape[1] // 2, axis=1)
+        historial["vecinos"] = buscar_celdas(historial["celdas"], sin_centro.ravel()).reshape(sin_centro.shape)
+    return historial["vecinos"]
+
+
+def _suma_ventana(acumulado, dia, posiciones, ventana, dias):
+    # Eventos en [dia - ventana, dia) de cada fila; días fuera del historial cuentan como cero
+    fin = np.clip(dia, 0, dias)
+    inicio = np.clip(dia - ventana, 0, dias)
+    seguras = np.maximum(posiciones, 0)
+    suma = acumulado[fin, seguras] - acumulado[inicio, seguras]
+    return np.where(posiciones >= 0, suma, 0)
+
+
+def features_lag(historial, ordinales, posiciones):
+    """
+    Features de rezago para filas (día, celda), usando solo días anteriores a cada fecha.
+
+    :param ordinales: día de cada fila (días desde 1970)
+    :param posiciones: posición de la celda de cada fila en historial["celdas"] (-1 sin historial)
+    :return: dict columna -> array uint16, en el orden de columnas_lag()
+    """
+    dia = np.asarray(ordinales, dtype=np.int64) - historial["dia0"]
+    posiciones = np.asarray(posiciones, dtype=np.int64)
+    dias = historial["dias"]
+    if len(historial["celdas"]) == 0:
+        return {col: np.zeros(len(posiciones), dtype=np.uint16) for col in columnas_lag()}
+
+    features = {}
+    for senal in SENALES:
+        acumulado = historial["acumulados"][senal]
+        for ventana in VENTANAS:
+            features[f"{senal}_{ventana}d"] = _suma_ventana(acumulado, dia, posiciones, ventana, dias)
+
+    vecinas = vecinos_historial(historial)
+    for senal in SENALES:
+        acumulado = historial["acumulados"][senal]
+        suma = np.zeros(len(posiciones), dtype=np.int64)
+        for k in range(vecinas.shape[1]):
+            posiciones_vecina = np.where(posiciones >= 0, vecinas[np.maximum(posiciones, 0), k], -1)
+            suma += _suma_ventana(acumulado, dia, posiciones_vecina, VENTANA_VECINOS, dias)
+        features[f"{senal}_vecinos_{VENTANA_VECINOS}d"] = suma
+
+    maximo = np.iinfo(np.uint16).max
+    return {col: np.clip(valores, 0, maximo).astype(np.uint16) for col, valores in features.items()}
@@ -0,0 +1,55 @@
+# manifiesto de archivos ya procesados para las ejecuciones incrementales
+import hashlib
+import json
+import os
+
+VERSION_MANIFIESTO = 1
+
+
+def huella_archivo(ruta, anterior=None, tamano_bloque=1 << 20):
+    """
+    Calcula la huella (tamaño, fecha de modificación y sha256) de un archivo.
+
+    :param anterior: huella previa del mismo archivo; si tamaño y fecha de
+                     modificación coinciden se reutiliza su hash sin releerlo
+    :return: dict con ruta, tamano, mtime y sha256
+    """
+    info = os.stat(ruta)
+    huella = {"ruta": ruta, "tamano": info.st_size, "mtime": info.st_mtime_ns}
+
+    if anterior and anterior.get("tamano") == huella["tamano"] and anterior.get("mtime") == huella["mtime"]:
+        huella["sha256"] = anterior["sha256"]
+        return huella
+
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b""):
+            sha.update(bloque)
+    huella["sha256"] = sha.hexdigest()
+    return huella
+
+
+def misma_huella(a, b):
+    # El contenido manda: un archivo tocado pero idéntico no se reprocesa
+    return bool(a) and bool(b) and a["tamano"] == b["tamano"] and a["sha256"] == b["sha256"]
+
+
+def cargar_manifiesto(ruta):
+    if not os.path.exists(ruta):
+        return {"version": VERSION_MANIFIESTO, "entradas": {}}
+
+    with open(ruta, encoding="utf-8") as f:
+        manifiesto = json.load(f)
+
+    # Un manifiesto de otra versión obliga a reprocesar todo
+    if manifiesto.get("version") != VERSION_MANIFIESTO:
+        return {"version": VERSION_MANIFIESTO, "entradas": {}}
+    return manifiesto
+
+
+def guardar_manifiesto(manifiesto, ruta):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    ruta_tmp = ruta + ".tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    os.replace(ruta_tmp, ruta)
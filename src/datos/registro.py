@@ -0,0 +1,137 @@
+# registro de versiones del modelo: cada versión es un directorio con el modelo, las celdas del grid y el diagnóstico
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+
+from src.datos.manifiesto import huella_archivo
+
+ruta_registro = os.path.join("model", "registro")
+
+ARCHIVO_ACTIVA = "ACTIVA"
+ARCHIVO_MODELO = "modelo_riesgo_delictivo.pkl"
+ARCHIVO_CELDAS = "celdas.npy"
+DIR_DIAGNOSTICO = "diagnostico_detenciones"
+
+
+def ruta_version(ruta_base, version):
+    return os.path.join(ruta_base, version)
+
+
+def rutas_version(ruta_base, version):
+    # Archivos de una versión publicada
+    ruta_dir = ruta_version(ruta_base, version)
+    return {
+        "modelo": os.path.join(ruta_dir, ARCHIVO_MODELO),
+        "celdas": os.path.join(ruta_dir, ARCHIVO_CELDAS),
+        "diagnostico": os.path.join(ruta_dir, DIR_DIAGNOSTICO),
+    }
+
+
+def versiones(ruta_base):
+    if not os.path.isdir(ruta_base):
+        return []
+    return sorted(
+        nombre for nombre in os.listdir(ruta_base)
+        if os.path.isfile(os.path.join(ruta_base, nombre, ARCHIVO_MODELO))
+    )
+
+
+def version_activa(ruta_base):
+    # Versión indicada en el archivo ACTIVA, o None si el registro no existe
+    try:
+        with open(os.path.join(ruta_base, ARCHIVO_ACTIVA), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def activar_version(ruta_base, version):
+    """Marca `version` como activa; las APIs que vigilan el registro la cargan solas."""
+    if version not in versiones(ruta_base):
+        raise ValueError(f"Versión inexistente en {ruta_base}: {version}")
+    ruta = os.path.join(ruta_base, ARCHIVO_ACTIVA)
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(ruta_tmp, ruta)
+
+
+def publicar_version(ruta_base, ruta_modelo, celdas, diagnostico, version=None):
+    """
+    Copia un modelo entrenado al registro como una versión nueva (sin activarla).
+
+    :param ruta_modelo: modelo de riesgo serializado (joblib)
+    :param celdas: ids de las celdas del grid (ver src/datos/grid.py)
+    :param diagnostico: artefacto de diagnóstico (ver src/datos/diagnostico.py)
+    :return: nombre de la versión
+    """
+    from src.datos.diagnostico import guardar_diagnostico
+
+    if version is None:
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{huella_archivo(ruta_modelo)['sha256'][:8]}"
+    ruta_dir = ruta_version(ruta_base, version)
+    if os.path.exists(ruta_dir):
+        raise ValueError(f"La versión ya existe: {version}")
+
+    # Se arma en un temporal y se publica de una vez: una versión nunca queda a medias
+    ruta_tmp = ruta_dir + ".tmp"
+    shutil.rmtree(ruta_tmp, ignore_errors=True)
+    os.makedirs(ruta_tmp)
+    shutil.copy2(ruta_modelo, os.path.join(ruta_tmp, ARCHIVO_MODELO))
+    np.save(os.path.join(ruta_tmp, ARCHIVO_CELDAS), np.asarray(celdas, dtype=np.int64), allow_pickle=False)
+    guardar_diagnostico(
+        os.path.join(ruta_tmp, DIR_DIAGNOSTICO),
+        diagnostico["puntos"], diagnostico["etiquetas"], diagnostico["eps"], diagnostico["perfiles"]
+    )
+    os.replace(ruta_tmp, ruta_dir)
+    return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Registro de versiones del modelo de riesgo")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    publicar = subcomandos.add_parser("publicar", help="copia el modelo actual de model/ como una versión nueva")
+    publicar.add_argument("--activar", action="store_true", help="la marca como activa al terminar")
+    activar = subcomandos.add_parser("activar", help="marca una versión como activa")
+    activar.add_argument("version")
+    subcomandos.add_parser("listar", help="muestra las versiones y cuál está activa")
+    args = parser.parse_args(argv)
+
+    if args.comando == "publicar":
+        from src.datos.columnar import cargar_tabla
+        from src.datos.grid import CELDA_INVALIDA, codificar_celda
+        from src.model.predictor import cargar_recursos_diagnostico
+
+        df = cargar_tabla(
+            os.path.join("data", "processed", "dataset_entrenamiento_final.csv"), ["lat_grid", "lon_grid"]
+        )
+        celdas = codificar_celda(df["lat_grid"], df["lon_grid"])
+        diagnostico = cargar_recursos_diagnostico(
+            os.path.join("model", "diagnostico_detenciones"),
+            os.path.join("model", "modelo_dbscan_detenciones.joblib"),
+            os.path.join("model", "perfiles_clusters_detenciones.joblib")
+        )
+        version = publicar_version(
+            ruta_registro, os.path.join("model", "modelo_riesgo_delictivo.pkl"),
+            np.unique(celdas[celdas != CELDA_INVALIDA]), diagnostico
+        )
+        print("Versión publicada:", version)
+        if args.activar:
+            activar_version(ruta_registro, version)
+            print("Versión activa:", version)
+
+    elif args.comando == "activar":
+        activar_version(ruta_registro, args.version)
+        print("Versión activa:", args.version)
+
+    else:
+        activa = version_activa(ruta_registro)
+        for version in versiones(ruta_registro):
+            print(("* " if version == activa else "  ") + version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# búsqueda de hiperparámetros del modelo de riesgo: pruebas en paralelo y reanudables
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from src.datos.columnar import cargar_columnar, existe_columnar, ruta_columnar
+from src.model.entrenamiento import (
+    PARAMETROS, TAMANO_BLOQUE, columna_dia, columnas_features, corte_validacion, dateset_entrenamiento, target
+)
+from src.datos.historial import cargar_historial, existe_historial
+from src.model.predictor import construir_indice_grid, preparar_grid, vincular_historial
+from src.model.zonas import ZONAS
+
+ruta_busqueda = os.path.join("model", "busqueda")
+ruta_resultados = os.path.join(ruta_busqueda, "pruebas.jsonl")
+ruta_modelos = os.path.join(ruta_busqueda, "modelos")
+ruta_mejores = os.path.join("model", "mejores_hiperparametros.json")
+ruta_historial = os.path.join("data", "processed", "historial")
+
+ESPACIO = {
+    "n_estimators": [100, 200, 400],
+    "max_depth": [4, 6, 8],
+    "learning_rate": [0.05, 0.1],
+    "subsample": [0.7, 1.0],
+    "colsample_bytree": [0.7, 1.0],
+}
+
+
+def combinaciones(espacio, maximo=None, semilla=0):
+    """Todas las combinaciones del espacio, o una muestra aleatoria de `maximo` de ellas."""
+    claves = list(espacio)
+    todas = [dict(zip(claves, valores)) for valores in itertools.product(*espacio.values())]
+    if maximo and maximo < len(todas):
+        rng = np.random.default_rng(semilla)
+        todas = [todas[i] for i in sorted(rng.choice(len(todas), size=maximo, replace=False))]
+    return todas
+
+
+def id_prueba(parametros):
+    return hashlib.sha1(json.dumps(parametros, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def cargar_resultados(ruta):
+    # Una línea JSON por prueba; si una prueba aparece varias veces vale la última.
+    # Las pruebas correctas no se repiten al reanudar; las fallidas sí
+    resultados = {}
+    if os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                if linea.strip():
+                    prueba = json.loads(linea)
+                    resultados[prueba["id"]] = prueba
+    return resultados
+
+
+# DATOS COMPARTIDOS
+
+def preparar_datos(dias_validacion, ruta_dir):
+    """
+    Construye una sola vez los DMatrix de entrenamiento/validación y la matriz
+    del grid nacional, y los guarda en `ruta_dir` para que los workers los lean.
+    """
+    import xgboost as xgb
+
+    ruta_columnas = ruta_columnar(dateset_entrenamiento)
+    if not existe_columnar(ruta_columnas):
+        raise SystemExit(
+            f"No existe {ruta_columnas}: ejecute primero src.cleaning.preprocesamiento_datos_entrenamiento"
+        )
+    columnas = cargar_columnar(ruta_columnas)
+    features = columnas_features(columnas)
+
+    corte = corte_validacion(columnas, dias_validacion, TAMANO_BLOQUE)
+    validacion = np.asarray(columnas[columna_dia]) >= corte
+    X = np.column_stack([np.asarray(columnas[c], dtype=np.float32) for c in features])
+    y = np.asarray(columnas[target], dtype=np.float32)
+
+    os.makedirs(ruta_dir, exist_ok=True)
+    xgb.DMatrix(X[~validacion], label=y[~validacion], feature_names=features).save_binary(
+        os.path.join(ruta_dir, "entrenamiento.buffer")
+    )
+    xgb.DMatrix(X[validacion], label=y[validacion], feature_names=features).save_binary(
+        os.path.join(ruta_dir, "validacion.buffer")
+    )
+
+    # Grid nacional de un día cualquiera: la latencia no depende de la fecha
+    indice = construir_indice_grid({"lat_grid": columnas["lat_grid"], "lon_grid": columnas["lon_grid"]}, ZONAS)
+    if existe_historial(ruta_historial):
+        vincular_historial(indice, cargar_historial(ruta_historial))
+    df_grid = preparar_grid(indice, pd.Timestamp("2025-06-01"))
+    np.save(os.path.join(ruta_dir, "grid.npy"),
+            np.column_stack([df_grid[c].to_numpy(np.float32) for c in features]))
+    return int((~validacion).sum()), int(validacion.sum()), len(df_grid)
+
+
+# Cada worker carga los datos una vez (initializer) y los reutiliza en todas sus pruebas
+_datos = {}
+
+
+def _inicializar_worker(ruta_dir):
+    import xgboost as xgb
+
+    _datos["entrenamiento"] = xgb.DMatrix(os.path.join(ruta_dir, "entrenamiento.buffer"))
+    _datos["validacion"] = xgb.DMatrix(os.path.join(ruta_dir, "validacion.buffer"))
+    _datos["grid"] = np.load(os.path.join(ruta_dir, "grid.npy"), mmap_mode="r")
+
+
+def ejecutar_prueba(parametros, hilos, rondas_parada, ruta_modelos):
+    """
+    Entrena una combinación, mide su RMSE de validación y guarda el modelo.
+
+    La latencia no se mide aquí: con otras pruebas entrenando en paralelo
+    dependería de la carga de la CPU (ver medir_latencia).
+    """
+    import xgboost as xgb
+
+    config = {
+        "max_depth": parametros["max_depth"],
+        "eta": parametros["learning_rate"],
+        "subsample": parametros["subsample"],
+        "colsample_bytree": parametros["colsample_bytree"],
+        "objective": PARAMETROS["objective"],
+        "eval_metric": "rmse",
+        "tree_method": "hist",
+        "nthread": hilos,
+    }
+    inicio = time.perf_counter()
+    booster = xgb.train(
+        config, _datos["entrenamiento"],
+        num_boost_round=parametros["n_estimators"],
+        evals=[(_datos["validacion"], "validacion")],
+        early_stopping_rounds=rondas_parada,
+        verbose_eval=False
+    )
+    duracion_entrenamiento = time.perf_counter() - inicio
+
+    ruta_modelo = os.path.join(ruta_modelos, f"{id_prueba(parametros)}.ubj")
+    booster.save_model(ruta_modelo)
+    return {
+        "id": id_prueba(parametros),
+        "parametros": parametros,
+        "rmse": float(booster.best_score),
+        "mejor_iteracion": int(booster.best_iteration),
+        "entrenamiento_s": round(duracion_entrenamiento, 2),
+        "hilos": hilos,
+        "modelo": ruta_modelo,
+    }
+
+
+def prueba_fallida(parametros, error):
+    return {"id": id_prueba(parametros), "parametros": parametros, "error": f"{type(error).__name__}: {error}"}
+
+
+def entrenar_pruebas(pendientes, args, ruta_datos, salida, terminadas):
+    """
+    Entrena las pruebas en paralelo y guarda cada una al terminar.
+
+    Una prueba que falla se registra como fallida y la búsqueda sigue. Si un
+    worker muere (p. ej. sin memoria), el pool se rompe y arrastra a las
+    pruebas en curso: esas se reintentan una vez en un pool nuevo.
+    """
+    os.makedirs(ruta_modelos, exist_ok=True)
+    reintentadas = set()
+    cola = list(pendientes)
+    while cola:
+        reintentar = []
+        with ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_inicializar_worker, initargs=(ruta_datos,)
+        ) as pool:
+            futuros = {
+                pool.submit(ejecutar_prueba, p, args.hilos_por_prueba, args.rondas_parada, ruta_modelos): p
+                for p in cola
+            }
+            for futuro in as_completed(futuros):
+                parametros = futuros[futuro]
+                try:
+                    prueba = futuro.result()
+                    print(f"   {parametros} -> RMSE {prueba['rmse']:.4f}")
+                except BrokenProcessPool as e:
+                    if id_prueba(parametros) not in reintentadas:
+                        reintentadas.add(id_prueba(parametros))
+                        reintentar.append(parametros)
+                        continue
+                    prueba = prueba_fallida(parametros, e)
+                    print(f"   {parametros} -> ERROR: {prueba['error']}")
+                except Exception as e:
+                    prueba = prueba_fallida(parametros, e)
+                    print(f"   {parametros} -> ERROR: {prueba['error']}")
+                registrar(salida, terminadas, prueba)
+        cola = reintentar
+
+
+def registrar(salida, terminadas, prueba):
+    # Se guarda cada prueba al terminar: una interrupción no pierde lo ya calculado
+    salida.write(json.dumps(prueba) + "\n")
+    salida.flush()
+    terminadas[prueba["id"]] = prueba
+
+
+def medir_latencia(ruta_modelo, mejor_iteracion, grid, hilos, repeticiones):
+    """Latencia (mediana, ms) como en la API: inplace_predict sobre la matriz float32 del grid."""
+    import xgboost as xgb
+
+    booster = xgb.Booster(model_file=ruta_modelo)
+    booster.set_param({"nthread": hilos})
+    rango = (0, mejor_iteracion + 1)
+    booster.inplace_predict(grid, iteration_range=rango, validate_features=False)  # calentamiento
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        booster.inplace_predict(grid, iteration_range=rango, validate_features=False)
+        tiempos.append(time.perf_counter() - inicio)
+    return round(float(np.median(tiempos)) * 1000, 3)
+
+
+def candidatas(resultados, tolerancia):
+    """Pruebas correctas que quedan a `tolerancia` (relativa) del mejor RMSE."""
+    correctas = [r for r in resultados if "error" not in r]
+    if not correctas:
+        return []
+    mejor_rmse = min(r["rmse"] for r in correctas)
+    return [r for r in correctas if r["rmse"] <= mejor_rmse * (1 + tolerancia)]
+
+
+def elegir(resultados, tolerancia):
+    """
+    La prueba más rápida entre las que quedan a `tolerancia` (relativa) del mejor RMSE.
+
+    Solo compiten las candidatas con latencia medida (las que no tienen su
+    modelo guardado no se pueden medir).
+    """
+    medidas = [r for r in candidatas(resultados, tolerancia) if "latencia_ms" in r]
+    if not medidas:
+        raise SystemExit(
+            "Ninguna candidata tiene latencia medida (¿faltan sus modelos en "
+            f"{ruta_modelos}?): vuelva a ejecutar la búsqueda para reentrenarlas"
+        )
+    return min(medidas, key=lambda r: (r["latencia_ms"], r["rmse"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Búsqueda de hiperparámetros del modelo de riesgo")
+    parser.add_argument("--workers", type=int, default=2, help="pruebas en paralelo")
+    parser.add_argument("--hilos-por-prueba", type=int, default=max((os.cpu_count() or 2) // 2, 1),
+                        help="hilos de XGBoost de cada prueba")
+    parser.add_argument("--max-pruebas", type=int, default=None,
+                        help="muestra aleatoria del espacio (por defecto todas las combinaciones)")
+    parser.add_argument("--dias-validacion", type=int, default=30)
+    parser.add_argument("--rondas-parada", type=int, default=30)
+    parser.add_argument("--repeticiones-latencia", type=int, default=5)
+    parser.add_argument("--hilos-latencia", type=int, default=os.cpu_count() or 1,
+                        help="hilos de XGBoost al medir la latencia de las candidatas")
+    parser.add_argument("--tolerancia", type=float, default=0.01,
+                        help="margen relativo sobre el mejor RMSE para preferir un modelo más rápido")
+    parser.add_argument("--reiniciar", action="store_true", help="descarta las pruebas ya guardadas")
+    args = parser.parse_args(argv)
+
+    if args.reiniciar and os.path.exists(ruta_resultados):
+        os.remove(ruta_resultados)
+
+    terminadas = cargar_resultados(ruta_resultados)
+
+    def correcta(id_):
+        # Las fallidas (o sin modelo guardado) se vuelven a entrenar
+        prueba = terminadas.get(id_)
+        return prueba is not None and "error" not in prueba and os.path.exists(prueba.get("modelo", ""))
+
+    pendientes = [p for p in combinaciones(ESPACIO, args.max_pruebas) if not correcta(id_prueba(p))]
+    print(f"Pruebas terminadas: {len(terminadas)} | pendientes: {len(pendientes)}")
+
+    ruta_datos = os.path.join(ruta_busqueda, "datos")
+    if pendientes or not os.path.exists(os.path.join(ruta_datos, "grid.npy")):
+        filas_entrenamiento, filas_validacion, celdas = preparar_datos(args.dias_validacion, ruta_datos)
+        print(f"Entrenamiento: {filas_entrenamiento} filas | validación: {filas_validacion} | grid: {celdas} celdas")
+
+    with open(ruta_resultados, "a", encoding="utf-8") as salida:
+        if pendientes:
+            entrenar_pruebas(pendientes, args, ruta_datos, salida, terminadas)
+
+        # Latencia de las candidatas de a una, sin pruebas entrenando en paralelo
+        sin_latencia = [
+            r for r in candidatas(terminadas.values(), args.tolerancia)
+            if "latencia_ms" not in r and os.path.exists(r.get("modelo", ""))
+        ]
+        if sin_latencia:
+            print(f"Midiendo la latencia de {len(sin_latencia)} candidatas...")
+            grid = np.ascontiguousarray(np.load(os.path.join(ruta_datos, "grid.npy")))
+            for r in sin_latencia:
+                r["latencia_ms"] = medir_latencia(
+                    r["modelo"], r["mejor_iteracion"], grid, args.hilos_latencia, args.repeticiones_latencia
+                )
+                r["hilos_latencia"] = args.hilos_latencia
+                registrar(salida, terminadas, r)
+
+    fallidas = [r for r in terminadas.values() if "error" in r]
+    if fallidas:
+        print(f"Pruebas fallidas: {len(fallidas)} (se reintentan en la próxima ejecución)")
+    resultados = sorted((r for r in terminadas.values() if "error" not in r), key=lambda r: r["rmse"])
+    if not resultados:
+        return
+    for r in resultados[:10]:
+        latencia = f"{r['latencia_ms']:8.2f} ms" if "latencia_ms" in r else "       -   "
+        print(f"RMSE {r['rmse']:.4f} | {latencia} | {r['parametros']}")
+
+    elegida = elegir(resultados, args.tolerancia)
+    # n_estimators efectivo: las rondas que dejó el early stopping
+    mejores = dict(elegida["parametros"], n_estimators=elegida["mejor_iteracion"] + 1)
+    with open(ruta_mejores, "w", encoding="utf-8") as f:
+        json.dump(mejores, f, indent=2)
+    print(f"Elegida: {mejores} (RMSE {elegida['rmse']:.4f}, {elegida['latencia_ms']} ms)")
+    print(f"Guardada en: {ruta_mejores}")
+
+
+if __name__ == "__main__":
+    main()
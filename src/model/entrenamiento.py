@@ -1,6 +1,19 @@
-import joblib
-import pandas as pd
+import argparse
+import json
 import os
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+from src.datos.columnar import cargar_columnar, existe_columnar, ruta_columnar, cargar_tabla
+
+try:
+    import resource
+except ImportError:  # Windows: no hay getrusage
+    resource = None
 
 dateset_entrenamiento = os.path.join(
     "data",
@@ -9,37 +22,226 @@ dateset_entrenamiento = os.path.join(
 )
 nombre_model_artifact = os.path.join("model", "modelo_riesgo_delictivo.pkl")
 
-df = pd.read_csv(dateset_entrenamiento)
-df.head()
 target = "conteo_delitos" # columna objetivo
-from sklearn.model_selection import train_test_split
 
-X = df.drop(columns=[target])
-y = df[target]
+# Días desde 1970 de cada fila: ordena el dataset en el tiempo para la validación
+columna_dia = "dia_ordinal"
+# Columnas del dataset que no entran al modelo
+COLUMNAS_NO_FEATURES = [target, columna_dia]
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
-from xgboost import XGBRegressor
-
-model = XGBRegressor(
-    n_estimators=400,
-    max_depth=8,
-    learning_rate=0.05,
-    subsample=0.7,
-    colsample_bytree=0.7,
-    objective="reg:squarederror"
-)
+# Hiperparámetros del modelo de riesgo
+PARAMETROS = {
+    "n_estimators": 400,
+    "max_depth": 8,
+    "learning_rate": 0.05,
+    "subsample": 0.7,
+    "colsample_bytree": 0.7,
+    "objective": "reg:squarederror",
+}
+
+# Filas por bloque al recorrer el dataset columnar en el modo externo
+TAMANO_BLOQUE = 1_000_000
+
+
+def memoria_pico_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en bytes en macOS y en KB en Linux
+    return round(rss / 2**20 if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def guardar_modelo(model):
+    # GUARDAR EL MODELO
+    os.makedirs(os.path.dirname(nombre_model_artifact), exist_ok=True)
+    joblib.dump(model, nombre_model_artifact)
+
+
+# MODO EN MEMORIA
+
+def entrenar_en_memoria():
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import mean_squared_error
+    from xgboost import XGBRegressor
+
+    # Usa la versión columnar con tipos angostos si el preprocesamiento la generó
+    df = cargar_tabla(dateset_entrenamiento)
+
+    X = df.drop(columns=COLUMNAS_NO_FEATURES, errors="ignore")
+    y = df[target]
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+
+    model = XGBRegressor(**PARAMETROS)
+
+    model.fit(X_train, y_train)
+
+    y_pred = model.predict(X_test)
+    mse = mean_squared_error(y_test, y_pred)
+    rmse = mse ** 0.5
+
+    print("RMSE:", rmse)
+    return model
+
+
+# MODO EXTERNO (out-of-core)
+
+def columnas_features(columnas):
+    return [c for c in columnas if c not in COLUMNAS_NO_FEATURES]
+
+
+def corte_validacion(columnas, dias_validacion, tamano_bloque):
+    """Día (desde 1970) a partir del cual las filas van a validación (últimos `dias_validacion` días)."""
+    if columna_dia not in columnas:
+        raise SystemExit(
+            f"El dataset no tiene la columna {columna_dia}: vuelva a ejecutar "
+            "src.cleaning.preprocesamiento_datos_entrenamiento"
+        )
+    dias = np.unique(np.concatenate([
+        np.unique(columnas[columna_dia][inicio:inicio + tamano_bloque])
+        for inicio in range(0, len(columnas[columna_dia]), tamano_bloque)
+    ]))
+    if len(dias) <= dias_validacion:
+        raise ValueError(
+            f"El dataset solo tiene {len(dias)} días distintos; reduzca --dias-validacion"
+        )
+    return dias[-dias_validacion]
+
+
+def crear_iterador(columnas, features, validacion, corte, tamano_bloque, cache_prefix):
+    """
+    Iterador de XGBoost que entrega el dataset columnar por bloques.
+
+    Solo el bloque actual se copia a memoria (float32); el resto se lee del
+    mapeo en memoria. `validacion` elige las filas posteriores (o anteriores) al corte.
+    XGBoost guarda las páginas cuantizadas en disco con el prefijo `cache_prefix`.
+    """
+    import xgboost as xgb
+
+    class IteradorColumnar(xgb.DataIter):
+        def __init__(self):
+            self._inicio = 0
+            super().__init__(cache_prefix=cache_prefix)
+
+        def next(self, input_data):
+            n = len(columnas[target])
+            while self._inicio < n:
+                inicio, fin = self._inicio, min(self._inicio + tamano_bloque, n)
+                self._inicio = fin
+
+                posteriores = np.asarray(columnas[columna_dia][inicio:fin]) >= corte
+                filas = posteriores if validacion else ~posteriores
+                if not filas.any():
+                    continue
+
+                X = np.column_stack([np.asarray(columnas[c][inicio:fin][filas], dtype=np.float32) for c in features])
+                y = np.asarray(columnas[target][inicio:fin][filas], dtype=np.float32)
+                input_data(data=X, label=y, feature_names=features)
+                return True
+            return False
+
+        def reset(self):
+            self._inicio = 0
+
+    return IteradorColumnar()
+
+
+def entrenar_externo(hilos, dias_validacion, rondas_parada, tamano_bloque, ruta_cache):
+    """
+    Entrena leyendo el dataset columnar por bloques con un DMatrix de memoria externa.
+
+    Usa `hist`, valida con los últimos días del dataset (división temporal) y
+    se detiene cuando el RMSE de validación deja de mejorar.
+    """
+    import xgboost as xgb
+    from xgboost import XGBRegressor
+
+    ruta_dir = ruta_columnar(dateset_entrenamiento)
+    if not existe_columnar(ruta_dir):
+        raise SystemExit(
+            f"No existe {ruta_dir}: ejecute primero src.cleaning.preprocesamiento_datos_entrenamiento"
+        )
+    columnas = cargar_columnar(ruta_dir)
+    features = columnas_features(columnas)
+    corte = corte_validacion(columnas, dias_validacion, tamano_bloque)
+
+    os.makedirs(ruta_cache, exist_ok=True)
+    inicio = time.perf_counter()
+    # Las páginas cuantizadas se guardan en disco (ruta_cache) en lugar de en RAM
+    dtrain = xgb.ExtMemQuantileDMatrix(
+        crear_iterador(columnas, features, False, corte, tamano_bloque,
+                       os.path.join(ruta_cache, "entrenamiento")),
+        nthread=hilos
+    )
+    dval = xgb.ExtMemQuantileDMatrix(
+        crear_iterador(columnas, features, True, corte, tamano_bloque,
+                       os.path.join(ruta_cache, "validacion")),
+        nthread=hilos, ref=dtrain
+    )
+    print(f"Filas de entrenamiento: {dtrain.num_row()} | validación: {dval.num_row()}")
+
+    parametros = {
+        "max_depth": PARAMETROS["max_depth"],
+        "eta": PARAMETROS["learning_rate"],
+        "subsample": PARAMETROS["subsample"],
+        "colsample_bytree": PARAMETROS["colsample_bytree"],
+        "objective": PARAMETROS["objective"],
+        "eval_metric": "rmse",
+        "tree_method": "hist",
+        "nthread": hilos,
+    }
+    booster = xgb.train(
+        parametros, dtrain,
+        num_boost_round=PARAMETROS["n_estimators"],
+        evals=[(dval, "validacion")],
+        early_stopping_rounds=rondas_parada,
+        verbose_eval=50
+    )
+    duracion = time.perf_counter() - inicio
+
+    print("RMSE (validación):", booster.best_score)
+    print("Mejor iteración:", booster.best_iteration)
+    print(f"Tiempo de entrenamiento: {duracion:.1f} s")
+    print(f"Memoria pico (RSS): {memoria_pico_mb()} MB")
+
+    # Se guarda como XGBRegressor para que la API y los scripts lo carguen igual que antes
+    model = XGBRegressor(**PARAMETROS)
+    model.load_model(bytearray(booster.save_raw()))
+    return model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entrenamiento del modelo de riesgo delictivo")
+    parser.add_argument(
+        "--externo", action="store_true",
+        help="lee el dataset columnar por bloques (memoria externa) con validación temporal"
+    )
+    parser.add_argument("--hilos", type=int, default=os.cpu_count(), help="hilos de XGBoost (modo externo)")
+    parser.add_argument("--dias-validacion", type=int, default=30,
+                        help="últimos días del dataset usados como validación (modo externo)")
+    parser.add_argument("--rondas-parada", type=int, default=50,
+                        help="rondas sin mejora antes de detener el entrenamiento (modo externo)")
+    parser.add_argument("--tamano-bloque", type=int, default=TAMANO_BLOQUE)
+    parser.add_argument("--cache", default=os.path.join(tempfile.gettempdir(), "xgb_cache"),
+                        help="directorio de las páginas de memoria externa")
+    parser.add_argument("--hiperparametros", default=None,
+                        help="JSON con los hiperparámetros elegidos por src.model.busqueda_hiperparametros")
+    args = parser.parse_args(argv)
 
-model.fit(X_train, y_train)
-from sklearn.metrics import mean_squared_error
+    if args.hiperparametros:
+        with open(args.hiperparametros, encoding="utf-8") as f:
+            PARAMETROS.update(json.load(f))
+        print("Hiperparámetros:", PARAMETROS)
 
-y_pred = model.predict(X_test)
-mse = mean_squared_error(y_test, y_pred)
-rmse = mse ** 0.5
+    if args.externo:
+        model = entrenar_externo(args.hilos, args.dias_validacion, args.rondas_parada,
+                                 args.tamano_bloque, args.cache)
+    else:
+        model = entrenar_en_memoria()
+    guardar_modelo(model)
 
-print("RMSE:", rmse)
 
-# GUARDAR EL MODELO
-os.makedirs(os.path.dirname(nombre_model_artifact), exist_ok=True)
-joblib.dump(model, nombre_model_artifact)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# inferencia directa sobre el Booster de XGBoost (sin el envoltorio de sklearn)
+import numpy as np
+import pandas as pd
+
+
+class MotorInferencia:
+    """
+    Envuelve el modelo de riesgo y predice con `Booster.inplace_predict`.
+
+    Expone el mismo `predict` que el XGBRegressor, así que puede pasarse a
+    predecir_riesgo / predecir_nacional sin cambios. Las features se envían
+    como una matriz float32 contigua, sin crear un DMatrix por llamada.
+    Si el modelo no es de XGBoost se usa su propio `predict`.
+
+    :param modelo: XGBRegressor (o cualquier objeto con `predict`)
+    :param nthread: hilos para la inferencia (None o 0 = los de XGBoost por defecto)
+    """
+
+    def __init__(self, modelo, nthread=None):
+        self.modelo = modelo
+        self.booster = modelo.get_booster() if hasattr(modelo, "get_booster") else None
+        self.columnas = None
+        self.rango_iteraciones = (0, 0)
+
+        if self.booster is not None:
+            if nthread:
+                self.booster.set_param({"nthread": int(nthread)})
+            self.columnas = self.booster.feature_names
+            # Igual que XGBRegressor.predict: si hubo early stopping se usa la mejor iteración
+            try:
+                self.rango_iteraciones = (0, int(modelo.best_iteration) + 1)
+            except AttributeError:
+                pass
+
+    def matriz(self, X):
+        # Reordena las columnas como en el entrenamiento y las pasa a float32 contiguo
+        if isinstance(X, pd.DataFrame):
+            columnas = self.columnas or list(X.columns)
+            return np.column_stack([X[c].to_numpy(np.float32) for c in columnas])
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def predict(self, X):
+        if self.booster is None:
+            return self.modelo.predict(X)
+        return self.booster.inplace_predict(
+            self.matriz(X),
+            iteration_range=self.rango_iteraciones,
+            validate_features=False
+        )
+
+
+# COMPARACIÓN CON EL MODELO ORIGINAL
+if __name__ == "__main__":
+    import os
+    import time
+
+    from src.datos.historial import cargar_historial, existe_historial
+    from src.model.predictor import (
+        cargar_modelo, cargar_dataset, construir_indice_grid, preparar_grid_lote, vincular_historial
+    )
+    from src.model.zonas import ZONAS
+
+    modelo = cargar_modelo(os.path.join("model", "modelo_riesgo_delictivo.pkl"))
+    motor = MotorInferencia(modelo)
+
+    indice = construir_indice_grid(
+        cargar_dataset(os.path.join("data", "processed", "dataset_entrenamiento_final.csv"),
+                       columnas=["lat_grid", "lon_grid"]),
+        ZONAS
+    )
+    ruta_historial = os.path.join("data", "processed", "historial")
+    if existe_historial(ruta_historial):
+        vincular_historial(indice, cargar_historial(ruta_historial))
+    df_grid = preparar_grid_lote(indice, pd.date_range("2025-01-01", periods=7, freq="D"))
+
+    inicio = time.perf_counter()
+    esperado = modelo.predict(df_grid)
+    t_sklearn = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    obtenido = motor.predict(df_grid)
+    t_booster = time.perf_counter() - inicio
+
+    diferencia = float(np.max(np.abs(np.asarray(esperado) - np.asarray(obtenido))))
+    print(f"Filas: {len(df_grid)}")
+    print(f"XGBRegressor.predict: {t_sklearn:.3f} s | inplace_predict: {t_booster:.3f} s")
+    print(f"Diferencia máxima: {diferencia:.2e}")
+    assert np.allclose(esperado, obtenido, rtol=1e-5, atol=1e-6), "Las predicciones no coinciden"
@@ -2,7 +2,12 @@
 import pandas as pd
 import numpy as np
 import joblib
-from sklearn.metrics.pairwise import haversine_distances
+from sklearn.neighbors import BallTree
+
+from src.datos.columnar import cargar_tabla
+from src.datos.grid import CELDA_INVALIDA, buscar_celdas, codificar_celda, decodificar_celda, en_limites
+from src.datos.historial import columnas_lag, features_lag, vecinos_historial
+from src.datos.diagnostico import cargar_diagnostico, diagnostico_desde_dbscan, existe_diagnostico
 
 
 #MÓDULO DE CARGA DE RECURSOS
@@ -11,29 +16,173 @@ from sklearn.metrics.pairwise import haversine_distances
 def cargar_modelo(ruta):
     return joblib.load(ruta)
 
-def cargar_dataset(ruta):
-    return pd.read_csv(ruta)
+def cargar_dataset(ruta, columnas=None):
+    # Usa la versión columnar (mapeada en memoria) si existe junto al CSV
+    return cargar_tabla(ruta, columnas)
 
-#PREPARACIÓN DEL GRID Y PREDICCIÓN
+def cargar_recursos_diagnostico(ruta_diagnostico, ruta_dbscan, ruta_perfiles):
+    # Usa el artefacto compacto (sin pickle, mapeado en memoria) si existe;
+    # si no, se arma el mismo formato desde el DBSCAN y los perfiles en joblib
+    if existe_diagnostico(ruta_diagnostico):
+        return cargar_diagnostico(ruta_diagnostico)
+    return diagnostico_desde_dbscan(cargar_modelo(ruta_dbscan), cargar_modelo(ruta_perfiles))
+
+#ÍNDICE DEL GRID
+
+def construir_indice_grid(df, zonas):
+    """
+    Construye una sola vez el índice de celdas únicas del grid.
+
+    :param df: DataFrame (o mapeo de columnas) con lat_grid y lon_grid
+    :param zonas: diccionario de zonas con sus límites (ver zonas.py)
+    :return: dict con el id entero de cada celda, sus coordenadas float32
+             ordenadas por (lat, lon) y, por cada zona, las posiciones de sus
+             celdas dentro del índice
+    """
+    return construir_indice_celdas(codificar_celda(df["lat_grid"], df["lon_grid"]), zonas)
+
+
+def construir_indice_celdas(celdas, zonas):
+    # Igual que construir_indice_grid, a partir de ids de celda (p. ej. los de una versión del registro)
+    celdas = np.asarray(celdas, dtype=np.int64)
+
+    # Ordenar por id equivale a ordenar por (lat, lon)
+    celdas = np.unique(celdas[celdas != CELDA_INVALIDA])
+    lat, lon = decodificar_celda(celdas, np.float32)
+
+    indice = {"celda": celdas, "lat": lat, "lon": lon, "zonas": {}}
+    indice["teselas"] = construir_teselas(lat, lon)
+    for nombre, limites in zonas.items():
+        indice["zonas"][nombre] = posiciones_en_limites(indice, limites)
+    return indice
+
+
+# lado de cada tesela del índice espacial, en grados
+TAMANO_TESELA = 0.1
+
+def construir_teselas(lat, lon, tamano=TAMANO_TESELA):
+    """
+    Agrupa las celdas del grid en teselas uniformes de `tamano` grados.
+
+    Las posiciones de las celdas se ordenan por tesela (fila mayor) y `inicio`
+    guarda dónde empieza cada tesela, de modo que una fila de teselas contiguas
+    es un único rango de `orden`.
+    """
+    if len(lat) == 0:
+        return {"tamano": tamano, "lat0": 0.0, "lon0": 0.0, "filas": 0, "columnas": 0,
+                "inicio": np.zeros(1, dtype=np.int64), "orden": np.zeros(0, dtype=np.int32)}
+
+    # Se trabaja en float64 para que las consultas calculen las mismas teselas
+    lat, lon = lat.astype(np.float64), lon.astype(np.float64)
+    lat0, lon0 = float(lat.min()), float(lon.min())
+    filas = int((float(lat.max()) - lat0) // tamano) + 1
+    columnas = int((float(lon.max()) - lon0) // tamano) + 1
 
-def preparar_grid(df, fecha_dt):
-    columnas_modelo = [
-        "lat_grid", "lon_grid", "mes", "dia", "dia_semana",
-        "conteo_delitos_graves", "conteo_llamadas_riesgo"
+    fila = ((lat - lat0) // tamano).astype(np.int64)
+    columna = ((lon - lon0) // tamano).astype(np.int64)
+    tesela = fila * columnas + columna
+
+    # orden estable: dentro de cada tesela se conserva el orden (lat, lon) del índice
+    orden = np.argsort(tesela, kind="stable").astype(np.int32)
+    conteos = np.bincount(tesela, minlength=filas * columnas)
+    inicio = np.concatenate([[0], np.cumsum(conteos)]).astype(np.int64)
+
+    return {"tamano": tamano, "lat0": lat0, "lon0": lon0, "filas": filas,
+            "columnas": columnas, "inicio": inicio, "orden": orden}
+
+
+def posiciones_en_limites(indice, limites):
+    """
+    Posiciones (ordenadas) de las celdas del índice dentro de un rectángulo.
+
+    Solo se revisan las celdas de las teselas que tocan el rectángulo, por lo
+    que sirve tanto para las zonas como para la vista actual del mapa.
+
+    :param limites: dict con lat_min, lat_max, lon_min y lon_max
+    """
+    teselas = indice["teselas"]
+    tamano = teselas["tamano"]
+    # Las teselas se calculan sobre float32 del índice: margen de una celda para no perder bordes
+    margen = 1e-3
+
+    fila_ini = max(int((float(limites["lat_min"]) - margen - teselas["lat0"]) // tamano), 0)
+    fila_fin = min(int((float(limites["lat_max"]) + margen - teselas["lat0"]) // tamano), teselas["filas"] - 1)
+    col_ini = max(int((float(limites["lon_min"]) - margen - teselas["lon0"]) // tamano), 0)
+    col_fin = min(int((float(limites["lon_max"]) + margen - teselas["lon0"]) // tamano), teselas["columnas"] - 1)
+    if fila_ini > fila_fin or col_ini > col_fin:
+        return np.zeros(0, dtype=np.int64)
+
+    # Cada fila de teselas aporta un rango contiguo de candidatas
+    inicio, columnas = teselas["inicio"], teselas["columnas"]
+    rangos = [
+        teselas["orden"][inicio[f * columnas + col_ini]:inicio[f * columnas + col_fin + 1]]
+        for f in range(fila_ini, fila_fin + 1)
     ]
+    candidatas = np.concatenate(rangos).astype(np.int64)
+
+    # Las teselas del borde pueden quedar parcialmente fuera: filtro exacto sobre el id entero
+    dentro = en_limites(indice["celda"][candidatas], limites)
+    return np.sort(candidatas[dentro])
+
+
+def vincular_historial(indice, historial):
+    """
+    Asocia el historial de actividad al índice para calcular las features de rezago.
+
+    Las posiciones de las celdas del grid dentro del historial y sus vecinas
+    se calculan aquí una sola vez.
+    """
+    indice["historial"] = historial
+    indice["posiciones_historial"] = buscar_celdas(historial["celdas"], indice["celda"])
+    vecinos_historial(historial)
+    return indice
+
+#PREPARACIÓN DEL GRID Y PREDICCIÓN
+
+COLUMNAS_MODELO = [
+    "lat_grid", "lon_grid", "mes", "dia", "dia_semana",
+    "conteo_delitos_graves", "conteo_llamadas_riesgo"
+]
+
+def preparar_grid(indice, fecha_dt, zona=None):
+    return preparar_grid_lote(indice, [fecha_dt], zona)
 
-    #Obtiene las coordenadas únicas de la cuadrícula 
-    df_grid = df[["lat_grid", "lon_grid"]].drop_duplicates().copy()
 
-    df_grid["mes"] = fecha_dt.month
-    df_grid["dia"] = fecha_dt.day
-    df_grid["dia_semana"] = fecha_dt.weekday() # 'weekday' retorna 0=Lunes a 6=Domingo
+def preparar_grid_lote(indice, fechas, zona=None):
+    # Solo se construyen las filas de la zona pedida (o todo el país si no hay zona)
+    if zona is None:
+        lat, lon = indice["lat"], indice["lon"]
+    else:
+        posiciones = indice["zonas"][zona]
+        lat, lon = indice["lat"][posiciones], indice["lon"][posiciones]
 
-    # Se asume conteo cero para features de eventos pasados en la fecha futura de predicción
-    df_grid["conteo_delitos_graves"] = 0
-    df_grid["conteo_llamadas_riesgo"] = 0
+    # Una fila por (fecha, celda): las celdas se repiten en bloque para cada fecha
+    n = len(lat)
+    fechas = pd.DatetimeIndex(fechas)
+    df_grid = pd.DataFrame({
+        "lat_grid": np.tile(lat, len(fechas)),
+        "lon_grid": np.tile(lon, len(fechas)),
+        "mes": np.repeat(fechas.month.to_numpy(np.int8), n),
+        "dia": np.repeat(fechas.day.to_numpy(np.int8), n),
+        "dia_semana": np.repeat(fechas.weekday.to_numpy(np.int8), n), # 'weekday' retorna 0=Lunes a 6=Domingo
+        # Se asume conteo cero para features de eventos pasados en la fecha futura de predicción
+        "conteo_delitos_graves": np.zeros(n * len(fechas), dtype=np.int8),
+        "conteo_llamadas_riesgo": np.zeros(n * len(fechas), dtype=np.int8),
+    })
+    if "historial" not in indice:
+        return df_grid[COLUMNAS_MODELO]
 
-    return df_grid[columnas_modelo]
+    # Actividad reciente de cada celda (y de sus vecinas) en los días previos a cada fecha
+    posiciones_historial = indice["posiciones_historial"]
+    if zona is not None:
+        posiciones_historial = posiciones_historial[posiciones]
+    ordinales = fechas.to_numpy("datetime64[D]").astype(np.int64)
+    lags = features_lag(
+        indice["historial"], np.repeat(ordinales, n), np.tile(posiciones_historial, len(fechas))
+    )
+    for col, valores in lags.items():
+        df_grid[col] = valores
+    return df_grid[COLUMNAS_MODELO + columnas_lag()]
 
 
 def predecir_riesgo(modelo, df_grid):
@@ -42,10 +191,61 @@ def predecir_riesgo(modelo, df_grid):
     df_grid["prediccion_riesgo"] = modelo.predict(df_grid)
     return df_grid
 
+def predecir_nacional(modelo, indice, fecha_dt):
+    # Vector de predicción de todas las celdas, alineado con el índice del grid
+    return predecir_nacional_lote(modelo, indice, [fecha_dt])[0]
+
+
+def predecir_nacional_lote(modelo, indice, fechas):
+    # Una sola llamada al modelo para todas las fechas: matriz (fechas, celdas)
+    df_grid = preparar_grid_lote(indice, fechas)
+    predicciones = np.asarray(modelo.predict(df_grid), dtype=np.float32)
+    return predicciones.reshape(len(fechas), len(indice["lat"]))
+
+
+def prediccion_zona(indice, predicciones, zona):
+    # Extrae de un vector nacional las celdas de una zona, con el formato de predecir_riesgo
+    return prediccion_posiciones(indice, predicciones, indice["zonas"][zona])
+
+
+def prediccion_limites(indice, predicciones, limites):
+    # Igual que prediccion_zona, para un rectángulo arbitrario (p. ej. la vista del mapa)
+    return prediccion_posiciones(indice, predicciones, posiciones_en_limites(indice, limites))
+
+
+def prediccion_posiciones(indice, predicciones, posiciones):
+    return pd.DataFrame({
+        "celda": indice["celda"][posiciones],
+        "lat_grid": indice["lat"][posiciones],
+        "lon_grid": indice["lon"][posiciones],
+        "prediccion_riesgo": predicciones[posiciones]
+    })
+
+
+def normalizar_riesgo(predicciones):
+    """
+    Escala las predicciones de una zona al rango 0-1 para el heatmap.
+
+    :return: (riesgo normalizado, riesgo mínimo, riesgo máximo)
+    """
+    predicciones = np.asarray(predicciones, dtype=np.float64)
+    riesgo_min = np.nanmin(predicciones)
+    riesgo_max = np.nanmax(predicciones)
+
+    # Si los valores están muy juntos no hay contraste real: fondo azul
+    if (riesgo_max - riesgo_min) < 1e-7:
+        riesgo_norm = np.full(len(predicciones), 0.1)
+    else:
+        # Normalización Min-Max: Estira los valores para usar todo el espectro (0 a 1)
+        riesgo_norm = np.clip((predicciones - riesgo_min) / (riesgo_max - riesgo_min), 0, 1)
+
+    # Limpieza de valores nulos
+    return np.nan_to_num(riesgo_norm, nan=0.0), riesgo_min, riesgo_max
+
 #FILTRADO GEOGRÁFICO
 
 def filtrar_por_zona(df, limites):
-
+    # Para DataFrames sueltos; sobre el grid usar posiciones_en_limites (índice de teselas)
     return df[
         (df["lon_grid"] >= limites["lon_min"]) &
         (df["lon_grid"] <= limites["lon_max"]) &
@@ -55,49 +255,85 @@ def filtrar_por_zona(df, limites):
 
 # INFORMACIÓN ADICIAONAL
 
-def diagnosticar_prediccion(model, profile,lat, lon):
+def construir_indice_diagnostico(diagnostico):
+    """
+    Construye una sola vez el BallTree (haversine) sobre los puntos core del DBSCAN.
+
+    :param diagnostico: artefacto de diagnóstico (ver src/datos/diagnostico.py)
+    :return: dict con el árbol, la etiqueta de cada punto core y el radio eps
+    """
+    # Los artefactos guardan float64: el BallTree usa el mapeo en memoria sin copiarlo
+    # (los de la versión 1, en float32, sí se convierten a una copia privada)
+    puntos_core = np.asarray(diagnostico["puntos"], dtype=np.float64)
+    arbol = BallTree(puntos_core, metric="haversine") if len(puntos_core) else None
+    return {"arbol": arbol, "etiquetas": diagnostico["etiquetas"], "eps": diagnostico["eps"]}
+
+
+def diagnosticar_prediccion(indice, profile, lat, lon):
     """
     Determina si una coordenada de riesgo predicha coincide con uncluster hitorico.
     
-    :param model: modelo DBSCAN
+    :param indice: índice de diagnóstico (ver construir_indice_diagnostico)
     :param profile: perfil del cLuster
     :param lat: Latitud
     :param lon: Longitud
     :return: perfil(dict) del cluster cercano a la coordenada geografica
     """
-    punto_nuevo = np.radians([[lat, lon]])
-    
-    puntos_core = model.components_
-    etiquetas_core = model.labels_[model.core_sample_indices_]
-    
-    distancias = haversine_distances(punto_nuevo, puntos_core)
+    return diagnosticar_lote(indice, profile, [lat], [lon])[0]
+
+
+def diagnosticar_lote(indice, profile, lats, lons):
+    """
+    Versión por lotes de diagnosticar_prediccion: un perfil (o dict vacío) por punto.
+
+    Solo se consultan los puntos core dentro del radio eps de cada coordenada.
+    """
+    puntos = np.radians(np.column_stack([
+        np.asarray(lats, dtype=np.float64),
+        np.asarray(lons, dtype=np.float64)
+    ]))
+    if indice["arbol"] is None:
+        return [dict() for _ in range(len(puntos))]
+
+    vecinos, distancias = indice["arbol"].query_radius(
+        puntos, r=indice["eps"], return_distance=True, sort_results=True
+    )
+
+    perfiles = []
+    for vecinos_punto in vecinos:
+        perfil = dict()
+        if len(vecinos_punto):
+            # El primero es el punto core más cercano
+            cluster_id = indice["etiquetas"][vecinos_punto[0]]
+            if cluster_id != -1 and cluster_id in profile:
+                perfil = perfil_nativo(profile[cluster_id])
+        perfiles.append(perfil)
+    return perfiles
 
-    indice_min = np.argmin(distancias)
-    distancia_min = distancias[0, indice_min]
-    
-    if distancia_min <= model.eps:
-        cluster_id = etiquetas_core[indice_min]
 
-        if cluster_id != -1 and cluster_id in profile:
-            perfil = profile[cluster_id].copy()
-            # Convertir posibles valores numpy a tipos nativos de Python para JSON
-            for k, v in perfil.items():
-                if hasattr(v, 'item'): # Detecta tipos de numpy
-                    perfil[k] = v.item()
-            return perfil
-    return dict()
+def perfil_nativo(perfil):
+    perfil = perfil.copy()
+    # Convertir posibles valores numpy a tipos nativos de Python para JSON
+    for k, v in perfil.items():
+        if hasattr(v, 'item'): # Detecta tipos de numpy
+            perfil[k] = v.item()
+    return perfil
 
 
 # CODIGO DE PRUEBA
 if __name__ == "__main__":
     try:
-        modelo_geo = joblib.load('model/modelo_dbscan_detenciones.joblib')
-        info_clusters = joblib.load('model/perfiles_clusters_detenciones.joblib')
+        diagnostico = cargar_recursos_diagnostico(
+            'model/diagnostico_detenciones',
+            'model/modelo_dbscan_detenciones.joblib',
+            'model/perfiles_clusters_detenciones.joblib'
+        )
     except Exception as e:
         print(e)
     
 
-    perfil = diagnosticar_prediccion(modelo_geo,info_clusters,-2.10,-79.9)
+    indice_geo = construir_indice_diagnostico(diagnostico)
+    perfil = diagnosticar_prediccion(indice_geo,diagnostico["perfiles"],-2.10,-79.9)
 
     print("cantidad: ",len(perfil))
 
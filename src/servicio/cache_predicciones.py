@@ -0,0 +1,118 @@
+# cache de predicciones nacionales por fecha
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class CachePredicciones:
+    """
+    Cache LRU acotada de vectores de predicción nacionales.
+
+    La predicción de todo el país solo depende de la fecha (calendario y
+    actividad de los días previos en el historial): cada vector float32 se
+    calcula una vez y las zonas se obtienen indexándolo con las posiciones del
+    índice del grid.
+
+    :param calcular: función fecha_dt -> np.ndarray con la predicción nacional
+    :param capacidad: número máximo de fechas que se mantienen en memoria
+    :param calcular_lote: función opcional lista de fechas -> matriz (fechas, celdas)
+                          para resolver varios fallos con una sola inferencia
+    """
+
+    def __init__(self, calcular, capacidad=64, calcular_lote=None):
+        self._calcular = calcular
+        self._calcular_lote = calcular_lote
+        self.capacidad = max(int(capacidad), 1)
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def clave(fecha_dt):
+        return (fecha_dt.year, fecha_dt.month, fecha_dt.day)
+
+    def obtener(self, fecha_dt):
+        clave = self.clave(fecha_dt)
+        with self._lock:
+            vector = self._datos.get(clave)
+            if vector is not None:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return vector
+            self.fallos += 1
+
+        # La inferencia se ejecuta fuera del lock para no bloquear otras fechas
+        vector = self._calcular_vector(fecha_dt)
+        self._guardar(clave, vector)
+        return vector
+
+    def obtener_lote(self, fechas):
+        """Devuelve los vectores de varias fechas; los fallos se calculan juntos."""
+        fechas = list(fechas)
+        vectores = [None] * len(fechas)
+        pendientes = {}
+        with self._lock:
+            for i, fecha_dt in enumerate(fechas):
+                clave = self.clave(fecha_dt)
+                vector = self._datos.get(clave)
+                if vector is not None:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    vectores[i] = vector
+                else:
+                    self.fallos += 1
+                    pendientes.setdefault(clave, []).append(i)
+
+        if pendientes:
+            # Una sola fecha por clave (año, mes, dia)
+            fechas_pendientes = [fechas[posiciones[0]] for posiciones in pendientes.values()]
+            if self._calcular_lote is not None:
+                matriz = self._calcular_lote(fechas_pendientes)
+            else:
+                matriz = [self._calcular(fecha_dt) for fecha_dt in fechas_pendientes]
+
+            for (clave, posiciones), fila in zip(pendientes.items(), matriz):
+                vector = np.array(fila, dtype=np.float32)
+                vector.setflags(write=False)
+                self._guardar(clave, vector)
+                for i in posiciones:
+                    vectores[i] = vector
+        return vectores
+
+    def _calcular_vector(self, fecha_dt):
+        vector = np.asarray(self._calcular(fecha_dt), dtype=np.float32)
+        # Los vectores se comparten entre peticiones: se protegen contra escritura
+        vector.setflags(write=False)
+        return vector
+
+    def _guardar(self, clave, vector):
+        with self._lock:
+            self._datos[clave] = vector
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def calentar(self, fecha_inicio, dias):
+        """Precalcula las predicciones de los próximos `dias` días desde `fecha_inicio`."""
+        fechas = pd.date_range(pd.Timestamp(fecha_inicio).normalize(), periods=int(dias), freq="D")
+        for fecha_dt in fechas:
+            clave = self.clave(fecha_dt)
+            with self._lock:
+                if clave in self._datos:
+                    continue
+            self._guardar(clave, self._calcular_vector(fecha_dt))
+        return len(fechas)
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._datos),
+                'capacidad': self.capacidad,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else 0.0
+            }
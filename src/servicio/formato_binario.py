@@ -0,0 +1,78 @@
+# formato binario compacto para las capas del heatmap
+import gzip
+import struct
+
+import numpy as np
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+TIPO_BINARIO = "application/x-heatmap"
+
+# Cabecera: firma, número de puntos y estadísticas (riesgo_min, riesgo_max, riesgo_promedio)
+FIRMA = b"HMP1"
+CABECERA = struct.Struct("<4sI3f")
+
+
+def codificar_heatmap(lat, lon, riesgo_norm, estadisticas):
+    """
+    Empaqueta una capa del heatmap en binario little-endian.
+
+    Tras la cabecera (20 bytes) van n float32 de latitud, n float32 de longitud
+    y n uint8 de intensidad (riesgo 0-1 cuantizado a 0-255). Los bloques float32
+    quedan alineados a 4 bytes para leerlos con Float32Array sin copiar.
+    """
+    n = len(lat)
+    intensidad = np.rint(np.clip(np.asarray(riesgo_norm, dtype=np.float64), 0, 1) * 255).astype(np.uint8)
+    return b"".join([
+        CABECERA.pack(
+            FIRMA, n,
+            estadisticas['riesgo_min'], estadisticas['riesgo_max'], estadisticas['riesgo_promedio']
+        ),
+        np.ascontiguousarray(lat, dtype="<f4").tobytes(),
+        np.ascontiguousarray(lon, dtype="<f4").tobytes(),
+        intensidad.tobytes(),
+    ])
+
+
+def decodificar_heatmap(cuerpo):
+    # Inversa de codificar_heatmap (intensidad devuelta en 0-1)
+    firma, n, riesgo_min, riesgo_max, riesgo_promedio = CABECERA.unpack_from(cuerpo)
+    if firma != FIRMA:
+        raise ValueError("El cuerpo no es una capa de heatmap binaria")
+    inicio = CABECERA.size
+    lat = np.frombuffer(cuerpo, dtype="<f4", count=n, offset=inicio)
+    lon = np.frombuffer(cuerpo, dtype="<f4", count=n, offset=inicio + 4 * n)
+    intensidad = np.frombuffer(cuerpo, dtype=np.uint8, count=n, offset=inicio + 8 * n) / 255.0
+    estadisticas = {'riesgo_min': riesgo_min, 'riesgo_max': riesgo_max, 'riesgo_promedio': riesgo_promedio}
+    return lat, lon, intensidad, estadisticas
+
+
+def _calidad(parametros):
+    try:
+        return float(parametros.strip()[2:])
+    except ValueError:
+        return 1.0
+
+
+def comprimir(cuerpo, accept_encoding):
+    """
+    Comprime según el Accept-Encoding del cliente (brotli si está disponible, si no gzip).
+
+    :return: (cuerpo, content-encoding o None si se envía sin comprimir)
+    """
+    aceptadas = set()
+    for opcion in (accept_encoding or "").lower().split(","):
+        nombre, _, parametros = opcion.partition(";")
+        # "gzip;q=0" significa que el cliente la rechaza
+        if parametros.strip().startswith("q=") and _calidad(parametros) == 0:
+            continue
+        aceptadas.add(nombre.strip())
+
+    if brotli is not None and "br" in aceptadas:
+        return brotli.compress(cuerpo), "br"
+    if "gzip" in aceptadas:
+        return gzip.compress(cuerpo, compresslevel=6), "gzip"
+    return cuerpo, None
@@ -0,0 +1,152 @@
+# métricas de la API (contadores, tiempos por etapa, memoria) en formato de texto de Prometheus
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no hay getrusage
+    resource = None
+
+# Límites (segundos) del histograma de duración de las peticiones
+LIMITES_DURACION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def memoria_residente():
+    """RSS actual del proceso en bytes (o el máximo alcanzado si no hay /proc)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # Sin /proc solo está el pico; ru_maxrss está en KB en Linux y en bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _etiquetas(**valores):
+    pares = ",".join(f'{k}="{str(v)}"' for k, v in valores.items())
+    return "{" + pares + "}" if pares else ""
+
+
+class Metricas:
+    """
+    Acumula las métricas del proceso; cada worker de gunicorn tiene las suyas.
+
+    Las etapas se miden con `etapa(nombre)`. Si se pasa `registro` (un dict,
+    p. ej. el de la petición actual) también se anota ahí su duración.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.peticiones = defaultdict(int)        # (ruta, estado) -> n
+        self.duracion_suma = defaultdict(float)   # ruta -> segundos
+        self.duracion_cubetas = defaultdict(lambda: [0] * len(LIMITES_DURACION))
+        self.duracion_conteo = defaultdict(int)   # ruta -> n
+        self.etapas_suma = defaultdict(float)     # etapa -> segundos
+        self.etapas_conteo = defaultdict(int)     # etapa -> n
+        self.inicio = time.time()
+
+    @contextmanager
+    def etapa(self, nombre, registro=None):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._lock:
+                self.etapas_suma[nombre] += duracion
+                self.etapas_conteo[nombre] += 1
+            if registro is not None:
+                registro[nombre] = registro.get(nombre, 0.0) + duracion
+
+    def registrar_peticion(self, ruta, estado, duracion):
+        with self._lock:
+            self.peticiones[(ruta, int(estado))] += 1
+            self.duracion_suma[ruta] += duracion
+            self.duracion_conteo[ruta] += 1
+            cubetas = self.duracion_cubetas[ruta]
+            for i, limite in enumerate(LIMITES_DURACION):
+                if duracion <= limite:
+                    cubetas[i] += 1
+
+    def exportar(self, cache=None):
+        """
+        Texto de exposición de Prometheus.
+
+        :param cache: salida de CachePredicciones.estadisticas() (opcional)
+        """
+        with self._lock:
+            peticiones = dict(self.peticiones)
+            duracion_suma = dict(self.duracion_suma)
+            duracion_conteo = dict(self.duracion_conteo)
+            duracion_cubetas = {r: list(c) for r, c in self.duracion_cubetas.items()}
+            etapas_suma = dict(self.etapas_suma)
+            etapas_conteo = dict(self.etapas_conteo)
+
+        lineas = [
+            "# HELP api_peticiones_total Peticiones atendidas por ruta y código de estado",
+            "# TYPE api_peticiones_total counter",
+        ]
+        for (ruta, estado), n in sorted(peticiones.items()):
+            lineas.append(f"api_peticiones_total{_etiquetas(ruta=ruta, estado=estado)} {n}")
+
+        errores = defaultdict(int)
+        for (ruta, estado), n in peticiones.items():
+            if estado >= 500:
+                errores[ruta] += n
+        lineas += [
+            "# HELP api_errores_total Peticiones que terminaron en error (5xx)",
+            "# TYPE api_errores_total counter",
+        ]
+        for ruta, n in sorted(errores.items()):
+            lineas.append(f"api_errores_total{_etiquetas(ruta=ruta)} {n}")
+
+        lineas += [
+            "# HELP api_duracion_peticion_segundos Duración de las peticiones",
+            "# TYPE api_duracion_peticion_segundos histogram",
+        ]
+        for ruta in sorted(duracion_conteo):
+            for limite, n in zip(LIMITES_DURACION, duracion_cubetas[ruta]):
+                lineas.append(f"api_duracion_peticion_segundos_bucket{_etiquetas(ruta=ruta, le=limite)} {n}")
+            lineas.append(
+                f"api_duracion_peticion_segundos_bucket{_etiquetas(ruta=ruta, le='+Inf')} {duracion_conteo[ruta]}"
+            )
+            lineas.append(f"api_duracion_peticion_segundos_sum{_etiquetas(ruta=ruta)} {duracion_suma[ruta]:.6f}")
+            lineas.append(f"api_duracion_peticion_segundos_count{_etiquetas(ruta=ruta)} {duracion_conteo[ruta]}")
+
+        lineas += [
+            "# HELP api_etapa_segundos Tiempo acumulado por etapa interna",
+            "# TYPE api_etapa_segundos summary",
+        ]
+        for etapa in sorted(etapas_conteo):
+            lineas.append(f"api_etapa_segundos_sum{_etiquetas(etapa=etapa)} {etapas_suma[etapa]:.6f}")
+            lineas.append(f"api_etapa_segundos_count{_etiquetas(etapa=etapa)} {etapas_conteo[etapa]}")
+
+        if cache is not None:
+            lineas += [
+                "# TYPE api_cache_predicciones_entradas gauge",
+                f"api_cache_predicciones_entradas {cache['entradas']}",
+                "# TYPE api_cache_predicciones_aciertos_total counter",
+                f"api_cache_predicciones_aciertos_total {cache['aciertos']}",
+                "# TYPE api_cache_predicciones_fallos_total counter",
+                f"api_cache_predicciones_fallos_total {cache['fallos']}",
+            ]
+
+        rss = memoria_residente()
+        if rss is not None:
+            lineas += [
+                "# HELP process_resident_memory_bytes Memoria residente del proceso",
+                "# TYPE process_resident_memory_bytes gauge",
+                f"process_resident_memory_bytes {rss}",
+            ]
+        lineas += [
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds {self.inicio:.3f}",
+        ]
+        return "\n".join(lineas) + "\n"
@@ -0,0 +1,174 @@
+# precálculo en segundo plano de las predicciones nacionales de los próximos días
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+logger = logging.getLogger("api.precalculo")
+
+
+class AlmacenPronosticos:
+    """
+    Vectores de predicción nacionales guardados en disco, un .npy por fecha.
+
+    Los archivos se escriben en un temporal y se publican con os.replace, así
+    que los workers que leen nunca ven uno a medias.
+
+    :param ruta_base: directorio del almacén
+    :param version: identifica el modelo (y el historial); cada versión usa su subdirectorio
+    """
+
+    def __init__(self, ruta_base, version):
+        self.ruta_dir = os.path.join(ruta_base, version)
+        os.makedirs(self.ruta_dir, exist_ok=True)
+
+    def ruta(self, fecha_dt):
+        return os.path.join(self.ruta_dir, f"{fecha_dt.strftime('%Y-%m-%d')}.npy")
+
+    def existe(self, fecha_dt):
+        return os.path.exists(self.ruta(fecha_dt))
+
+    def leer(self, fecha_dt):
+        # None si la fecha no está precalculada
+        try:
+            return np.load(self.ruta(fecha_dt), mmap_mode="r", allow_pickle=False)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def guardar(self, fecha_dt, vector):
+        ruta = self.ruta(fecha_dt)
+        ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+        with open(ruta_tmp, "wb") as f:
+            np.save(f, np.asarray(vector, dtype=np.float32), allow_pickle=False)
+        os.replace(ruta_tmp, ruta)
+
+    def fechas(self):
+        return sorted(
+            pd.Timestamp(os.path.splitext(nombre)[0])
+            for nombre in os.listdir(self.ruta_dir) if nombre.endswith(".npy")
+        )
+
+    def limpiar(self, antes_de):
+        # Elimina las fechas anteriores a `antes_de`
+        for fecha_dt in self.fechas():
+            if fecha_dt < antes_de:
+                try:
+                    os.remove(self.ruta(fecha_dt))
+                except FileNotFoundError:
+                    pass
+
+
+class PlanificadorPronosticos:
+    """
+    Hilo que mantiene precalculados en el almacén los próximos `dias` días.
+
+    Se ejecuta al iniciar, cada `intervalo` segundos y cada vez que se llama a
+    `reprogramar` (p. ej. tras recargar el modelo). Con varios workers solo
+    calcula el que obtiene el bloqueo del archivo `.planificador`; el resto lee
+    del almacén.
+
+    :param calcular_lote: función lista de fechas -> matriz (fechas, celdas)
+    :param almacen: AlmacenPronosticos donde se guardan los vectores
+    :param dias: días (desde hoy) que se mantienen precalculados
+    :param intervalo: segundos entre revisiones
+    """
+
+    def __init__(self, calcular_lote, almacen, dias=7, intervalo=3600):
+        self.calcular_lote = calcular_lote
+        self.almacen = almacen
+        self.dias = max(int(dias), 0)
+        self.intervalo = max(float(intervalo), 1.0)
+        self.ultima_ejecucion = None
+        self.ultimo_error = None
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._bloqueo = None
+
+    def ventana(self):
+        hoy = pd.Timestamp.today().normalize()
+        return pd.date_range(hoy, periods=self.dias, freq="D")
+
+    def obtener(self, fecha_dt):
+        # Vector precalculado de la fecha o None (la petición infiere en el momento)
+        return self.almacen.leer(fecha_dt)
+
+    def precalcular(self):
+        """Calcula en un solo lote las fechas de la ventana que faltan en el almacén."""
+        ventana = self.ventana()
+        pendientes = [fecha_dt for fecha_dt in ventana if not self.almacen.existe(fecha_dt)]
+        if pendientes:
+            inicio = time.perf_counter()
+            matriz = self.calcular_lote(pendientes)
+            for fecha_dt, vector in zip(pendientes, matriz):
+                self.almacen.guardar(fecha_dt, vector)
+            logger.info(
+                "Pronósticos precalculados: %d fechas en %.1f s", len(pendientes), time.perf_counter() - inicio
+            )
+        if len(ventana):
+            self.almacen.limpiar(antes_de=ventana[0])
+        self.ultima_ejecucion = time.time()
+        return len(pendientes)
+
+    def _tomar_bloqueo(self):
+        if fcntl is None:
+            return True
+        archivo = open(os.path.join(self.almacen.ruta_dir, ".planificador"), "w")
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        # Se conserva abierto: el bloqueo dura hasta detener() o el fin del proceso
+        self._bloqueo = archivo
+        return True
+
+    def _ciclo(self):
+        while not self._detener.is_set():
+            try:
+                self.precalcular()
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = str(e)
+                logger.exception("Error precalculando pronósticos")
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+
+    def iniciar(self):
+        """Arranca el hilo si este proceso obtiene el bloqueo; devuelve si quedó activo."""
+        if self.dias == 0 or self._hilo is not None:
+            return self._hilo is not None
+        if not self._tomar_bloqueo():
+            return False
+        self._hilo = threading.Thread(target=self._ciclo, name="planificador-pronosticos", daemon=True)
+        self._hilo.start()
+        return True
+
+    def reprogramar(self):
+        self._despertar.set()
+
+    def detener(self):
+        # Libera también el bloqueo: otro planificador (p. ej. de un modelo recargado) puede tomarlo
+        self._detener.set()
+        self._despertar.set()
+        if self._bloqueo is not None:
+            self._bloqueo.close()
+            self._bloqueo = None
+
+    def estado(self):
+        listas = sum(self.almacen.existe(fecha_dt) for fecha_dt in self.ventana())
+        return {
+            "dias": self.dias,
+            "precalculadas": int(listas),
+            "activo": self._hilo is not None,
+            "ultima_ejecucion": self.ultima_ejecucion,
+            "ultimo_error": self.ultimo_error,
+        }
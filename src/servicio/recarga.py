@@ -0,0 +1,123 @@
+# recarga en caliente de los recursos de la API (modelo, grid y diagnóstico)
+import logging
+import threading
+import time
+
+logger = logging.getLogger("api.recarga")
+
+
+class Recargador:
+    """
+    Carga un paquete de recursos nuevo en segundo plano y lo activa de una vez.
+
+    `cargar(version)` construye el paquete completo (y calienta sus caches)
+    sin tocar el activo; solo al terminar se llama a `activar(paquete)`, que
+    reemplaza la referencia. Las peticiones en curso terminan con el paquete
+    que tomaron al empezar. Hay como máximo una recarga a la vez.
+
+    :param cargar: función version -> paquete
+    :param activar: función paquete -> None que lo publica
+    :param version_deseada: función sin argumentos -> versión que debería estar activa (o None)
+    :param version_actual: función sin argumentos -> versión del paquete activo
+    :param intervalo: segundos entre revisiones de `version_deseada`
+    """
+
+    def __init__(self, cargar, activar, version_deseada, version_actual, intervalo=30):
+        self.cargar = cargar
+        self.activar = activar
+        self.version_deseada = version_deseada
+        self.version_actual = version_actual
+        self.intervalo = max(float(intervalo), 1.0)
+        self.en_curso = None
+        self.ultima_recarga = None
+        self.ultimo_error = None
+        self._lock = threading.Lock()
+        self._vigilante = None
+
+    def _reservar(self, version):
+        # Toma el turno de recarga; False si ya hay una en curso
+        with self._lock:
+            if self.en_curso is not None:
+                return False
+            self.en_curso = version
+            return True
+
+    def _liberar(self):
+        with self._lock:
+            self.en_curso = None
+
+    def recargar(self, version):
+        """Carga y activa `version` en este hilo; devuelve False si ya hay una recarga en curso."""
+        if not self._reservar(version):
+            return False
+        return self._ejecutar(version)
+
+    def _ejecutar(self, version):
+        # Requiere el turno ya reservado; lo libera al terminar
+        try:
+            inicio = time.perf_counter()
+            paquete = self.cargar(version)
+            self.activar(paquete)
+            self.ultima_recarga = time.time()
+            self.ultimo_error = None
+            logger.info("Versión %s activa (cargada en %.1f s)", version, time.perf_counter() - inicio)
+            return True
+        except Exception as e:
+            # Si falla la carga se sigue sirviendo con el paquete anterior
+            self.ultimo_error = f"{version}: {e}"
+            logger.exception("Error recargando la versión %s", version)
+            raise
+        finally:
+            self._liberar()
+
+    def solicitar(self, version, al_aceptar=None):
+        """
+        Lanza la recarga en un hilo aparte; devuelve False si ya hay una en curso.
+
+        :param al_aceptar: función sin argumentos que se ejecuta solo si la recarga
+                           se acepta, antes de lanzarla (p. ej. marcar la versión
+                           como activa en el registro); si falla, no se recarga
+        """
+        if not self._reservar(version):
+            return False
+        if al_aceptar is not None:
+            try:
+                al_aceptar()
+            except Exception:
+                self._liberar()
+                raise
+
+        def ejecutar():
+            try:
+                self._ejecutar(version)
+            except Exception:
+                pass  # ya quedó registrado en ultimo_error
+
+        threading.Thread(target=ejecutar, name="recarga-recursos", daemon=True).start()
+        return True
+
+    def _vigilar(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                deseada = self.version_deseada()
+                if deseada and deseada != self.version_actual() and self.en_curso is None:
+                    if self.ultimo_error and self.ultimo_error.startswith(f"{deseada}:"):
+                        continue  # no se reintenta una versión que ya falló
+                    logger.info("Nueva versión activa en el registro: %s", deseada)
+                    self.recargar(deseada)
+            except Exception:
+                pass
+
+    def vigilar(self):
+        # Revisa el registro periódicamente; en modo serve cada worker vigila por su cuenta
+        if self._vigilante is None:
+            self._vigilante = threading.Thread(target=self._vigilar, name="vigilante-registro", daemon=True)
+            self._vigilante.start()
+
+    def estado(self):
+        return {
+            "en_curso": self.en_curso,
+            "ultima_recarga": self.ultima_recarga,
+            "ultimo_error": self.ultimo_error,
+        }
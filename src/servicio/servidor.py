@@ -0,0 +1,41 @@
+# servidor WSGI de producción con los recursos precargados antes de crear los workers
+import gc
+
+
+def servir(app, host="0.0.0.0", puerto=5000, workers=2, hilos=4, al_iniciar_worker=None):
+    """
+    Sirve `app` con gunicorn (workers gthread) sin modo debug.
+
+    La aplicación ya viene creada (modelo, índice del grid y diagnóstico en
+    memoria): gunicorn hace fork del proceso principal y cada worker comparte
+    esas páginas por copy-on-write en lugar de cargar su propia copia.
+
+    :param workers: número de procesos
+    :param hilos: hilos por proceso
+    :param al_iniciar_worker: función sin argumentos que se ejecuta en cada worker
+                              tras el fork (p. ej. para arrancar hilos de fondo)
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError as e:
+        raise SystemExit("El modo serve requiere gunicorn: pip install gunicorn") from e
+
+    class Aplicacion(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{puerto}")
+            self.cfg.set("workers", max(int(workers), 1))
+            self.cfg.set("threads", max(int(hilos), 1))
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("preload_app", True)
+            if al_iniciar_worker is not None:
+                self.cfg.set("post_fork", lambda servidor, worker: al_iniciar_worker())
+
+        def load(self):
+            return app
+
+    # Los objetos ya cargados pasan a la generación permanente del GC: sus
+    # recorridos no tocan las páginas compartidas y no fuerzan copias en los workers
+    gc.collect()
+    gc.freeze()
+
+    Aplicacion().run()
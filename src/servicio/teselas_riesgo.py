@@ -0,0 +1,204 @@
+# pirámide de teselas de riesgo (Web Mercator) precalculada por fecha y guardada en disco
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.datos.grid import decodificar_celda
+from src.model.predictor import normalizar_riesgo
+
+# Niveles de zoom precalculados; por encima de ZOOM_MAX se recorta la tesela padre
+ZOOM_MIN = 5
+ZOOM_MAX = 13
+# Zoom máximo que se acepta en las peticiones (las teselas se recortan de ZOOM_MAX)
+ZOOM_LIMITE = 20
+# Cada tesela se divide en BINS x BINS casillas; cada casilla es un punto del heatmap
+BINS = 64
+
+
+def coordenadas_mercator(lat, lon, zoom):
+    """Posición fraccionaria (x, y) de cada coordenada en las teselas del nivel `zoom`."""
+    n = 2.0 ** zoom
+    lat_rad = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2.0 * n
+    return x, y
+
+
+def limites_tesela(zoom, x, y):
+    # Rectángulo (lat/lon) que cubre la tesela (x, y) del nivel zoom
+    n = 2.0 ** zoom
+    lon_min, lon_max = x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+    lat_max = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    lat_min = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / n))))
+    return {"lat_min": lat_min, "lat_max": lat_max, "lon_min": lon_min, "lon_max": lon_max}
+
+
+def tesela_valida(zoom, x, y):
+    # (x, y) dentro de las 2**zoom x 2**zoom teselas del nivel
+    return 0 <= zoom <= ZOOM_LIMITE and 0 <= x < (1 << zoom) and 0 <= y < (1 << zoom)
+
+
+def puntos_json(puntos):
+    # Los puntos se guardan en float32; lat/lon se redondean a 3 decimales para que el JSON no arrastre ruido
+    puntos = np.asarray(puntos, dtype=np.float64)
+    puntos[:, :2] = np.round(puntos[:, :2], 3)
+    return puntos.tolist()
+
+
+def construir_nivel(lat, lon, intensidad, zoom):
+    """
+    Agrega las celdas del grid en las casillas de las teselas de un nivel.
+
+    Cada casilla se representa por el centro de sus celdas y el riesgo máximo
+    (para no diluir los puntos calientes al alejar el mapa).
+
+    :return: (claves int64 ordenadas, puntos float32 (k, 3) con lat, lon, intensidad)
+    """
+    n = 1 << zoom
+    fx, fy = coordenadas_mercator(lat, lon, zoom)
+    tx = np.clip(fx.astype(np.int64), 0, n - 1)
+    ty = np.clip(fy.astype(np.int64), 0, n - 1)
+    bx = np.clip(((fx - tx) * BINS).astype(np.int64), 0, BINS - 1)
+    by = np.clip(((fy - ty) * BINS).astype(np.int64), 0, BINS - 1)
+
+    # La tesela es la parte alta de la clave: las casillas de una tesela quedan contiguas
+    clave = (tx * n + ty) * (BINS * BINS) + by * BINS + bx
+    claves, grupo = np.unique(clave, return_inverse=True)
+
+    conteo = np.bincount(grupo, minlength=len(claves))
+    lat_media = np.bincount(grupo, weights=lat, minlength=len(claves)) / conteo
+    lon_media = np.bincount(grupo, weights=lon, minlength=len(claves)) / conteo
+    maximo = np.zeros(len(claves))
+    np.maximum.at(maximo, grupo, intensidad)
+
+    puntos = np.column_stack([lat_media, lon_media, maximo]).astype(np.float32)
+    return claves, puntos
+
+
+class PiramideTeselas:
+    """
+    Teselas de riesgo por fecha, calculadas una vez y guardadas en disco.
+
+    La intensidad se normaliza a nivel nacional para que las teselas vecinas
+    sean comparables. Solo las fechas de `ventana` (p. ej. la del planificador
+    de pronósticos) se guardan en `ruta_base/version/clave`, y al guardar una
+    se borran las que ya salieron de la ventana; el resto de fechas se
+    calculan en memoria. Las últimas usadas se mantienen abiertas en memoria.
+
+    :param ruta_base: directorio donde se guardan las pirámides
+    :param indice: índice del grid (ver construir_indice_grid)
+    :param obtener_vector: función fecha_dt -> predicción nacional
+    :param version: identifica el modelo (y el historial); al cambiar se usa otro subdirectorio
+    :param capacidad: pirámides que se mantienen abiertas en memoria
+    :param ventana: función sin argumentos -> fechas que se guardan en disco (None: ninguna)
+    """
+
+    def __init__(self, ruta_base, indice, obtener_vector, version="0", capacidad=16, ventana=None):
+        self.ruta_base = ruta_base
+        self.indice = indice
+        self._obtener_vector = obtener_vector
+        self.version = version
+        self.capacidad = max(int(capacidad), 1)
+        self.ventana = ventana
+        self._abiertas = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def clave(fecha_dt):
+        return fecha_dt.strftime("%Y-%m-%d")
+
+    def ruta(self, fecha_dt):
+        return os.path.join(self.ruta_base, self.version, self.clave(fecha_dt))
+
+    def _calcular(self, fecha_dt):
+        intensidad, _, _ = normalizar_riesgo(self._obtener_vector(fecha_dt))
+        lat, lon = decodificar_celda(self.indice["celda"])
+        return {zoom: construir_nivel(lat, lon, intensidad, zoom) for zoom in range(ZOOM_MIN, ZOOM_MAX + 1)}
+
+    def _guardar(self, niveles, ruta_dir):
+        # Directorio temporal propio: varios workers pueden construir la misma fecha
+        ruta_tmp = f"{ruta_dir}.tmp{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(ruta_tmp, ignore_errors=True)
+        os.makedirs(ruta_tmp)
+        for zoom, (claves, puntos) in niveles.items():
+            np.save(os.path.join(ruta_tmp, f"z{zoom}_claves.npy"), claves, allow_pickle=False)
+            np.save(os.path.join(ruta_tmp, f"z{zoom}_puntos.npy"), puntos, allow_pickle=False)
+
+        # Se publica de una vez; si otro proceso ya la publicó se descarta esta copia
+        try:
+            os.replace(ruta_tmp, ruta_dir)
+        except OSError:
+            shutil.rmtree(ruta_tmp, ignore_errors=True)
+
+    def limpiar(self, conservar):
+        # Borra las pirámides guardadas de esta versión cuyas fechas no están en `conservar`
+        ruta_version = os.path.join(self.ruta_base, self.version)
+        if not os.path.isdir(ruta_version):
+            return
+        for nombre in os.listdir(ruta_version):
+            if nombre not in conservar and ".tmp" not in nombre:
+                shutil.rmtree(os.path.join(ruta_version, nombre), ignore_errors=True)
+
+    def _abrir(self, fecha_dt):
+        clave = self.clave(fecha_dt)
+        with self._lock:
+            niveles = self._abiertas.get(clave)
+            if niveles is not None:
+                self._abiertas.move_to_end(clave)
+                return niveles
+
+        en_ventana = {self.clave(f) for f in self.ventana()} if self.ventana is not None else set()
+        ruta_dir = self.ruta(fecha_dt)
+        if clave not in en_ventana:
+            # Fechas fuera de la ventana: solo en memoria, para no llenar el disco
+            niveles = self._calcular(fecha_dt)
+        else:
+            if not os.path.isdir(ruta_dir):
+                os.makedirs(os.path.dirname(ruta_dir), exist_ok=True)
+                self._guardar(self._calcular(fecha_dt), ruta_dir)
+                self.limpiar(en_ventana)
+            niveles = {
+                zoom: (
+                    np.load(os.path.join(ruta_dir, f"z{zoom}_claves.npy"), mmap_mode="r"),
+                    np.load(os.path.join(ruta_dir, f"z{zoom}_puntos.npy"), mmap_mode="r"),
+                )
+                for zoom in range(ZOOM_MIN, ZOOM_MAX + 1)
+            }
+        with self._lock:
+            self._abiertas[clave] = niveles
+            while len(self._abiertas) > self.capacidad:
+                self._abiertas.popitem(last=False)
+        return niveles
+
+    def tesela(self, fecha_dt, zoom, x, y):
+        """
+        Puntos [lat, lon, intensidad] de la tesela (zoom, x, y) para una fecha.
+
+        Por debajo de ZOOM_MIN no se devuelven datos; por encima de ZOOM_MAX se
+        recortan los puntos de la tesela padre de ZOOM_MAX.
+        """
+        if not tesela_valida(zoom, x, y):
+            raise ValueError(f"Tesela fuera de rango: {zoom}/{x}/{y}")
+        if zoom < ZOOM_MIN:
+            return np.zeros((0, 3), dtype=np.float32)
+
+        nivel = min(zoom, ZOOM_MAX)
+        desplazamiento = zoom - nivel
+        x_nivel, y_nivel = x >> desplazamiento, y >> desplazamiento
+
+        claves, puntos = self._abrir(fecha_dt)[nivel]
+        base = ((x_nivel << nivel) + y_nivel) * (BINS * BINS)
+        inicio, fin = np.searchsorted(claves, [base, base + BINS * BINS])
+        seleccion = np.asarray(puntos[inicio:fin])
+
+        if desplazamiento:
+            limites = limites_tesela(zoom, x, y)
+            dentro = (
+                (seleccion[:, 0] >= limites["lat_min"]) & (seleccion[:, 0] < limites["lat_max"]) &
+                (seleccion[:, 1] >= limites["lon_min"]) & (seleccion[:, 1] < limites["lon_max"])
+            )
+            seleccion = seleccion[dentro]
+        return seleccion